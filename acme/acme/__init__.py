@@ -1,7 +1,28 @@
 from .ca import LetsEncrypt
+from .engine import (
+    LETS_ENCRYPT_PRODUCTION,
+    LETS_ENCRYPT_STAGING,
+    ACMEClient,
+    AccountKey,
+    write_certificate_chain
+)
+from .exceptions import OtterExceptionError, ACMEError, DNSPropagationError, JobTimeoutError
 from .request import Request
-from .decorator import http_exception, generic_exception
+from .async_request import AsyncRequest, AsyncResponse
+from .decorator import http_exception, async_http_exception, generic_exception, phase, set_phase_labels
 from .logger import get_logger
+from .aws import get_client, get_resource, get_session
+from .network import check_reachability, probe_hosts
+from .poller import JobStatus, parse_progress, poll_job
+from .ratelimit import RateLimitedClient, TokenBucket, call_with_backoff, get_rate_limiter, rate_limited
+from .ssm import InstanceIndex, get_instance_index
+from .propagation import wait_for_change, wait_for_txt_propagation
+from .route53 import ChallengeRecord, validate_acme_challenge_records
+from .context import DeviceContext
+from .verify import EndpointCertificate, certificate_fingerprint, verify_certificates, verify_endpoints, wait_for_certificate
+from .keys import build_csr, certificate_chain_path, certificate_directory, generate_key_and_csr, generate_private_key, serialize_private_key
+from .drift import DriftRecord, ScanReport, reconcile, scan_inventory
+from .backup import CHUNK_SIZE, BackupResult, BackupSink, LocalSink, S3Sink, backup_stream, get_sink
 from .client import(
     get_secret,
     query_subject_alternative_names,
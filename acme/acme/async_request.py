@@ -0,0 +1,163 @@
+"""
+Copyright 2021-present Airbnb, Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import asyncio
+import json
+import os
+import sys
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Optional, Tuple, Union
+
+import aiohttp
+
+from .decorator import async_http_exception
+from .logger import get_logger
+from .request import DEFAULT_TIMEOUT
+
+LOGGER = get_logger(__name__)
+
+# Raised Before the Request is Sent, so Retrying Cannot Replay It
+CONNECT_ERRORS = (aiohttp.ClientConnectorError, getattr(aiohttp, 'ConnectionTimeoutError', aiohttp.ClientConnectorError))
+
+
+class AsyncResponse:
+    """Buffered response exposing the requests.Response attributes platforms use."""
+
+    def __init__(self, url: str, status_code: int, headers: Dict, content: bytes) -> None:
+        self.url = url
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+
+    @property
+    def text(self) -> str:
+        return self.content.decode('utf-8', errors='replace')
+
+    def json(self):
+        return json.loads(self.content)
+
+
+class AsyncRequest:
+    """
+    asyncio counterpart of acme.Request sharing its validation semantics,
+    timeouts, retry policy and http_exception error handling. One instance
+    may be shared by many concurrent coroutines and devices.
+    """
+
+    def __init__(self, validation: str, timeout: Union[float, Tuple[float, float]] = DEFAULT_TIMEOUT, retries: int = 3, backoff_factor: float = 0.5, limit: int = 100, limit_per_host: int = 10) -> None:
+        self.validation = validation
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    async def __aenter__(self) -> 'AsyncRequest':
+        return self
+
+    async def __aexit__(self, *args) -> None:
+        await self.close()
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    @staticmethod
+    def _client_timeout(timeout) -> aiohttp.ClientTimeout:
+        if isinstance(timeout, tuple):
+            connect, read = timeout
+            return aiohttp.ClientTimeout(sock_connect=connect, sock_read=read)
+        return aiohttp.ClientTimeout(sock_connect=timeout, sock_read=timeout)
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        # ClientSession Must be Created Within the Running Event Loop
+        if self._session is None:
+            connector = aiohttp.TCPConnector(
+                limit=self.limit, limit_per_host=self.limit_per_host,
+                ssl=None if self.validation != 'False' else False)
+            self._session = aiohttp.ClientSession(
+                connector=connector, timeout=self._client_timeout(self.timeout))
+        return self._session
+
+    @staticmethod
+    def _form(files: Dict, data) -> aiohttp.FormData:
+        form = aiohttp.FormData()
+        for key, value in (data or {}).items():
+            form.add_field(key, value)
+        for key, file in files.items():
+            form.add_field(key, file, filename=os.path.basename(
+                getattr(file, 'name', key)))
+        return form
+
+    async def _request(self, method: str, url: str, timeout=None, **kwargs) -> aiohttp.ClientResponse:
+        # Same Policy as acme.Request: Only Failures to Connect are Retried
+        attempts = self.retries + 1
+        for attempt in range(attempts):
+            if attempt:
+                await asyncio.sleep(self.backoff_factor * (2 ** (attempt - 1)))
+            try:
+                return await self._get_session().request(
+                    method, url, timeout=self._client_timeout(timeout or self.timeout), **kwargs)
+            except CONNECT_ERRORS:
+                if attempt + 1 == attempts:
+                    raise
+                LOGGER.warning('%s %s Connection Error, Retrying', method, url)
+
+    async def _buffered(self, method: str, url: str, **kwargs) -> AsyncResponse:
+        response = await self._request(method, url, **kwargs)
+        async with response:
+            content = await response.read()
+        return AsyncResponse(str(response.url), response.status,
+                             dict(response.headers), content)
+
+    @async_http_exception
+    async def get(self, url: str, headers: Optional[Dict] = None, query_params: Optional[Dict] = None, timeout=None) -> AsyncResponse:
+        return await self._buffered('GET', url, headers=headers, params=query_params, timeout=timeout)
+
+    @async_http_exception
+    async def post(self, url: str, files: Optional[Dict] = None, headers: Optional[Dict] = None, data=None, timeout=None) -> AsyncResponse:
+        if files:
+            data = self._form(files, data)
+        return await self._buffered('POST', url, headers=headers, data=data, timeout=timeout)
+
+    @async_http_exception
+    async def put(self, url: str, headers: Optional[Dict] = None, data=None, timeout=None) -> AsyncResponse:
+        return await self._buffered('PUT', url, headers=headers, data=data, timeout=timeout)
+
+    @async_http_exception
+    async def patch(self, url: str, headers: Optional[Dict] = None, data=None, timeout=None) -> AsyncResponse:
+        return await self._buffered('PATCH', url, headers=headers, data=data, timeout=timeout)
+
+    @async_http_exception
+    async def delete(self, url: str, headers: Optional[Dict] = None, timeout=None) -> AsyncResponse:
+        return await self._buffered('DELETE', url, headers=headers, timeout=timeout)
+
+    @asynccontextmanager
+    async def stream(self, url: str, headers: Optional[Dict] = None, query_params: Optional[Dict] = None, timeout=None) -> AsyncIterator[aiohttp.ClientResponse]:
+        """
+        GET url without buffering the body. The yielded response is read
+        incrementally, i.e. `async for chunk in response.content.iter_chunked(n)`.
+        """
+        response = await self._request('GET', url, headers=headers,
+                                       params=query_params, timeout=timeout)
+        async with response:
+            if response.status >= 400:
+                LOGGER.error('HTTP %s %s: %s', response.status,
+                             response.url, await response.text())
+                sys.exit(1)
+            yield response
@@ -0,0 +1,103 @@
+"""
+Copyright 2021-present Airbnb, Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import os
+import threading
+from typing import Dict, Optional, Tuple
+
+import boto3
+from botocore.config import Config
+
+# Retry and Connection Pool Settings Shared by Every AWS Client
+MAX_ATTEMPTS = int(os.environ.get('OTTR_AWS_MAX_ATTEMPTS', '10'))
+MAX_POOL_CONNECTIONS = int(os.environ.get('OTTR_AWS_MAX_POOL_CONNECTIONS', '10'))
+
+_LOCK = threading.Lock()
+_SESSION: Optional[boto3.session.Session] = None
+_CLIENTS: Dict[Tuple[str, Optional[str]], object] = {}
+_RESOURCES: Dict[Tuple[str, Optional[str]], object] = {}
+
+
+def get_config() -> Config:
+    return Config(
+        retries={'mode': 'adaptive', 'total_max_attempts': MAX_ATTEMPTS},
+        max_pool_connections=MAX_POOL_CONNECTIONS,
+        connect_timeout=5,
+        read_timeout=60
+    )
+
+
+def configure(max_attempts: Optional[int] = None, max_pool_connections: Optional[int] = None) -> None:
+    """Override retry/pool settings. Cached clients are rebuilt on next use."""
+    global MAX_ATTEMPTS, MAX_POOL_CONNECTIONS
+    if max_attempts is not None:
+        MAX_ATTEMPTS = max_attempts
+    if max_pool_connections is not None:
+        MAX_POOL_CONNECTIONS = max_pool_connections
+    reset()
+
+
+def reset() -> None:
+    global _SESSION
+    with _LOCK:
+        _SESSION = None
+        _CLIENTS.clear()
+        _RESOURCES.clear()
+
+
+def get_session() -> boto3.session.Session:
+    global _SESSION
+    with _LOCK:
+        if _SESSION is None:
+            _SESSION = boto3.session.Session()
+        return _SESSION
+
+
+def get_client(service_name: str, region_name: Optional[str] = None):
+    """
+    Cached boto3 client using adaptive retry mode, which rate limits
+    client side on throttling errors, and a bounded connection pool.
+
+    Args:
+        service_name (str): AWS service (i.e. route53, dynamodb).
+        region_name (str): AWS region, defaults to the session region.
+    """
+    key = (service_name, region_name)
+    client = _CLIENTS.get(key)
+    if client is None:
+        session = get_session()
+        with _LOCK:
+            client = _CLIENTS.get(key)
+            if client is None:
+                client = session.client(
+                    service_name, region_name=region_name, config=get_config())
+                _CLIENTS[key] = client
+    return client
+
+
+def get_resource(service_name: str, region_name: Optional[str] = None):
+    """Cached boto3 resource sharing the retry/pool configuration."""
+    key = (service_name, region_name)
+    resource = _RESOURCES.get(key)
+    if resource is None:
+        session = get_session()
+        with _LOCK:
+            resource = _RESOURCES.get(key)
+            if resource is None:
+                resource = session.resource(
+                    service_name, region_name=region_name, config=get_config())
+                _RESOURCES[key] = resource
+    return resource
@@ -0,0 +1,175 @@
+"""
+Copyright 2021-present Airbnb, Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import abc
+import asyncio
+import gzip
+import hashlib
+import os
+import shutil
+import tempfile
+from datetime import datetime
+from typing import AsyncIterator, NamedTuple, Optional
+
+from botocore.exceptions import ClientError
+
+from .aws import get_client
+from .logger import get_logger
+
+LOGGER = get_logger(__name__)
+
+# Local Directory or s3://bucket/prefix
+BACKUP_URI = os.environ.get('OTTR_BACKUP_URI')
+# Fallback When OTTR_BACKUP_URI is Unset; Ephemeral on Fargate
+LOCAL_BACKUP_DIRECTORY = '/tmp/ottr/backups'
+CHUNK_SIZE = 1024 * 1024
+LATEST = 'LATEST'
+
+
+class BackupResult(NamedTuple):
+    """Outcome of a configuration backup; location is None when unchanged."""
+    name: str
+    digest: str
+    size: int
+    location: Optional[str] = None
+
+    @property
+    def changed(self) -> bool:
+        return self.location is not None
+
+
+class BackupSink(abc.ABC):
+    """Destination for compressed configuration backups."""
+
+    @abc.abstractmethod
+    def latest_digest(self, name: str) -> Optional[str]:
+        """SHA-256 of the uncompressed content of the last backup for name."""
+
+    @abc.abstractmethod
+    def store(self, name: str, path: str, digest: str) -> str:
+        """Store the gzip file at path as the latest backup and return its location."""
+
+    @staticmethod
+    def object_name(digest: str) -> str:
+        return '{:%Y%m%dT%H%M%S}-{}.xml.gz'.format(datetime.utcnow(), digest[:12])
+
+
+class LocalSink(BackupSink):
+    def __init__(self, directory: str) -> None:
+        self.directory = directory
+
+    def latest_digest(self, name: str) -> Optional[str]:
+        try:
+            with open(os.path.join(self.directory, name, LATEST), 'r') as file:
+                return file.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def store(self, name: str, path: str, digest: str) -> str:
+        directory = os.path.join(self.directory, name)
+        os.makedirs(directory, exist_ok=True)
+        location = os.path.join(directory, self.object_name(digest))
+        shutil.copyfile(path, location)
+        with open(os.path.join(directory, LATEST), 'w') as file:
+            file.write(digest)
+        return location
+
+
+class S3Sink(BackupSink):
+    def __init__(self, bucket: str, prefix: str = '', client=None) -> None:
+        self.bucket = bucket
+        self.prefix = prefix.strip('/')
+        self.client = client or get_client('s3')
+
+    def _key(self, name: str, key: str) -> str:
+        return '/'.join(part for part in (self.prefix, name, key) if part)
+
+    def latest_digest(self, name: str) -> Optional[str]:
+        try:
+            response = self.client.head_object(Bucket=self.bucket, Key=self._key(name, LATEST))
+        except ClientError as error:
+            if error.response['Error']['Code'] in ('NoSuchKey', '404'):
+                return None
+            raise
+        return response['Metadata'].get('sha256')
+
+    def store(self, name: str, path: str, digest: str) -> str:
+        key = self._key(name, self.object_name(digest))
+        # Multipart Upload for Large Files, Digest Kept as Object Metadata
+        self.client.upload_file(path, self.bucket, key, ExtraArgs={
+            'ContentType': 'application/gzip', 'Metadata': {'sha256': digest}})
+        # LATEST Points at the Newest Backup; HEAD Alone Answers "Unchanged?"
+        self.client.put_object(Bucket=self.bucket, Key=self._key(name, LATEST),
+                               Body=key.encode('utf-8'), Metadata={'sha256': digest})
+        return f's3://{self.bucket}/{key}'
+
+
+def get_sink(uri: Optional[str] = None) -> BackupSink:
+    """
+    Args:
+        uri (str): s3://bucket/prefix or a local directory (optionally
+            file://), defaults to OTTR_BACKUP_URI. Falls back to ephemeral
+            local storage with a warning when neither is set.
+    """
+    uri = uri or BACKUP_URI
+    if not uri:
+        LOGGER.warning('OTTR_BACKUP_URI Not Set; Configuration Backups Stored in Ephemeral Local Storage (%s) '
+                       'and Lost When the Task Exits', LOCAL_BACKUP_DIRECTORY)
+        return LocalSink(LOCAL_BACKUP_DIRECTORY)
+    if uri.startswith('s3://'):
+        bucket, _, prefix = uri[len('s3://'):].partition('/')
+        return S3Sink(bucket, prefix)
+    if uri.startswith('file://'):
+        uri = uri[len('file://'):]
+    return LocalSink(uri)
+
+
+async def backup_stream(chunks: AsyncIterator[bytes], name: str, sink: Optional[BackupSink] = None) -> BackupResult:
+    """
+    Compress and hash a streamed configuration export in a single pass and
+    store it unless the content matches the last backup for name.
+
+    Args:
+        chunks (AsyncIterator[bytes]): Response body, i.e.
+            response.content.iter_chunked(CHUNK_SIZE).
+        name (str): Backup name (i.e. device hostname).
+        sink (BackupSink): Destination, defaults to get_sink().
+
+    Returns:
+        BackupResult: Digest and size of the uncompressed content.
+    """
+    sink = sink or get_sink()
+    sha256 = hashlib.sha256()
+    size = 0
+    descriptor, path = tempfile.mkstemp(suffix='.xml.gz')
+    try:
+        # mtime=0 Keeps Identical Content Byte-for-Byte Identical Once Compressed
+        with os.fdopen(descriptor, 'wb') as file, gzip.GzipFile(fileobj=file, mode='wb', mtime=0) as archive:
+            async for chunk in chunks:
+                sha256.update(chunk)
+                archive.write(chunk)
+                size += len(chunk)
+        digest = sha256.hexdigest()
+        # Sink I/O Off the Event Loop so Concurrent Device Calls Proceed
+        if await asyncio.to_thread(sink.latest_digest, name) == digest:
+            LOGGER.info('Configuration Backup Unchanged for %s (%s bytes, SHA-256 %s)', name, size, digest)
+            return BackupResult(name, digest, size)
+        location = await asyncio.to_thread(sink.store, name, path, digest)
+        LOGGER.info('Configuration Backup for %s Stored at %s (%s bytes, %s compressed)',
+                    name, location, size, os.path.getsize(path))
+        return BackupResult(name, digest, size, location)
+    finally:
+        os.remove(path)
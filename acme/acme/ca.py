@@ -14,27 +14,36 @@ limitations under the License.
 import os
 import shutil
 import subprocess
-import requests
 import sys
-import socket
-from typing import List
+from typing import List, Optional, Sequence
 
-import boto3
 import tldextract
-import nmap
 
 from .logger import get_logger
 from .client import get_secret
+from .engine import (
+    LETS_ENCRYPT_PRODUCTION,
+    ACMEClient,
+    AccountKey,
+    load_csr_identifiers,
+    load_csr_key_type,
+    write_certificate_chain
+)
+from .network import MANAGEMENT_PORTS, check_reachability
+from .route53 import ChallengeRecord, validate_acme_challenge_records
 
 
 LOGGER = get_logger(__name__)
 
 
 class LetsEncrypt:
-    def __init__(self, hostname: str, common_name: str, subdelegate: str, subject_alternative_names: List[str], region: str) -> None:
+    def __init__(self, hostname: str, common_name: str, subdelegate: str, subject_alternative_names: List[str], region: str, connection_timeout: float = 5, management_ports: Sequence[int] = MANAGEMENT_PORTS) -> None:
         self.subdelegate = subdelegate
         self.region = region
-        self.hostname = self._validate_device_connection(hostname)
+        self.connection_timeout = connection_timeout
+        self.management_ports = management_ports
+        self.hostname = self._validate_device_connection(
+            hostname, subject_alternative_names)
         self.challenge_alias_subdomain = self._get_subdomain(common_name)
         self.subject_alternative_names = self._validate_subdelegate_zone(
             subject_alternative_names)
@@ -43,44 +52,32 @@ class LetsEncrypt:
         return tldextract.extract(
             common_name).subdomain
 
-    def _query_acme_challenge_records(self, hostname: str, hosted_zone_id: str) -> bool:
-        client = boto3.client('route53')
-        paginator = client.get_paginator(
-            'list_resource_record_sets')
-        try:
-            for page in paginator.paginate(HostedZoneId=hosted_zone_id):
-                for record in page["ResourceRecordSets"]:
-                    if (f'_acme-challenge.{hostname}') in record['Name']:
-                        return True
-            return False
-        except Exception:
-            raise KeyError('HOSTED_ZONE_ID Invalid')
-
-    def _validate_device_connection(self, hostname: str, timeout=5):
-        try:
-            # Validate Device is Up
-            scanner = nmap.PortScanner()
-            ip_address = socket.gethostbyname(hostname)
-            scanner.scan(ip_address, '1', '-v')
-            self._register_lets_encrypt_account()
-            return hostname
-        except requests.ConnectionError:
-            raise Exception(
-                "Failed Connection to Host: {}".format(hostname))
-
-    def _validate_subdelegate_zone(self, subject_alternative_names: List[str]) -> None:
-        client = boto3.client('route53')
-        for hostname in subject_alternative_names:
-            # TODO: Update Other Function to Use registered_domain
-            subdomain = tldextract.extract(hostname).registered_domain
-            hosted_zone_id = client.list_hosted_zones_by_name(
-                DNSName=f'{subdomain}.',
-                MaxItems='1'
-            )['HostedZones'][0]['Id'].split('/')[-1]
-            if not self._query_acme_challenge_records(hostname, hosted_zone_id):
-                LOGGER.warning('Invalid Challenge Alias: {hostname}'.format(
-                    hostname=hostname))
-                raise SystemExit(f'HOSTED_ZONE_ID Invalid for {hostname}')
+    def _validate_device_connection(self, hostname: str, subject_alternative_names: List[str]) -> str:
+        # Validate Device is Up (Empty management_ports Skips the Probe)
+        if self.management_ports:
+            reachability = check_reachability(
+                [hostname] + list(subject_alternative_names),
+                ports=self.management_ports,
+                timeout=self.connection_timeout)
+            if not reachability[hostname]:
+                raise Exception(
+                    "Failed Connection to Host: {}".format(hostname))
+            for name, reachable in reachability.items():
+                if not reachable:
+                    LOGGER.warning(
+                        'Subject Alternative Name Unreachable: %s', name)
+        self._register_lets_encrypt_account()
+        return hostname
+
+    def _validate_subdelegate_zone(self, subject_alternative_names: List[str]) -> List[str]:
+        records = validate_acme_challenge_records(subject_alternative_names)
+        invalid = [hostname for hostname, valid in records.items() if not valid]
+        for hostname in invalid:
+            LOGGER.warning('Invalid Challenge Alias: {hostname}'.format(
+                hostname=hostname))
+        if invalid:
+            raise SystemExit(f'HOSTED_ZONE_ID Invalid for {", ".join(invalid)}')
+        return subject_alternative_names
 
     def _register_lets_encrypt_account(self) -> None:
         prefix = os.environ['PREFIX']
@@ -99,10 +96,12 @@ class LetsEncrypt:
                 f'{prefix}/otter/account.key', region=self.region)
             with open('account.key', 'w') as outfile:
                 outfile.write(account_key)
+            self._account_key = account_key
 
             ca_conf = get_secret(f'{prefix}/otter/ca.conf', region=self.region)
             with open('ca.conf', 'w') as outfile:
                 outfile.write(ca_conf)
+            self._account_url = self._parse_account_url(ca_conf)
 
             shutil.move("account.json",
                         "{acme_account}/account.json".format(acme_account=acme_account))
@@ -115,6 +114,46 @@ class LetsEncrypt:
             LOGGER.error(message)
             sys.exit(1)
 
+    @staticmethod
+    def _parse_account_url(ca_conf: str) -> Optional[str]:
+        # acme.sh Stores the Registration as ACCOUNT_URL='...' in ca.conf
+        for line in ca_conf.splitlines():
+            if line.startswith('ACCOUNT_URL='):
+                return line.split('=', 1)[1].strip().strip('\'"') or None
+        return None
+
+    @property
+    def challenge_alias(self) -> str:
+        if self.challenge_alias_subdomain:
+            return f'{self.challenge_alias_subdomain}.{self.subdelegate}'
+        return self.subdelegate
+
+    def acme_native(self, csr: str, directory: str = LETS_ENCRYPT_PRODUCTION, preferred_chain: Optional[str] = 'ISRG') -> str:
+        """
+        Sign the CSR with the in-process ACME engine instead of acme.sh. The
+        certificate chain is written to the same $HOME/.acme.sh/[common_name]
+        (_ecc for EC keys) paths acme.sh uses.
+
+        Args:
+            csr (str): Path to PEM encoded CSR.
+            directory (str): ACME directory URL of the Certificate Authority.
+            preferred_chain (str): Issuer Common Name substring of the preferred root.
+
+        Returns:
+            str: Path to fullchain.cer
+        """
+        with open(csr, 'rb') as file:
+            csr_pem = file.read()
+
+        # Registration in ca.conf Belongs to the Production Directory
+        account_url = self._account_url if directory == LETS_ENCRYPT_PRODUCTION else None
+        client = ACMEClient(directory, AccountKey(self._account_key.encode()),
+                            account_url=account_url)
+        challenge_record = ChallengeRecord(self.subdelegate, self.challenge_alias)
+        chain = client.issue(csr_pem, challenge_record, preferred_chain)
+        common_name = load_csr_identifiers(csr_pem)[0]
+        return write_certificate_chain(chain, common_name, key_type=load_csr_key_type(csr_pem))
+
     def acme_development(self, csr: str) -> None:  # pragma: no cover
         subprocess.call(
             '{directory}/acme.sh/acme.sh --upgrade -b dev'.format(directory=os.getenv('HOME')), shell=True)
@@ -13,29 +13,37 @@ limitations under the License.
 
 import os
 import json
-import ssl
 import sys
 from datetime import datetime, timedelta
 from typing import List, Tuple
 
 import OpenSSL
-import boto3
 from botocore.exceptions import ClientError
 from boto3.dynamodb.conditions import Key
 
+from .aws import get_client, get_resource
 from .logger import get_logger
+from .verify import verify_certificates
 
 LOGGER = get_logger(__name__)
 
 region_name = os.environ['AWS_REGION']
 dynamodb_table = os.environ['DYNAMODB_TABLE']
 
+# Expected Issuer Organization and Validity (Days) per Certificate Authority
+CA_MAPPING = {
+    'lets_encrypt': {
+        'organization': ["Let's Encrypt", "(STAGING) Let's Encrypt"],
+        'duration': 90
+    },
+    'digicert': {
+        'organization': ["DigiCert Inc"],
+        'duration': 397
+    }
+}
+
 def get_secret(path: str, element=None, region: str = 'us-east-1') -> str:
-    session = boto3.session.Session()
-    client = session.client(
-        service_name='secretsmanager',
-        region_name=region
-    )
+    client = get_client('secretsmanager', region_name=region)
     try:
         get_secret_value_response = client.get_secret_value(
             SecretId=path
@@ -53,8 +61,7 @@ def get_secret(path: str, element=None, region: str = 'us-east-1') -> str:
 
 
 def query_subject_alternative_names(hostname: str) -> List[str]:
-    dynamodb = boto3.resource('dynamodb', region_name=region_name)
-    table = dynamodb.Table(dynamodb_table)
+    table = get_resource('dynamodb', region_name=region_name).Table(dynamodb_table)
     response = table.query(
         IndexName='system_name_index',
         KeyConditionExpression=Key('system_name').eq(hostname))
@@ -66,8 +73,7 @@ def query_subject_alternative_names(hostname: str) -> List[str]:
 
 
 def update_certificate_expiration(hostname: str, certificate_expiration: str) -> dict:
-    dynamodb = boto3.resource('dynamodb', region_name=region_name)
-    table = dynamodb.Table(dynamodb_table)
+    table = get_resource('dynamodb', region_name=region_name).Table(dynamodb_table)
     try:
         _ = datetime.fromisoformat(certificate_expiration)
         response = table.update_item(
@@ -81,7 +87,8 @@ def update_certificate_expiration(hostname: str, certificate_expiration: str) ->
             },
             ReturnValues="ALL_NEW"
         )
-        LOGGER.info(response)
+        LOGGER.info('Updated %s: certificate_expiration=%s', hostname,
+                    response['Attributes'].get('certificate_expiration'))
         return response
     except Exception as error:
         LOGGER.error(error)
@@ -89,8 +96,7 @@ def update_certificate_expiration(hostname: str, certificate_expiration: str) ->
 
 
 def _query_primary_key(system_name: str) -> dict:
-    dynamodb = boto3.resource('dynamodb', region_name=region_name)
-    table = dynamodb.Table(dynamodb_table)
+    table = get_resource('dynamodb', region_name=region_name).Table(dynamodb_table)
     response = table.query(
         IndexName='system_name_index',
         KeyConditionExpression=Key('system_name').eq(system_name))
@@ -108,12 +114,14 @@ def _decode_certificate(certificate: str) -> Tuple[str, str]:
     return (certificate_expiration, certificate_issuer)
 
 
-def query_certificate_expiration(system_name: str, common_name: str) -> str:
+def query_certificate_expiration(system_name: str, common_name: str, context=None) -> str:
     excluded_platforms = ['Ubuntu', 'Windows']
-    host_platform = _query_primary_key(
-        system_name)['Items'][0].get('host_platform')
-    certificate_authority = _query_primary_key(
-        system_name)['Items'][0].get('certificate_authority')
+    if context is not None:
+        item = vars(context)
+    else:
+        item = _query_primary_key(system_name)['Items'][0]
+    host_platform = item.get('host_platform')
+    certificate_authority = item.get('certificate_authority')
 
     if host_platform in excluded_platforms:
         with open(
@@ -122,30 +130,29 @@ def query_certificate_expiration(system_name: str, common_name: str) -> str:
             certificate_expiration, certificate_issuer = _decode_certificate(
                 certificate)
     else:
-        certificate = ssl.get_server_certificate(
-            ('{hostname}'.format(hostname=system_name), 443))
-        certificate_expiration, certificate_issuer = _decode_certificate(
-            certificate)
-
-    ca_mapping = {
-        'lets_encrypt': {
-            'organization': ["Let's Encrypt", "(STAGING) Let's Encrypt"],
-            'duration': 90
-        },
-        'digicert': {
-            'organization': ["DigiCert Inc"],
-            'duration': 397
-        }
-    }
+        # Device Endpoint (SNI Common Name) and Every SAN Verified Concurrently
+        endpoints = verify_certificates(
+            system_name, common_name, item.get('subject_alternative_name'))
+        device = endpoints[0]
+        if not device.valid:
+            LOGGER.error('Unable to Retrieve Certificate from %s: %s',
+                         system_name, device.error)
+            sys.exit(1)
+        mismatched = [endpoint.server_name for endpoint in endpoints[1:]
+                      if endpoint.fingerprint != device.fingerprint]
+        if mismatched:
+            LOGGER.warning('Certificate Not Served on: %s', ', '.join(mismatched))
+        certificate_expiration = device.expiration
+        certificate_issuer = device.issuer
 
     LOGGER.info(certificate_issuer)
     LOGGER.info(certificate_expiration)
 
-    duration = ca_mapping[certificate_authority].get('duration') - 1
+    duration = CA_MAPPING[certificate_authority].get('duration') - 1
     certificate_duration_iso = (
         datetime.utcnow() + timedelta(days=duration)).isoformat()
 
-    if certificate_expiration > certificate_duration_iso and certificate_issuer in ca_mapping[certificate_authority].get('organization'):
+    if certificate_expiration > certificate_duration_iso and certificate_issuer in CA_MAPPING[certificate_authority].get('organization'):
         return certificate_expiration
     else:
         LOGGER.error('Failure to Upload Certificate to Device')
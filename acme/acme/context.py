@@ -0,0 +1,115 @@
+"""
+Copyright 2021-present Airbnb, Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import base64
+import binascii
+import json
+import os
+import zlib
+from typing import Dict, List, Optional
+
+from .client import _query_primary_key
+from .logger import get_logger
+
+LOGGER = get_logger(__name__)
+
+ENVIRONMENT_VARIABLE = 'DEVICE_CONTEXT'
+
+# Compact Keys Keep the Encoded Container Override Small
+FIELDS = {
+    'system_name': 's',
+    'common_name': 'c',
+    'subject_alternative_name': 'n',
+    'host_platform': 'p',
+    'os_version': 'o',
+    'device_model': 'm',
+    'certificate_authority': 'a',
+    'certificate_validation': 'v',
+    'key_type': 'k',
+    'members': 'g',
+    'panorama': 'x'
+}
+
+
+class DeviceContext:
+    """
+    Asset inventory item for the device being rotated. The router already
+    holds the full item when it builds the Step Functions payload and passes
+    it to the container as DEVICE_CONTEXT, so no inventory reads are needed.
+    """
+
+    def __init__(self, system_name: str, common_name: str, subject_alternative_name: List[str], host_platform: str, certificate_authority: str, certificate_validation: str = 'True', os_version: Optional[str] = None, device_model: Optional[str] = None, key_type: str = 'rsa', members: Optional[List[str]] = None, panorama: Optional[Dict[str, str]] = None) -> None:
+        self.system_name = system_name
+        self.common_name = common_name
+        self.subject_alternative_name = list(subject_alternative_name)
+        self.host_platform = host_platform
+        self.certificate_authority = certificate_authority
+        self.certificate_validation = certificate_validation
+        self.os_version = os_version
+        self.device_model = device_model
+        self.key_type = key_type
+        self.members = list(members) if members else None
+        self.panorama = panorama
+
+    @property
+    def subject_alternative_names(self) -> List[str]:
+        return list(self.subject_alternative_name)
+
+    @property
+    def group(self) -> List[str]:
+        """Devices sharing this certificate (the rotation group), system_name first."""
+        return list(dict.fromkeys([self.system_name] + (self.members or [])))
+
+    @classmethod
+    def from_item(cls, item: dict) -> 'DeviceContext':
+        return cls(**{field: item[field] for field in FIELDS if field in item})
+
+    def encode(self) -> str:
+        payload = {FIELDS[field]: getattr(self, field) for field in FIELDS
+                   if getattr(self, field) is not None}
+        data = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+        return base64.urlsafe_b64encode(zlib.compress(data, 9)).decode('ascii')
+
+    @classmethod
+    def decode(cls, value: str) -> 'DeviceContext':
+        payload = json.loads(zlib.decompress(base64.urlsafe_b64decode(value)))
+        return cls(**{field: payload[key] for field, key in FIELDS.items() if key in payload})
+
+    @classmethod
+    def load(cls, system_name: Optional[str] = None) -> 'DeviceContext':
+        """
+        Read the context from the DEVICE_CONTEXT environment variable, falling
+        back to a single inventory query when the payload is absent (i.e. a
+        manually triggered task) or does not match system_name.
+
+        Args:
+            system_name (str): Expected device FQDN, defaults to SYSTEM_NAME.
+        """
+        system_name = system_name or os.environ.get('SYSTEM_NAME')
+        value = os.environ.get(ENVIRONMENT_VARIABLE)
+        if value:
+            try:
+                context = cls.decode(value)
+                if system_name is None or context.system_name == system_name:
+                    return context
+                LOGGER.warning('DEVICE_CONTEXT is for %s, Expected %s',
+                               context.system_name, system_name)
+            except (binascii.Error, zlib.error, ValueError, TypeError) as error:
+                LOGGER.warning('Invalid DEVICE_CONTEXT: %s', error)
+        items = _query_primary_key(system_name)['Items']
+        if not items:
+            raise KeyError(f'{system_name} Not Found in Asset Inventory')
+        return cls.from_item(items[0])
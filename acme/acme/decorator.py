@@ -14,14 +14,36 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 
-import requests
 import json
+import logging
+import os
 import sys
+import time
+from collections import deque
+from contextlib import ContextDecorator
+from typing import Deque, Dict, Optional
+
+import requests
 
 from .logger import get_logger
 
 LOGGER = get_logger(__name__)
 
+# Phase Records are Written as Bare JSON Lines (CloudWatch Embedded Metric Format)
+METRICS_NAMESPACE = os.environ.get('OTTR_METRICS_NAMESPACE', 'Ottr')
+METRICS_LOGGER = logging.getLogger('ottr.metrics')
+METRICS_LOGGER.propagate = False
+if not METRICS_LOGGER.handlers:
+    _handler = logging.StreamHandler(sys.stdout)
+    _handler.setFormatter(logging.Formatter('%(message)s'))
+    METRICS_LOGGER.addHandler(_handler)
+    METRICS_LOGGER.setLevel(logging.INFO)
+
+PHASE_LABELS: Dict[str, str] = {}
+# Most Recent Phase Records, Bounded for Long-Lived Processes (i.e. Drift Scanner)
+MAX_PHASES = 1000
+PHASES: Deque[Dict] = deque(maxlen=MAX_PHASES)
+
 # Generic Exception Error Handling
 
 class generic_exception(object):
@@ -44,9 +66,90 @@ def http_exception(func):
     def wrapper(*args, **kwargs):
         resp: requests.models.Response = func(*args, **kwargs)
         if resp.status_code >= 400:
-            LOGGER.error(**json.loads(resp._content))
+            LOGGER.error('HTTP %s %s: %s', resp.status_code, resp.url, resp.text)
+            sys.exit(1)
+        else:
+            return resp
+
+    return wrapper
+
+
+def async_http_exception(func):
+    async def wrapper(*args, **kwargs):
+        resp = await func(*args, **kwargs)
+        if resp.status_code >= 400:
+            LOGGER.error('HTTP %s %s: %s', resp.status_code, resp.url, resp.text)
             sys.exit(1)
         else:
             return resp
 
     return wrapper
+
+
+def _task_id() -> Optional[str]:
+    # ECS Metadata URI Ends With the Task/Container Identifier
+    uri = os.environ.get('ECS_CONTAINER_METADATA_URI_V4') or os.environ.get('ECS_CONTAINER_METADATA_URI')
+    return os.environ.get('OTTR_TASK_ID') or (uri.rstrip('/').rsplit('/', 1)[-1] if uri else None)
+
+
+def set_phase_labels(**labels) -> None:
+    """Default labels (i.e. device, platform) attached to every phase record."""
+    PHASE_LABELS.update({key: value for key, value in labels.items() if value is not None})
+
+
+class phase(ContextDecorator):
+    """
+    Time a rotation phase as a context manager or decorator and emit one JSON
+    line with its duration and outcome (success, error or exit).
+
+        with acme.phase('acme_order'):
+            le_client.acme_production(csr=csr_path)
+
+        @acme.phase('commit')
+        def commit_changes(...):
+    """
+
+    def __init__(self, name: str, **labels) -> None:
+        self.name = name
+        self.labels = labels
+        self._start = None
+
+    def _recreate_cm(self) -> 'phase':
+        # Fresh Timer per Decorated Call, so Nested or Concurrent Calls Keep Their Own Start
+        return type(self)(self.name, **self.labels)
+
+    def __enter__(self) -> 'phase':
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback) -> bool:
+        duration = (time.perf_counter() - self._start) * 1000
+        if exc_type is None:
+            outcome = 'success'
+        elif exc_type is SystemExit and getattr(exc, 'code', None) in (0, None):
+            outcome = 'success'
+        elif exc_type is SystemExit:
+            outcome = 'exit'
+        else:
+            outcome = 'error'
+        self.emit(duration, outcome)
+        return False
+
+    def emit(self, duration: float, outcome: str) -> Dict:
+        # Later Labels Win: Defaults, Then Task ID, Then Phase Labels
+        labels = {**PHASE_LABELS, 'task_id': _task_id(), **self.labels}
+        labels = {key: value for key, value in labels.items() if value is not None}
+        record = dict(labels, phase=self.name, outcome=outcome,
+                      duration_ms=round(duration, 1))
+        PHASES.append(record)
+        dimensions = [key for key in ('platform', 'phase') if key in record]
+        record['_aws'] = {
+            'Timestamp': int(time.time() * 1000),
+            'CloudWatchMetrics': [{
+                'Namespace': METRICS_NAMESPACE,
+                'Dimensions': [dimensions],
+                'Metrics': [{'Name': 'duration_ms', 'Unit': 'Milliseconds'}]
+            }]
+        }
+        METRICS_LOGGER.info(json.dumps(record, default=str))
+        return record
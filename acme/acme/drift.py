@@ -0,0 +1,190 @@
+"""
+Copyright 2021-present Airbnb, Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import asyncio
+import math
+import time
+from typing import Dict, List, NamedTuple, Optional
+
+from botocore.exceptions import ClientError
+
+from .aws import get_resource
+from .client import CA_MAPPING, dynamodb_table, region_name
+from .logger import get_logger
+from .verify import EndpointCertificate, _client_context, verify_endpoint
+
+LOGGER = get_logger(__name__)
+
+
+class DriftRecord(NamedTuple):
+    """Inventory item compared against the certificate the device serves."""
+    item: dict
+    endpoint: EndpointCertificate
+    latency: float
+    drift: List[str]
+
+
+class ScanReport:
+    def __init__(self, records: List[DriftRecord], duration: float) -> None:
+        self.records = records
+        self.duration = duration
+
+    @property
+    def drifted(self) -> List[DriftRecord]:
+        return [record for record in self.records if record.drift]
+
+    @property
+    def errors(self) -> List[DriftRecord]:
+        return [record for record in self.records if not record.endpoint.valid]
+
+    def summary(self) -> Dict[str, float]:
+        latencies = sorted(record.latency for record in self.records)
+        return {
+            'endpoints': len(self.records),
+            'errors': len(self.errors),
+            'drifted': len(self.drifted),
+            'duration': round(self.duration, 3),
+            'throughput': round(len(self.records) / self.duration, 1) if self.duration else 0.0,
+            'p50': round(percentile(latencies, 50), 3),
+            'p90': round(percentile(latencies, 90), 3),
+            'p99': round(percentile(latencies, 99), 3)
+        }
+
+
+def percentile(values: List[float], rank: float) -> float:
+    """Nearest-rank percentile of sorted values."""
+    if not values:
+        return 0.0
+    index = max(math.ceil(rank / 100 * len(values)) - 1, 0)
+    return values[index]
+
+
+def find_drift(item: dict, endpoint: EndpointCertificate) -> List[str]:
+    """
+    Attributes of the inventory item that no longer match the served
+    certificate. Unreachable endpoints never report drift.
+    """
+    if not endpoint.valid:
+        return []
+    drift = []
+    if item.get('certificate_expiration') != endpoint.expiration:
+        drift.append('certificate_expiration')
+    organizations = CA_MAPPING.get(item.get('certificate_authority'), {}).get('organization', [])
+    if endpoint.issuer not in organizations:
+        drift.append('certificate_authority')
+    return drift
+
+
+def scan_inventory(table=None) -> List[dict]:
+    """Every item in the asset inventory, following scan pagination."""
+    table = table or get_resource('dynamodb', region_name=region_name).Table(dynamodb_table)
+    kwargs = {}
+    items = []
+    while True:
+        response = table.scan(**kwargs)
+        items.extend(response['Items'])
+        if 'LastEvaluatedKey' not in response:
+            return items
+        kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+async def scan_endpoints(items: List[dict], port: int = 443, timeout: float = 5, concurrency: int = 500) -> List[DriftRecord]:
+    """
+    Handshake with every device (SNI common_name), at most concurrency at a
+    time, and compare the served certificate with its inventory item.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    context = _client_context()
+
+    async def scan(item: dict) -> DriftRecord:
+        async with semaphore:
+            start = time.monotonic()
+            endpoint = await verify_endpoint(
+                item['system_name'], item.get('common_name') or item['system_name'],
+                port, timeout, context)
+            latency = time.monotonic() - start
+        return DriftRecord(item, endpoint, latency, find_drift(item, endpoint))
+
+    return list(await asyncio.gather(*[scan(item) for item in items]))
+
+
+def update_drifted(records: List[DriftRecord], table=None) -> int:
+    """
+    Write the served expiration back for drifted records. Only
+    certificate_expiration is set, and only while it still holds the scanned
+    value, so a rotation that finished after the scan is not overwritten.
+    Issuer drift is reported only.
+    """
+    table = table or get_resource('dynamodb', region_name=region_name).Table(dynamodb_table)
+    updated = 0
+    for record in records:
+        if 'certificate_expiration' not in record.drift:
+            continue
+        previous = record.item.get('certificate_expiration')
+        try:
+            if previous is None:
+                condition = 'attribute_not_exists(certificate_expiration)'
+                values = {':certificate_expiration': record.endpoint.expiration}
+            else:
+                condition = 'certificate_expiration = :previous'
+                values = {':certificate_expiration': record.endpoint.expiration,
+                          ':previous': previous}
+            table.update_item(
+                Key={'system_name': record.item['system_name']},
+                UpdateExpression='SET certificate_expiration = :certificate_expiration',
+                ConditionExpression=condition,
+                ExpressionAttributeValues=values)
+            updated += 1
+        except ClientError as error:
+            if error.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise
+            LOGGER.info('Skipped %s: certificate_expiration Changed Since Scan',
+                        record.item['system_name'])
+    return updated
+
+
+def reconcile(items: Optional[List[dict]] = None, port: int = 443, timeout: float = 5, concurrency: int = 500, dry_run: bool = True, table=None) -> ScanReport:
+    """
+    Scan the fleet for certificate drift and optionally correct the table.
+
+    Args:
+        items (List[dict]): Inventory items, defaults to a full table scan.
+        port (int): TLS port.
+        timeout (float): Per device connect and handshake timeout in seconds.
+        concurrency (int): Maximum simultaneous handshakes.
+        dry_run (bool): Report drift without writing to DynamoDB.
+        table: DynamoDB Table resource, defaults to DYNAMODB_TABLE.
+
+    Returns:
+        ScanReport: Per device results and throughput/latency summary.
+    """
+    if items is None:
+        items = scan_inventory(table)
+    start = time.monotonic()
+    records = asyncio.run(scan_endpoints(items, port, timeout, concurrency))
+    report = ScanReport(records, time.monotonic() - start)
+
+    for record in report.drifted:
+        LOGGER.warning('Drift %s: %s (Table %s, Served %s, Issuer %s)',
+                       record.item['system_name'], ', '.join(record.drift),
+                       record.item.get('certificate_expiration'),
+                       record.endpoint.expiration, record.endpoint.issuer)
+    for record in report.errors:
+        LOGGER.warning('Unable to Scan %s: %s', record.item['system_name'], record.endpoint.error)
+    if report.drifted and not dry_run:
+        LOGGER.info('Updated %s Records', update_drifted(report.drifted, table))
+    LOGGER.info('Drift Scan: %s', report.summary())
+    return report
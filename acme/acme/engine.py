@@ -0,0 +1,337 @@
+"""
+Copyright 2021-present Airbnb, Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import base64
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import requests
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec, padding, rsa
+from cryptography.hazmat.primitives.asymmetric.utils import decode_dss_signature
+from cryptography.x509.oid import ExtensionOID, NameOID
+
+from .exceptions import ACMEError
+from .keys import certificate_directory
+from .logger import get_logger
+
+LOGGER = get_logger(__name__)
+
+LETS_ENCRYPT_PRODUCTION = 'https://acme-v02.api.letsencrypt.org/directory'
+LETS_ENCRYPT_STAGING = 'https://acme-staging-v02.api.letsencrypt.org/directory'
+
+JOSE_CONTENT_TYPE = 'application/jose+json'
+
+
+def _b64(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).decode('ascii').rstrip('=')
+
+
+def _int_b64(value: int) -> str:
+    return _b64(value.to_bytes((value.bit_length() + 7) // 8 or 1, 'big'))
+
+
+def load_csr_identifiers(csr_pem: bytes) -> List[str]:
+    """Common Name followed by DNS Subject Alternative Names of a CSR."""
+    csr = x509.load_pem_x509_csr(csr_pem)
+    identifiers = [attribute.value for attribute in
+                   csr.subject.get_attributes_for_oid(NameOID.COMMON_NAME)]
+    try:
+        extension = csr.extensions.get_extension_for_oid(
+            ExtensionOID.SUBJECT_ALTERNATIVE_NAME)
+        identifiers += extension.value.get_values_for_type(x509.DNSName)
+    except x509.ExtensionNotFound:
+        pass
+    return list(dict.fromkeys(name.lower() for name in identifiers))
+
+
+def load_csr_key_type(csr_pem: bytes) -> str:
+    """rsa or ecdsa, matching the route key_type of the CSR public key."""
+    public_key = x509.load_pem_x509_csr(csr_pem).public_key()
+    return 'ecdsa' if isinstance(public_key, ec.EllipticCurvePublicKey) else 'rsa'
+
+
+def split_certificate_chain(chain_pem: str) -> List[str]:
+    marker = '-----END CERTIFICATE-----'
+    return [block.strip() + '\n' + marker + '\n'
+            for block in chain_pem.split(marker) if block.strip()]
+
+
+class AccountKey:
+    """ACME account key capable of producing RFC 7515 JWS signatures."""
+
+    def __init__(self, key_pem: bytes) -> None:
+        self._key = serialization.load_pem_private_key(key_pem, password=None)
+        if isinstance(self._key, rsa.RSAPrivateKey):
+            numbers = self._key.public_key().public_numbers()
+            self.algorithm = 'RS256'
+            self.jwk = {'e': _int_b64(numbers.e), 'kty': 'RSA',
+                        'n': _int_b64(numbers.n)}
+        elif isinstance(self._key, ec.EllipticCurvePrivateKey) and self._key.curve.name == 'secp256r1':
+            numbers = self._key.public_key().public_numbers()
+            self.algorithm = 'ES256'
+            self.jwk = {'crv': 'P-256', 'kty': 'EC',
+                        'x': _b64(numbers.x.to_bytes(32, 'big')),
+                        'y': _b64(numbers.y.to_bytes(32, 'big'))}
+        else:
+            raise ACMEError('Unsupported ACME Account Key Type')
+        digest = hashlib.sha256(json.dumps(
+            self.jwk, sort_keys=True, separators=(',', ':')).encode()).digest()
+        self.thumbprint = _b64(digest)
+
+    def sign(self, data: bytes) -> bytes:
+        if self.algorithm == 'RS256':
+            return self._key.sign(data, padding.PKCS1v15(), hashes.SHA256())
+        r, s = decode_dss_signature(
+            self._key.sign(data, ec.ECDSA(hashes.SHA256())))
+        return r.to_bytes(32, 'big') + s.to_bytes(32, 'big')
+
+    def key_authorization(self, token: str) -> str:
+        return f'{token}.{self.thumbprint}'
+
+    def dns01_value(self, token: str) -> str:
+        return _b64(hashlib.sha256(self.key_authorization(token).encode()).digest())
+
+
+class ACMEClient:
+    """
+    In-process ACME v2 (RFC 8555) client. Requests are issued from a single
+    keep-alive session and replay nonces are pooled so authorizations and
+    challenges can be processed concurrently.
+    """
+
+    def __init__(self, directory_url: str, account_key: AccountKey, account_url: Optional[str] = None, timeout: Tuple[float, float] = (5, 30), poll_interval: float = 1, poll_timeout: float = 180, max_workers: int = 10) -> None:
+        self.directory_url = directory_url
+        self.account_key = account_key
+        self.account_url = account_url
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self.poll_timeout = poll_timeout
+        self.max_workers = max_workers
+        self._session = requests.Session()
+        self._session.headers.update({'User-Agent': 'ottr-airbnb'})
+        self._directory: Optional[Dict] = None
+        self._nonces: List[str] = []
+        self._lock = threading.Lock()
+
+    @property
+    def directory(self) -> Dict:
+        if self._directory is None:
+            response = self._session.get(self.directory_url, timeout=self.timeout)
+            self._check(response)
+            self._directory = response.json()
+        return self._directory
+
+    def _check(self, response: requests.Response) -> requests.Response:
+        if response.status_code >= 400:
+            try:
+                problem = response.json()
+            except ValueError:
+                problem = {'detail': response.text}
+            raise ACMEError('{url} [{status}] {type}: {detail}'.format(
+                url=response.url, status=response.status_code,
+                type=problem.get('type'), detail=problem.get('detail')))
+        return response
+
+    def _store_nonce(self, response: requests.Response) -> None:
+        nonce = response.headers.get('Replay-Nonce')
+        if nonce:
+            with self._lock:
+                self._nonces.append(nonce)
+
+    def _nonce(self) -> str:
+        with self._lock:
+            if self._nonces:
+                return self._nonces.pop()
+        response = self._session.head(
+            self.directory['newNonce'], timeout=self.timeout)
+        self._check(response)
+        return response.headers['Replay-Nonce']
+
+    def _jws(self, url: str, payload, nonce: str) -> str:
+        protected = {'alg': self.account_key.algorithm, 'nonce': nonce, 'url': url}
+        if self.account_url is None:
+            protected['jwk'] = self.account_key.jwk
+        else:
+            protected['kid'] = self.account_url
+        encoded_protected = _b64(json.dumps(protected).encode())
+        # POST-as-GET Requests Carry an Empty Payload
+        encoded_payload = '' if payload is None else _b64(json.dumps(payload).encode())
+        signature = self.account_key.sign(
+            f'{encoded_protected}.{encoded_payload}'.encode('ascii'))
+        return json.dumps({'protected': encoded_protected,
+                           'payload': encoded_payload,
+                           'signature': _b64(signature)})
+
+    def post(self, url: str, payload=None, retries: int = 3) -> requests.Response:
+        for _ in range(retries):
+            response = self._session.post(
+                url, data=self._jws(url, payload, self._nonce()),
+                headers={'Content-Type': JOSE_CONTENT_TYPE}, timeout=self.timeout)
+            self._store_nonce(response)
+            if response.status_code == 400 and 'badNonce' in response.text:
+                LOGGER.debug('ACME badNonce Retry: %s', url)
+                continue
+            return self._check(response)
+        return self._check(response)
+
+    def register(self, email: Optional[str] = None) -> str:
+        """
+        Look up or create the account bound to the account key. newAccount
+        returns the existing registration when the key is already known.
+        """
+        if self.account_url is not None:
+            return self.account_url
+        payload = {'termsOfServiceAgreed': True}
+        if email:
+            payload['contact'] = [f'mailto:{email}']
+        response = self.post(self.directory['newAccount'], payload)
+        self.account_url = response.headers['Location']
+        LOGGER.info('ACME Account: %s', self.account_url)
+        return self.account_url
+
+    def new_order(self, identifiers: List[str]) -> Tuple[str, Dict]:
+        payload = {'identifiers': [{'type': 'dns', 'value': identifier}
+                                   for identifier in identifiers]}
+        response = self.post(self.directory['newOrder'], payload)
+        return response.headers['Location'], response.json()
+
+    def poll(self, url: str, pending: Tuple[str, ...] = ('pending', 'processing')) -> Dict:
+        deadline = time.monotonic() + self.poll_timeout
+        while True:
+            response = self.post(url)
+            resource = response.json()
+            if resource.get('status') not in pending:
+                return resource
+            if time.monotonic() > deadline:
+                raise ACMEError(f'Timed Out Polling {url}: {resource.get("status")}')
+            retry_after = response.headers.get('Retry-After', '')
+            time.sleep(min(float(retry_after), 10) if retry_after.isdigit() else self.poll_interval)
+
+    def _map(self, function, items: List) -> List:
+        if not items:
+            return []
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(items))) as executor:
+            return list(executor.map(function, items))
+
+    def _validate_authorizations(self, order: Dict, challenge_record) -> None:
+        authorizations = self._map(
+            lambda url: (url, self.post(url).json()), order['authorizations'])
+        pending = []
+        for url, authorization in authorizations:
+            if authorization['status'] == 'valid':
+                continue
+            challenge = next((challenge for challenge in authorization['challenges']
+                              if challenge['type'] == 'dns-01'), None)
+            if challenge is None:
+                raise ACMEError('dns-01 Challenge Unavailable for {}'.format(
+                    authorization['identifier']['value']))
+            pending.append((url, challenge))
+
+        if not pending:
+            return
+
+        challenge_record.publish(
+            [self.account_key.dns01_value(challenge['token']) for _, challenge in pending])
+        try:
+            self._map(lambda item: self.post(item[1]['url'], {}), pending)
+            results = self._map(lambda item: self.poll(item[0]), pending)
+        finally:
+            challenge_record.remove()
+
+        invalid = [result for result in results if result['status'] != 'valid']
+        for authorization in invalid:
+            errors = [challenge.get('error') for challenge in authorization.get('challenges', [])
+                      if challenge.get('error')]
+            LOGGER.error('Authorization Failed %s: %s',
+                         authorization['identifier']['value'], errors)
+        if invalid:
+            raise ACMEError('ACME Authorization Failed')
+
+    def _download_certificate(self, url: str, preferred_chain: Optional[str]) -> str:
+        response = self.post(url)
+        chain = response.text
+        if preferred_chain and not self._chain_matches(chain, preferred_chain):
+            links = requests.utils.parse_header_links(response.headers.get('Link', ''))
+            for link in links:
+                if link.get('rel') != 'alternate':
+                    continue
+                alternate_chain = self.post(link['url']).text
+                if self._chain_matches(alternate_chain, preferred_chain):
+                    return alternate_chain
+        return chain
+
+    @staticmethod
+    def _chain_matches(chain: str, preferred_chain: str) -> bool:
+        certificates = split_certificate_chain(chain)
+        top = x509.load_pem_x509_certificate(certificates[-1].encode())
+        issuer = top.issuer.get_attributes_for_oid(NameOID.COMMON_NAME)
+        return bool(issuer) and preferred_chain in issuer[0].value
+
+    def issue(self, csr_pem: bytes, challenge_record, preferred_chain: Optional[str] = None) -> str:
+        """
+        Order, validate (DNS-01) and finalize a certificate for a CSR.
+
+        Args:
+            csr_pem (bytes): PEM encoded Certificate Signing Request.
+            challenge_record: route53.ChallengeRecord used for DNS-01 values.
+            preferred_chain (str): Issuer Common Name substring of the root to prefer.
+
+        Returns:
+            str: PEM encoded certificate chain (leaf first).
+        """
+        self.register()
+        identifiers = load_csr_identifiers(csr_pem)
+        order_url, order = self.new_order(identifiers)
+        LOGGER.info('ACME Order %s: %s', order_url, identifiers)
+
+        self._validate_authorizations(order, challenge_record)
+
+        csr_der = x509.load_pem_x509_csr(csr_pem).public_bytes(
+            serialization.Encoding.DER)
+        order = self.poll(order_url, pending=('pending',))
+        if order['status'] == 'ready':
+            self.post(order['finalize'], {'csr': _b64(csr_der)})
+            order = self.poll(order_url, pending=('ready', 'processing'))
+        if order['status'] != 'valid':
+            raise ACMEError(f'ACME Order {order_url} {order["status"]}')
+        return self._download_certificate(order['certificate'], preferred_chain)
+
+
+def write_certificate_chain(chain_pem: str, common_name: str, directory: Optional[str] = None, key_type: str = 'rsa') -> str:
+    """
+    Write the chain using the acme.sh layout platforms already consume:
+    $HOME/.acme.sh/[common_name]{,_ecc}/{fullchain.cer, ca.cer, [common_name].cer}
+    """
+    if directory is None:
+        directory = certificate_directory(common_name, key_type)
+    os.makedirs(directory, exist_ok=True)
+    certificates = split_certificate_chain(chain_pem)
+    outputs = {
+        'fullchain.cer': ''.join(certificates),
+        'ca.cer': ''.join(certificates[1:]),
+        f'{common_name}.cer': certificates[0]
+    }
+    for name, content in outputs.items():
+        with open(os.path.join(directory, name), 'w') as outfile:
+            outfile.write(content)
+    return os.path.join(directory, 'fullchain.cer')
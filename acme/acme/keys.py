@@ -0,0 +1,136 @@
+"""
+Copyright 2021-present Airbnb, Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import os
+from typing import Dict, List, Optional, Tuple
+
+from cryptography import x509
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec, rsa
+from cryptography.x509.oid import NameOID
+
+from .logger import get_logger
+
+LOGGER = get_logger(__name__)
+
+KEY_TYPES = ('rsa', 'ecdsa')
+
+# Subject Attributes Read From the Task Environment (Same as On-Device CSRs)
+SUBJECT_ENVIRONMENT = {
+    'country': NameOID.COUNTRY_NAME,
+    'state': NameOID.STATE_OR_PROVINCE_NAME,
+    'locality': NameOID.LOCALITY_NAME,
+    'organization': NameOID.ORGANIZATION_NAME,
+    'organization_unit': NameOID.ORGANIZATIONAL_UNIT_NAME
+}
+
+
+def generate_private_key(key_type: str = 'rsa', key_size: int = 2048):
+    """
+    Args:
+        key_type (str): rsa or ecdsa (NIST P-256).
+        key_size (int): RSA modulus size in bits.
+    """
+    if key_type == 'rsa':
+        return rsa.generate_private_key(65537, key_size, default_backend())
+    if key_type == 'ecdsa':
+        return ec.generate_private_key(ec.SECP256R1(), default_backend())
+    raise ValueError(f'Unsupported Key Type: {key_type} (Expected {", ".join(KEY_TYPES)})')
+
+
+def certificate_directory(common_name: str, key_type: str = 'rsa', home: Optional[str] = None) -> str:
+    """
+    Directory acme.sh writes a chain signed for common_name to:
+    $HOME/.acme.sh/[common_name], suffixed _ecc for EC keys.
+    """
+    if key_type not in KEY_TYPES:
+        raise ValueError(f'Unsupported Key Type: {key_type} (Expected {", ".join(KEY_TYPES)})')
+    suffix = '_ecc' if key_type == 'ecdsa' else ''
+    return os.path.join(home or os.environ['HOME'], '.acme.sh', f'{common_name}{suffix}')
+
+
+def certificate_chain_path(common_name: str, key_type: str = 'rsa', home: Optional[str] = None) -> str:
+    """Path to fullchain.cer for common_name and the route key_type."""
+    return os.path.join(certificate_directory(common_name, key_type, home), 'fullchain.cer')
+
+
+def _subject(common_name: str, attributes: Optional[Dict[str, str]] = None) -> x509.Name:
+    if attributes is None:
+        attributes = {name: os.environ[name] for name in SUBJECT_ENVIRONMENT
+                      if os.environ.get(name)}
+    names = [x509.NameAttribute(NameOID.COMMON_NAME, common_name)]
+    for name, oid in SUBJECT_ENVIRONMENT.items():
+        if attributes.get(name):
+            names.append(x509.NameAttribute(oid, attributes[name]))
+    return x509.Name(names)
+
+
+def build_csr(private_key, common_name: str, subject_alternative_names: List[str], attributes: Optional[Dict[str, str]] = None) -> bytes:
+    """
+    PEM encoded CSR for common_name with the common name and every SAN in the
+    subjectAltName extension.
+
+    Args:
+        private_key: RSA or EC private key.
+        common_name (str): Certificate Common Name (CN).
+        subject_alternative_names (List[str]): Additional DNS names.
+        attributes (Dict[str, str]): Subject attributes, defaults to the
+            country, state, locality, organization and organization_unit
+            environment variables.
+    """
+    names = list(dict.fromkeys([common_name] + list(subject_alternative_names)))
+    request = x509.CertificateSigningRequestBuilder().subject_name(
+        _subject(common_name, attributes)).add_extension(
+        x509.SubjectAlternativeName([x509.DNSName(name) for name in names]),
+        critical=False).sign(private_key, hashes.SHA256(), default_backend())
+    return request.public_bytes(serialization.Encoding.PEM)
+
+
+def serialize_private_key(private_key, passphrase: Optional[str] = None) -> bytes:
+    """
+    Traditional OpenSSL PEM (BEGIN RSA/EC PRIVATE KEY), which appliances
+    accept more widely than PKCS#8, encrypted when passphrase is set.
+    """
+    if passphrase:
+        encryption = serialization.BestAvailableEncryption(passphrase.encode('utf-8'))
+    else:
+        encryption = serialization.NoEncryption()
+    return private_key.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.TraditionalOpenSSL, encryption)
+
+
+def generate_key_and_csr(common_name: str, subject_alternative_names: List[str], key_type: str = 'rsa', directory: str = '.', name: Optional[str] = None, passphrase: Optional[str] = None) -> Tuple[str, str]:
+    """
+    Generate the private key and CSR in the container instead of on the
+    appliance management plane.
+
+    Returns:
+        Tuple[str, str]: Paths to {name}.key (mode 0600) and {name}.csr.
+    """
+    name = name or common_name
+    private_key = generate_private_key(key_type)
+    key_path = os.path.join(directory, f'{name}.key')
+    csr_path = os.path.join(directory, f'{name}.csr')
+
+    descriptor = os.open(key_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(descriptor, 'wb') as file:
+        file.write(serialize_private_key(private_key, passphrase))
+    with open(csr_path, 'wb') as file:
+        file.write(build_csr(private_key, common_name, subject_alternative_names))
+
+    LOGGER.info('Generated %s Private Key and CSR for %s', key_type.upper(), common_name)
+    return key_path, csr_path
@@ -14,20 +14,104 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 
+import json
 import logging
 import os
+import random
 
 LOCAL_LOGGER_FMT = '[%(levelname)s %(asctime)s (%(name)s:%(lineno)d)]: %(message)s'
 
+# Output Format (json or text) and Bounds on Logged Payload Size
+LOGGER_FORMAT = os.environ.get('LOGGER_FORMAT', 'json')
+MAX_MESSAGE_LENGTH = int(os.environ.get('LOGGER_MAX_LENGTH', '4096'))
+MAX_ITEMS = int(os.environ.get('LOGGER_MAX_ITEMS', '10'))
+DEBUG_SAMPLE_RATE = float(os.environ.get('LOGGER_DEBUG_SAMPLE_RATE', '1.0'))
+
 logging.basicConfig(level=logging.INFO, format=LOCAL_LOGGER_FMT)
 
 
-class LogFormatter(logging.Formatter):  # pragma: no cover
+def summarize(value, max_items: int = MAX_ITEMS, depth: int = 2):
+    """
+    Bounded stand-in for large containers (i.e. DynamoDB scan responses) so
+    formatting cost does not grow with inventory size.
+    """
+    if isinstance(value, dict):
+        if depth <= 0:
+            return f'<dict keys={len(value)}>'
+        keys = [key for key in value if key != 'ResponseMetadata']
+        output = {key: summarize(value[key], max_items, depth - 1) for key in keys[:max_items]}
+        if len(keys) > max_items:
+            output['...'] = f'<{len(keys) - max_items} more keys>'
+        return output
+    if isinstance(value, (list, tuple, set, frozenset)):
+        if depth <= 0:
+            return f'<{type(value).__name__} len={len(value)}>'
+        items = list(value)
+        output = [summarize(item, max_items, depth - 1) for item in items[:max_items]]
+        if len(items) > max_items:
+            output.append(f'<{len(items) - max_items} more items>')
+        return output
+    return value
+
+
+def truncate(message: str, max_length: int = MAX_MESSAGE_LENGTH) -> str:
+    if max_length and len(message) > max_length:
+        return f'{message[:max_length]}... [{len(message) - max_length} chars truncated]'
+    return message
+
+
+class DebugSampler(logging.Filter):
+    """Pass DEBUG records with probability rate; other levels always pass."""
+
+    def __init__(self, rate: float = DEBUG_SAMPLE_RATE) -> None:
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno > logging.DEBUG or random.random() < self.rate
+
+
+class LogFormatter(logging.Formatter):
+
+    def __init__(self, fmt=None, datefmt=None, style='%', output=None) -> None:
+        super().__init__(fmt=fmt, datefmt=datefmt, style=style)
+        self.output = output or LOGGER_FORMAT
 
     def formatException(self, ei):
         value = super().formatException(ei)
         return value.replace('\n', '\r')
 
+    def message(self, record: logging.LogRecord) -> str:
+        # Arguments are Summarized Only When the Record is Actually Emitted
+        msg = record.msg if isinstance(record.msg, str) else str(summarize(record.msg))
+        if record.args:
+            args = record.args
+            if isinstance(args, dict):
+                args = summarize(args)
+            else:
+                args = tuple(summarize(arg) for arg in args)
+            try:
+                msg = msg % args
+            except (TypeError, ValueError):
+                msg = f'{msg} {args}'
+        return truncate(msg)
+
+    def format(self, record: logging.LogRecord) -> str:
+        message = self.message(record)
+        if self.output != 'json':
+            record = logging.makeLogRecord(dict(record.__dict__, msg=message, args=None))
+            return super().format(record)
+        output = {
+            'time': self.formatTime(record, self.datefmt),
+            'level': record.levelname,
+            'logger': record.name,
+            'line': record.lineno,
+            'message': message
+        }
+        if record.exc_info:
+            output['exception'] = self.formatException(record.exc_info)
+        return json.dumps(output, default=str)
+
 
 def set_formatter(logger):
     if not logger.hasHandlers():
@@ -36,6 +120,8 @@ def set_formatter(logger):
     for handler in logger.handlers + logger.parent.handlers:
         fmt = handler.formatter._fmt if handler.formatter else None
         handler.setFormatter(LogFormatter(fmt=fmt))
+        if not any(isinstance(item, DebugSampler) for item in handler.filters):
+            handler.addFilter(DebugSampler())
 
 
 def get_logger(name, level=None):
@@ -0,0 +1,79 @@
+"""
+Copyright 2021-present Airbnb, Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import asyncio
+from typing import Dict, List, Sequence
+
+from .logger import get_logger
+
+LOGGER = get_logger(__name__)
+
+# Management Plane Ports (HTTPS/SSH)
+MANAGEMENT_PORTS = (443, 22)
+
+
+async def _probe_port(hostname: str, port: int, timeout: float) -> bool:
+    try:
+        _, writer = await asyncio.wait_for(
+            asyncio.open_connection(hostname, port), timeout=timeout)
+    except (OSError, asyncio.TimeoutError):
+        return False
+    writer.close()
+    try:
+        await writer.wait_closed()
+    except OSError:
+        pass
+    return True
+
+
+async def _probe_host(hostname: str, ports: Sequence[int], timeout: float) -> bool:
+    # Host is Reachable as Soon as Any Management Port Accepts a Connection
+    probes = [asyncio.ensure_future(_probe_port(hostname, port, timeout))
+              for port in ports]
+    try:
+        for probe in asyncio.as_completed(probes):
+            if await probe:
+                return True
+        return False
+    finally:
+        for probe in probes:
+            probe.cancel()
+
+
+async def probe_hosts(hostnames: List[str], ports: Sequence[int] = MANAGEMENT_PORTS, timeout: float = 5) -> Dict[str, bool]:
+    """
+    Concurrently open TCP connections to the management ports of each host.
+
+    Args:
+        hostnames (List[str]): Fully Qualified Domain Names (FQDN) to probe.
+        ports (Sequence[int]): Ports to attempt on each host.
+        timeout (float): Seconds to wait for each connection attempt.
+
+    Returns:
+        Dict[str, bool]: Mapping of hostname to reachability.
+    """
+    unique_hostnames = list(dict.fromkeys(hostnames))
+    results = await asyncio.gather(
+        *[_probe_host(hostname, ports, timeout) for hostname in unique_hostnames])
+    return dict(zip(unique_hostnames, results))
+
+
+def check_reachability(hostnames: List[str], ports: Sequence[int] = MANAGEMENT_PORTS, timeout: float = 5) -> Dict[str, bool]:
+    """Blocking wrapper around probe_hosts() for synchronous callers."""
+    results = asyncio.run(probe_hosts(hostnames, ports, timeout))
+    for hostname, reachable in results.items():
+        LOGGER.debug('Reachability %s %s: %s', hostname, list(ports), reachable)
+    return results
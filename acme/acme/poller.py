@@ -0,0 +1,87 @@
+"""
+Copyright 2021-present Airbnb, Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import re
+import time
+from typing import Callable, Dict, Iterator, NamedTuple, Optional
+
+from .exceptions import JobTimeoutError
+from .logger import get_logger
+
+LOGGER = get_logger(__name__)
+
+PROGRESS_PATTERN = re.compile(r'<progress>\s*(\d{1,3})\s*</progress>|(\d{1,3})\s*%')
+
+
+class JobStatus(NamedTuple):
+    """Single observation of a device job."""
+    done: bool
+    status: Optional[str] = None
+    result: Optional[str] = None
+    progress: Optional[int] = None
+    details: Optional[Dict[str, str]] = None
+
+
+def backoff(initial: float, factor: float, maximum: float) -> Iterator[float]:
+    interval = initial
+    while True:
+        yield interval
+        interval = min(interval * factor, maximum)
+
+
+def parse_progress(output: str) -> Optional[int]:
+    """Progress percentage from a job response (<progress>NN</progress> or NN%)."""
+    match = PROGRESS_PATTERN.search(output or '')
+    if match is None:
+        return None
+    return min(int(match.group(1) or match.group(2)), 100)
+
+
+def poll_job(check: Callable[[], JobStatus], name: str = 'Job', initial: float = 1, factor: float = 2, maximum: float = 30, timeout: float = 1800) -> JobStatus:
+    """
+    Call check() until the job is done, backing off exponentially from
+    initial to maximum seconds. While progress is reported, the next poll is
+    brought forward to the estimated completion time.
+
+    Args:
+        check (Callable[[], JobStatus]): Queries the device for job state.
+        name (str): Job description for log messages.
+        initial (float): First polling interval in seconds.
+        factor (float): Backoff multiplier.
+        maximum (float): Polling interval cap in seconds.
+        timeout (float): Overall deadline in seconds.
+
+    Raises:
+        JobTimeoutError: Job not done before the deadline.
+    """
+    start = time.monotonic()
+    deadline = start + timeout
+    progress = None
+    for interval in backoff(initial, factor, maximum):
+        status = check()
+        if status.progress != progress or status.done:
+            LOGGER.info('%s %s (%s%%)', name, status.status, status.progress)
+            progress = status.progress
+        if status.done:
+            LOGGER.info('%s Finished in %.1fs: %s', name, time.monotonic() - start, status.result)
+            return status
+        elapsed = time.monotonic() - start
+        if progress and 0 < progress < 100:
+            remaining = elapsed * (100 - progress) / progress
+            interval = max(initial, min(interval, remaining))
+        if elapsed + interval > timeout:
+            raise JobTimeoutError(f'{name} Not Finished After {timeout}s: {status.status}')
+        time.sleep(min(interval, max(deadline - time.monotonic(), 0)))
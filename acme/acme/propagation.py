@@ -0,0 +1,118 @@
+"""
+Copyright 2021-present Airbnb, Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import socket
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Set
+
+import dns.exception
+import dns.flags
+import dns.message
+import dns.query
+import dns.rdatatype
+
+from .exceptions import DNSPropagationError
+from .logger import get_logger
+from .poller import backoff
+
+LOGGER = get_logger(__name__)
+
+
+def wait_for_change(client, change_id: str, initial: float = 1, maximum: float = 10, timeout: float = 300) -> None:
+    """
+    Poll Route53 GetChange with backoff until the change is INSYNC instead
+    of the boto3 waiter's fixed 30 second delay.
+    """
+    deadline = time.monotonic() + timeout
+    for interval in backoff(initial, 2, maximum):
+        status = client.get_change(Id=change_id)['ChangeInfo']['Status']
+        if status == 'INSYNC':
+            return
+        if time.monotonic() + interval > deadline:
+            raise DNSPropagationError(f'Route53 Change {change_id} Not INSYNC: {status}')
+        time.sleep(interval)
+
+
+def get_authoritative_nameservers(client, hosted_zone_id: str) -> List[str]:
+    """
+    IP addresses of the name servers Route53 delegated the zone to. Private
+    hosted zones have no delegation set and return an empty list.
+    """
+    response = client.get_hosted_zone(Id=hosted_zone_id)
+    if response['HostedZone'].get('Config', {}).get('PrivateZone'):
+        return []
+    nameservers = response.get('DelegationSet', {}).get('NameServers', [])
+    addresses = []
+    for nameserver in nameservers:
+        try:
+            addresses.append(socket.gethostbyname(nameserver))
+        except OSError as error:
+            LOGGER.warning('Unable to Resolve Name Server %s: %s', nameserver, error)
+    return addresses
+
+
+def query_txt(nameserver: str, record_name: str, timeout: float = 2) -> Set[str]:
+    """TXT values for record_name as answered directly by nameserver."""
+    query = dns.message.make_query(record_name, dns.rdatatype.TXT)
+    try:
+        response = dns.query.udp(query, nameserver, timeout=timeout)
+        if response.flags & dns.flags.TC:
+            response = dns.query.tcp(query, nameserver, timeout=timeout)
+    except (dns.exception.DNSException, OSError) as error:
+        LOGGER.debug('TXT Query %s @%s Failed: %s', record_name, nameserver, error)
+        return set()
+    values = set()
+    for rrset in response.answer:
+        if rrset.rdtype != dns.rdatatype.TXT:
+            continue
+        for rdata in rrset:
+            values.add(b''.join(rdata.strings).decode('ascii'))
+    return values
+
+
+def wait_for_txt_propagation(record_name: str, values: List[str], nameservers: List[str], initial: float = 0.5, maximum: float = 5, timeout: float = 120, query_timeout: float = 2) -> None:
+    """
+    Poll every authoritative name server concurrently with backoff and
+    return as soon as each one serves all challenge values.
+
+    Args:
+        record_name (str): Fully qualified TXT record name.
+        values (List[str]): Challenge values that must all be visible.
+        nameservers (List[str]): Name server IP addresses to query.
+        initial (float): First backoff interval in seconds.
+        maximum (float): Backoff interval cap in seconds.
+        timeout (float): Overall deadline in seconds.
+        query_timeout (float): Per query timeout in seconds.
+    """
+    expected = set(values)
+    pending = list(nameservers)
+    if not pending:
+        return
+    deadline = time.monotonic() + timeout
+    with ThreadPoolExecutor(max_workers=len(pending)) as executor:
+        for interval in backoff(initial, 2, maximum):
+            answers = executor.map(
+                lambda nameserver: query_txt(nameserver, record_name, query_timeout), pending)
+            pending = [nameserver for nameserver, answer in zip(pending, list(answers))
+                       if not expected.issubset(answer)]
+            if not pending:
+                LOGGER.info('TXT %s Visible on All Authoritative Name Servers', record_name)
+                return
+            if time.monotonic() + interval > deadline:
+                raise DNSPropagationError(
+                    f'TXT {record_name} Not Visible on {", ".join(pending)}')
+            time.sleep(interval)
@@ -0,0 +1,183 @@
+"""
+Copyright 2021-present Airbnb, Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import functools
+import os
+import random
+import threading
+import time
+from typing import Callable, Dict, Iterator, Optional, TypeVar
+
+from botocore.exceptions import ClientError
+
+from .logger import get_logger
+from .poller import backoff
+
+LOGGER = get_logger(__name__)
+
+T = TypeVar('T')
+
+# Account-Wide Requests per Second (OTTR_<SERVICE>_RATE) Split Across the
+# Rotations Step Functions Runs at Once (Map MaxConcurrency)
+DEFAULT_ACCOUNT_RATE = 20.0
+CONCURRENCY = int(os.environ.get('OTTR_CONCURRENCY', '50'))
+DEFAULT_CAPACITY = 5.0
+
+THROTTLING_ERRORS = frozenset([
+    'Throttling',
+    'ThrottlingException',
+    'ThrottledException',
+    'RequestLimitExceeded',
+    'TooManyRequestsException'
+])
+
+_LOCK = threading.Lock()
+_BUCKETS: Dict[str, 'TokenBucket'] = {}
+
+
+class TokenBucket:
+    """Thread-safe token bucket refilled at rate tokens per second up to capacity."""
+
+    def __init__(self, rate: float, capacity: float = DEFAULT_CAPACITY) -> None:
+        if rate <= 0:
+            raise ValueError(f'Rate Must be Positive: {rate}')
+        self.rate = rate
+        self.capacity = max(capacity, 1)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: float = 1) -> float:
+        """Block until tokens are available and return the seconds waited."""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return waited
+                delay = (tokens - self.tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+def jittered_backoff(initial: float, factor: float, maximum: float) -> Iterator[float]:
+    """Full jitter: uniform(0, interval) over exponential backoff."""
+    for interval in backoff(initial, factor, maximum):
+        yield random.uniform(0, interval)
+
+
+def call_with_backoff(call: Callable[[], T], bucket: Optional[TokenBucket] = None, retries: int = 5, initial: float = 0.5, maximum: float = 20, name: str = 'Request') -> T:
+    """
+    Run call() once a token is available, retrying throttling errors with
+    jittered exponential backoff at most retries times.
+
+    Raises:
+        ClientError: Non-throttling error, or throttled after every retry.
+    """
+    delays = jittered_backoff(initial, 2, maximum)
+    for attempt in range(retries + 1):
+        if bucket is not None:
+            bucket.acquire()
+        try:
+            return call()
+        except ClientError as error:
+            code = error.response.get('Error', {}).get('Code')
+            if code not in THROTTLING_ERRORS or attempt == retries:
+                raise
+            delay = next(delays)
+            LOGGER.warning('%s Throttled (%s), Retrying in %.2fs [%s/%s]',
+                           name, code, delay, attempt + 1, retries)
+            time.sleep(delay)
+
+
+def get_rate_limiter(name: str, rate: Optional[float] = None, capacity: float = DEFAULT_CAPACITY) -> TokenBucket:
+    """
+    Process-wide TokenBucket for name (i.e. ssm). The default rate is this
+    task's share of OTTR_<NAME>_RATE across OTTR_CONCURRENCY rotations.
+    """
+    with _LOCK:
+        bucket = _BUCKETS.get(name)
+        if bucket is None:
+            if rate is None:
+                account_rate = float(os.environ.get(f'OTTR_{name.upper()}_RATE', DEFAULT_ACCOUNT_RATE))
+                rate = account_rate / max(CONCURRENCY, 1)
+            bucket = _BUCKETS[name] = TokenBucket(rate, capacity)
+        return bucket
+
+
+class RateLimitedPaginator:
+    """
+    Paginator proxy taking a token from the shared TokenBucket before each
+    page. A page iterator cannot resume after an error, so throttling on a
+    page is left to botocore's own retries.
+    """
+
+    def __init__(self, paginator, bucket: TokenBucket) -> None:
+        self.paginator = paginator
+        self.bucket = bucket
+
+    def paginate(self, **kwargs) -> Iterator[dict]:
+        pages = iter(self.paginator.paginate(**kwargs))
+        while True:
+            self.bucket.acquire()
+            try:
+                page = next(pages)
+            except StopIteration:
+                return
+            yield page
+
+
+class RateLimitedClient:
+    """
+    boto3 client proxy sending every API operation and paginated page
+    through a shared TokenBucket, with jittered backoff on throttling for
+    operations. Other attributes (meta, exceptions, waiters) pass through
+    unchanged, so waiters are not rate limited.
+    """
+
+    def __init__(self, client, bucket: TokenBucket, retries: int = 5) -> None:
+        self.client = client
+        self.bucket = bucket
+        self.retries = retries
+
+    def get_paginator(self, operation_name: str) -> RateLimitedPaginator:
+        return RateLimitedPaginator(self.client.get_paginator(operation_name), self.bucket)
+
+    def __getattr__(self, name: str):
+        attribute = getattr(self.client, name)
+        if name not in self.client.meta.method_to_api_mapping:
+            return attribute
+        operation = self.client.meta.method_to_api_mapping[name]
+
+        @functools.wraps(attribute)
+        def call(*args, **kwargs):
+            return call_with_backoff(lambda: attribute(*args, **kwargs), self.bucket,
+                                     self.retries, name=operation)
+        return call
+
+
+def rate_limited(client, name: Optional[str] = None, retries: int = 5) -> RateLimitedClient:
+    """
+    Args:
+        client: boto3 client (i.e. acme.get_client('ssm')).
+        name (str): Rate limiter name, defaults to the client service name.
+        retries (int): Throttling retries after botocore's own.
+    """
+    name = name or client.meta.service_model.service_name
+    return RateLimitedClient(client, get_rate_limiter(name), retries)
@@ -1,39 +1,87 @@
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
-from typing import Dict, Optional
+from typing import Dict, Optional, Tuple, Union
 
 from .decorator import http_exception
 
+# Connect/Read Timeout (Seconds)
+DEFAULT_TIMEOUT = (5, 60)
+
+
+def _retry(retries: int, backoff_factor: float) -> Retry:
+    # Only Connection Failures are Retried: the Request Never Reached the
+    # Device. PAN-OS Sends Commits and Config Changes as GET, so Read
+    # Timeouts and 5xx Responses are Never Replayed
+    return Retry(total=retries, connect=retries, read=0, status=0, other=0,
+                 backoff_factor=backoff_factor, raise_on_status=False)
+
 
 class Request:
-    def __init__(self, validation: str) -> None:
-        self._requester_base = requests
+    """
+    HTTP client for device APIs backed by a keep-alive requests.Session.
+    Connection errors are retried with backoff for every method; read
+    errors and 5xx responses are returned or raised, never replayed.
+    """
+
+    def __init__(self, validation: str, timeout: Union[float, Tuple[float, float]] = DEFAULT_TIMEOUT, retries: int = 3, backoff_factor: float = 0.5, pool_maxsize: int = 10) -> None:
         self.validation = validation
+        self.timeout = timeout
+        self._session = requests.Session()
+        self._session.verify = validation != 'False'
+        self._adapter = HTTPAdapter(
+            pool_connections=4, pool_maxsize=pool_maxsize,
+            max_retries=_retry(retries, backoff_factor))
+        self._session.mount('https://', self._adapter)
+        self._session.mount('http://', self._adapter)
+
+    def __enter__(self) -> 'Request':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._session.close()
+
+    def connection_stats(self) -> Dict[str, int]:
+        """Requests sent, TCP/TLS connections opened and connections reused."""
+        pools = self._adapter.poolmanager.pools
+        connections = requests_sent = 0
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            connections += pool.num_connections
+            requests_sent += pool.num_requests
+        return {
+            'requests': requests_sent,
+            'connections': connections,
+            'reused': max(requests_sent - connections, 0)
+        }
+
+    @http_exception
+    def get(self, url: str, headers: Optional[Dict] = None, query_params: Optional[Dict] = None, timeout=None, stream: bool = False):
+        return self._session.get(url, headers=headers, params=query_params,
+                                 timeout=timeout or self.timeout, stream=stream)
 
     @http_exception
-    def get(self, url: str, headers: Dict = {}, query_params: Dict = {}):
-        if self.validation == 'False':
-            return self._requester_base.get(url, headers=headers, params=query_params, verify=False)
-        else:
-            return self._requester_base.get(url, headers=headers, params=query_params)
+    def post(self, url: str, files: Optional[Dict] = None, headers: Optional[Dict] = None, data: Optional[Dict] = None, timeout=None):
+        return self._session.post(url, files=files, headers=headers, data=data,
+                                  timeout=timeout or self.timeout)
 
     @http_exception
-    def post(self, url: str, files: Optional[Dict] = {}, headers: Dict = {}, data: Dict = {}):
-        if self.validation == 'False':
-            return self._requester_base.post(url, files=files, headers=headers, data=data, verify=False)
-        else:
-            return self._requester_base.post(url, files=files, headers=headers, data=data)
+    def put(self, url: str, headers: Optional[Dict] = None, data: Optional[Dict] = None, timeout=None):
+        return self._session.put(url, headers=headers, data=data,
+                                 timeout=timeout or self.timeout)
 
     @http_exception
-    def put(self, url: str, headers: Dict = {}, data: Dict = {}):
-        if self.validation == 'False':
-            return self._requester_base.put(url, headers=headers, data=data, verify=False)
-        else:
-            return self._requester_base.put(url, headers=headers, data=data)
+    def patch(self, url: str, headers: Optional[Dict] = None, data: Optional[Dict] = None, timeout=None):
+        return self._session.patch(url, headers=headers, data=data,
+                                   timeout=timeout or self.timeout)
 
     @http_exception
-    def delete(self, url: str, headers: Dict = {}):
-        if self.validation == 'False':
-            return self._requester_base.delete(url, headers=headers, verify=False)
-        else:
-            return self._requester_base.delete(url, headers=headers)
+    def delete(self, url: str, headers: Optional[Dict] = None, timeout=None):
+        return self._session.delete(url, headers=headers,
+                                    timeout=timeout or self.timeout)
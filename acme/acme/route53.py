@@ -0,0 +1,182 @@
+"""
+Copyright 2021-present Airbnb, Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List
+
+import tldextract
+
+from .aws import get_client
+from .logger import get_logger
+from .propagation import (
+    get_authoritative_nameservers,
+    wait_for_change,
+    wait_for_txt_propagation
+)
+
+LOGGER = get_logger(__name__)
+
+
+def _fqdn(name: str) -> str:
+    return name.rstrip('.').lower() + '.'
+
+
+def get_hosted_zone_id(client, domain: str) -> str:
+    """
+    Resolve the Route53 Hosted Zone ID for a registered domain.
+
+    Args:
+        client: boto3 Route53 client.
+        domain (str): Registered domain (i.e. example.com).
+
+    Returns:
+        str: Hosted Zone ID without the /hostedzone/ prefix.
+    """
+    hosted_zones = client.list_hosted_zones_by_name(
+        DNSName=_fqdn(domain),
+        MaxItems='1'
+    )['HostedZones']
+    if not hosted_zones or hosted_zones[0]['Name'] != _fqdn(domain):
+        raise KeyError(f'HOSTED_ZONE_ID Not Found for {domain}')
+    return hosted_zones[0]['Id'].split('/')[-1]
+
+
+def get_hosted_zone_ids(client, hostnames: Iterable[str]) -> Dict[str, str]:
+    """
+    Resolve each distinct registered domain of hostnames exactly once;
+    domains without a hosted zone are logged and left out.
+    """
+    domains = {tldextract.extract(hostname).registered_domain
+               for hostname in hostnames}
+    hosted_zone_ids = {}
+    for domain in domains:
+        try:
+            hosted_zone_ids[domain] = get_hosted_zone_id(client, domain)
+        except KeyError as error:
+            LOGGER.warning(error.args[0])
+    return hosted_zone_ids
+
+
+def query_acme_challenge_record(client, hostname: str, hosted_zone_id: str, record_type: str = 'CNAME') -> bool:
+    """
+    Look up _acme-challenge.[hostname] directly by record name and type
+    rather than paginating through every record set in the zone.
+    """
+    record_name = _fqdn(f'_acme-challenge.{hostname}')
+    try:
+        response = client.list_resource_record_sets(
+            HostedZoneId=hosted_zone_id,
+            StartRecordName=record_name,
+            StartRecordType=record_type,
+            MaxItems='1'
+        )
+    except Exception:
+        raise KeyError('HOSTED_ZONE_ID Invalid')
+    for record in response['ResourceRecordSets']:
+        if _fqdn(record['Name']) == record_name and record['Type'] == record_type:
+            return True
+    return False
+
+
+def validate_acme_challenge_records(hostnames: List[str], max_workers: int = 10, client=None) -> Dict[str, bool]:
+    """
+    Concurrently validate that each hostname has an _acme-challenge CNAME
+    delegating DNS-01 validation to the subdelegate zone.
+
+    Args:
+        hostnames (List[str]): Subject Alternative Names (SANs) to validate.
+        max_workers (int): Maximum number of concurrent Route53 lookups.
+        client: Optional boto3 Route53 client.
+
+    Returns:
+        Dict[str, bool]: Mapping of hostname to whether a record exists,
+            False when the registered domain has no hosted zone.
+    """
+    if client is None:
+        client = get_client('route53')
+    hostnames = list(dict.fromkeys(hostnames))
+    if not hostnames:
+        return {}
+    hosted_zone_ids = get_hosted_zone_ids(client, hostnames)
+
+    def lookup(hostname: str) -> bool:
+        domain = tldextract.extract(hostname).registered_domain
+        if domain not in hosted_zone_ids:
+            return False
+        return query_acme_challenge_record(
+            client, hostname, hosted_zone_ids[domain])
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(hostnames))) as executor:
+        results = list(executor.map(lookup, hostnames))
+    return dict(zip(hostnames, results))
+
+
+class ChallengeRecord:
+    """
+    DNS-01 TXT record within the subdelegate zone. Every identifier on an
+    order shares the challenge alias, so all key authorization digests are
+    published as values of a single record set in one change batch.
+    """
+
+    def __init__(self, subdelegate: str, alias: str, client=None, ttl: int = 60) -> None:
+        self._client = client if client is not None else get_client('route53')
+        self.record_name = _fqdn(f'_acme-challenge.{alias}')
+        self.hosted_zone_id = get_hosted_zone_id(self._client, subdelegate)
+        self.ttl = ttl
+        self.values: List[str] = []
+
+    def _change(self, action: str, values: List[str]) -> str:
+        response = self._client.change_resource_record_sets(
+            HostedZoneId=self.hosted_zone_id,
+            ChangeBatch={
+                'Comment': 'Otter DNS-01 Challenge',
+                'Changes': [{
+                    'Action': action,
+                    'ResourceRecordSet': {
+                        'Name': self.record_name,
+                        'Type': 'TXT',
+                        'TTL': self.ttl,
+                        'ResourceRecords': [{'Value': f'"{value}"'} for value in values]
+                    }
+                }]
+            }
+        )
+        return response['ChangeInfo']['Id']
+
+    def publish(self, values: List[str]) -> str:
+        """
+        UPSERT all challenge values, wait for the change to be INSYNC and for
+        the zone's authoritative name servers to serve every value.
+        """
+        self.values = list(dict.fromkeys(values))
+        change_id = self._change('UPSERT', self.values)
+        wait_for_change(self._client, change_id)
+        wait_for_txt_propagation(
+            self.record_name, self.values,
+            get_authoritative_nameservers(self._client, self.hosted_zone_id))
+        LOGGER.info('Published %s Challenge Values to %s',
+                    len(self.values), self.record_name)
+        return change_id
+
+    def remove(self) -> None:
+        if not self.values:
+            return
+        try:
+            self._change('DELETE', self.values)
+        except Exception as error:
+            LOGGER.warning('Challenge Record Cleanup Failed %s: %s',
+                           self.record_name, error)
+        self.values = []
@@ -0,0 +1,120 @@
+"""
+Copyright 2021-present Airbnb, Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+from .aws import get_client
+from .logger import get_logger
+from .ratelimit import rate_limited
+
+LOGGER = get_logger(__name__)
+
+INSTANCE_INDEX_TTL = float(os.environ.get('OTTR_SSM_INDEX_TTL', '900'))
+INSTANCE_RESOURCE_TYPES = ['ec2:instance', 'ssm:managed-instance']
+
+
+class InstanceIndex:
+    """
+    Name tag to SSM managed instance lookups. lookup_many() resolves every
+    name (i.e. a system name and its SANs) from an index built by one
+    paginated sweep of describe_instance_information and one of the tagging
+    API (Name tags, which instance information omits), cached for ttl
+    seconds. lookup() uses the index when fresh, otherwise one filtered call.
+    """
+
+    def __init__(self, ssm_client=None, tagging_client=None, ttl: float = INSTANCE_INDEX_TTL) -> None:
+        self.ssm_client = ssm_client or rate_limited(get_client('ssm'), 'ssm')
+        self.tagging_client = tagging_client or rate_limited(
+            get_client('resourcegroupstaggingapi'), 'tagging')
+        self.ttl = ttl
+        self._index: Optional[Dict[str, List[dict]]] = None
+        self._expires = 0.0
+        self._lock = threading.Lock()
+
+    def _instance_information(self, **kwargs) -> List[dict]:
+        kwargs['MaxResults'] = 50
+        instances = []
+        while True:
+            response = self.ssm_client.describe_instance_information(**kwargs)
+            instances.extend(response['InstanceInformationList'])
+            if not response.get('NextToken'):
+                return instances
+            kwargs['NextToken'] = response['NextToken']
+
+    def _name_tags(self) -> Dict[str, str]:
+        names = {}
+        paginator = self.tagging_client.get_paginator('get_resources')
+        for page in paginator.paginate(TagFilters=[{'Key': 'Name'}],
+                                       ResourceTypeFilters=INSTANCE_RESOURCE_TYPES):
+            for resource in page['ResourceTagMappingList']:
+                # arn:aws:ec2:...:instance/i-... or arn:aws:ssm:...:managed-instance/mi-...
+                instance_id = resource['ResourceARN'].rsplit('/', 1)[-1]
+                for tag in resource.get('Tags', []):
+                    if tag['Key'] == 'Name':
+                        names[instance_id] = tag['Value']
+        return names
+
+    def _fresh(self) -> bool:
+        return self._index is not None and time.monotonic() < self._expires
+
+    def refresh(self) -> None:
+        start = time.monotonic()
+        names = self._name_tags()
+        index: Dict[str, List[dict]] = {}
+        instances = self._instance_information()
+        for instance in instances:
+            name = names.get(instance['InstanceId'])
+            if name is not None:
+                index.setdefault(name, []).append(instance)
+        self._index = index
+        self._expires = time.monotonic() + self.ttl
+        LOGGER.info('Indexed %s Managed Instances (%s Named) in %.2fs',
+                    len(instances), sum(len(items) for items in index.values()),
+                    time.monotonic() - start)
+
+    def lookup(self, name: str) -> List[dict]:
+        """InstanceInformation of every managed instance whose Name tag is name."""
+        with self._lock:
+            if self._fresh():
+                return list(self._index.get(name, []))
+        return self._instance_information(Filters=[{'Key': 'tag:Name', 'Values': [name]}])
+
+    def lookup_many(self, names: List[str]) -> Dict[str, List[dict]]:
+        """InstanceInformation per Name tag, every name served by one (cached) sweep."""
+        with self._lock:
+            if not self._fresh():
+                self.refresh()
+            return {name: list(self._index.get(name, [])) for name in dict.fromkeys(names)}
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._index = None
+
+
+_INDEX: Optional[InstanceIndex] = None
+_INDEX_LOCK = threading.Lock()
+
+
+def get_instance_index(ssm_client=None) -> InstanceIndex:
+    """Process-wide InstanceIndex shared by every lookup in a process."""
+    global _INDEX
+    with _INDEX_LOCK:
+        if _INDEX is None:
+            _INDEX = InstanceIndex(ssm_client)
+        return _INDEX
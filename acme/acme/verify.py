@@ -0,0 +1,179 @@
+"""
+Copyright 2021-present Airbnb, Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import asyncio
+import ssl
+from datetime import timezone
+from typing import List, NamedTuple, Optional, Sequence, Tuple
+
+from cryptography import x509
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import hashes
+from cryptography.x509.oid import NameOID
+
+from .logger import get_logger
+from .poller import JobStatus, poll_job
+
+LOGGER = get_logger(__name__)
+
+PEM_END = b'-----END CERTIFICATE-----'
+
+
+class EndpointCertificate(NamedTuple):
+    """Certificate served by hostname:port for the requested SNI server_name."""
+    hostname: str
+    server_name: str
+    port: int
+    expiration: Optional[str] = None
+    issuer: Optional[str] = None
+    fingerprint: Optional[str] = None
+    error: Optional[str] = None
+
+    @property
+    def valid(self) -> bool:
+        return self.error is None
+
+
+def _client_context() -> ssl.SSLContext:
+    # Inspect Whatever is Served; Trust is Decided by the Caller
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+    context.check_hostname = False
+    context.verify_mode = ssl.CERT_NONE
+    return context
+
+
+def decode_certificate(der: bytes) -> Tuple[str, str, str]:
+    """
+    Decode a DER certificate.
+
+    Returns:
+        Tuple[str, str, str]: Expiration (UTC ISO 8601), issuer organization
+        and SHA-256 fingerprint (hex).
+    """
+    certificate = x509.load_der_x509_certificate(der, default_backend())
+    not_valid_after = getattr(certificate, 'not_valid_after_utc', None)
+    if not_valid_after is None:
+        not_valid_after = certificate.not_valid_after
+    else:
+        not_valid_after = not_valid_after.astimezone(timezone.utc).replace(tzinfo=None)
+    organization = certificate.issuer.get_attributes_for_oid(NameOID.ORGANIZATION_NAME)
+    issuer = organization[0].value if organization else None
+    fingerprint = certificate.fingerprint(hashes.SHA256()).hex()
+    return not_valid_after.isoformat(), issuer, fingerprint
+
+
+async def fetch_certificate(hostname: str, server_name: str, port: int = 443, timeout: float = 5, context: Optional[ssl.SSLContext] = None) -> bytes:
+    """DER certificate from a TLS handshake bounded by timeout seconds."""
+    _, writer = await asyncio.wait_for(
+        asyncio.open_connection(hostname, port, ssl=context or _client_context(),
+                                server_hostname=server_name, ssl_handshake_timeout=timeout),
+        timeout=timeout)
+    try:
+        return writer.get_extra_info('ssl_object').getpeercert(binary_form=True)
+    finally:
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except (OSError, ssl.SSLError):
+            pass
+
+
+async def verify_endpoint(hostname: str, server_name: str, port: int = 443, timeout: float = 5, context: Optional[ssl.SSLContext] = None) -> EndpointCertificate:
+    try:
+        der = await fetch_certificate(hostname, server_name, port, timeout, context)
+        expiration, issuer, fingerprint = decode_certificate(der)
+    except asyncio.TimeoutError:
+        return EndpointCertificate(hostname, server_name, port, error='Timeout')
+    except (OSError, ssl.SSLError, ValueError) as error:
+        return EndpointCertificate(hostname, server_name, port, error=str(error) or type(error).__name__)
+    return EndpointCertificate(hostname, server_name, port, expiration, issuer, fingerprint)
+
+
+async def verify_endpoints(endpoints: Sequence[Tuple[str, str]], port: int = 443, timeout: float = 5) -> List[EndpointCertificate]:
+    """
+    Concurrently handshake with each (hostname, server_name) endpoint.
+
+    Args:
+        endpoints (Sequence[Tuple[str, str]]): Address to connect to and SNI name.
+        port (int): TLS port.
+        timeout (float): Seconds allowed for connect and handshake per endpoint.
+
+    Returns:
+        List[EndpointCertificate]: Results in the order of endpoints.
+    """
+    context = _client_context()
+    unique_endpoints = list(dict.fromkeys(endpoints))
+    return list(await asyncio.gather(
+        *[verify_endpoint(hostname, server_name, port, timeout, context)
+          for hostname, server_name in unique_endpoints]))
+
+
+def verify_certificates(system_name: str, common_name: str, subject_alternative_names: Optional[List[str]] = None, port: int = 443, timeout: float = 5) -> List[EndpointCertificate]:
+    """
+    Blocking verification of the device endpoint (SNI common_name) and every
+    SAN (SNI set to the SAN itself). The device endpoint is always first.
+    """
+    endpoints = [(system_name, common_name)]
+    endpoints.extend((name, name) for name in subject_alternative_names or [])
+    results = asyncio.run(verify_endpoints(endpoints, port, timeout))
+    for result in results:
+        if result.valid:
+            LOGGER.info('%s (SNI %s): Expires %s, Issuer %s, SHA-256 %s', result.hostname,
+                        result.server_name, result.expiration, result.issuer, result.fingerprint)
+        else:
+            LOGGER.warning('%s (SNI %s): %s', result.hostname, result.server_name, result.error)
+    return results
+
+
+def certificate_fingerprint(path: str) -> str:
+    """SHA-256 fingerprint (hex) of the leaf, the first certificate in a PEM file or chain."""
+    with open(path, 'rb') as file:
+        data = file.read()
+    end = data.index(PEM_END) + len(PEM_END)
+    certificate = x509.load_pem_x509_certificate(data[:end], default_backend())
+    return certificate.fingerprint(hashes.SHA256()).hex()
+
+
+def wait_for_certificate(hostname: str, server_name: str, fingerprint: str, port: int = 443, timeout: float = 5, initial: float = 1, maximum: float = 10, deadline: float = 300) -> EndpointCertificate:
+    """
+    Poll hostname:port (SNI server_name) with backoff until the served
+    certificate matches fingerprint, i.e. once a web server has reloaded,
+    instead of sleeping for a fixed settle time.
+
+    Args:
+        hostname (str): Address to connect to.
+        server_name (str): SNI name.
+        fingerprint (str): Expected SHA-256 fingerprint (hex), see certificate_fingerprint.
+        port (int): TLS port.
+        timeout (float): Per attempt connect and handshake timeout in seconds.
+        initial (float): First polling interval in seconds.
+        maximum (float): Polling interval cap in seconds.
+        deadline (float): Overall deadline in seconds.
+
+    Raises:
+        JobTimeoutError: Certificate not served before the deadline.
+    """
+    served = []
+
+    def check() -> JobStatus:
+        endpoint = asyncio.run(verify_endpoint(hostname, server_name, port, timeout))
+        served.append(endpoint)
+        status = endpoint.error or f'Serving {endpoint.fingerprint[:16]}'
+        return JobStatus(done=endpoint.fingerprint == fingerprint, status=status)
+
+    poll_job(check, name=f'Certificate on {hostname}', initial=initial,
+             maximum=maximum, timeout=deadline)
+    return served[-1]
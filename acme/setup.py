@@ -6,16 +6,19 @@ with open("README.md", "r") as fh:
 setup(
     name='ottr-airbnb',
     packages=['acme'],
-    version='0.0.3',
+    version='0.0.4',
     author="Kenneth Yang",
     author_email="kenneth.yang@airbnb.com",
     description='Ottr ACME Client Python Wrapper',
     url="https://github.com/airbnb/ottr/acme",
     install_requires=[
+        "aiohttp",
         "boto3",
         "botocore",
+        "cryptography",
+        "dnspython",
         "pyOpenSSL",
-        "python-nmap",
+        "requests",
         "tldextract==3.1.0"
     ],
     extras_require={
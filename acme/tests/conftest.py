@@ -341,4 +341,92 @@ definition: str = Template(
 	}
 }
 """
-)
\ No newline at end of file
+)
+
+def _self_signed_certificate(common_name, organization, days):
+    from datetime import datetime, timedelta
+    from cryptography import x509
+    from cryptography.hazmat.backends import default_backend
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import ec
+    from cryptography.x509.oid import NameOID
+
+    key = ec.generate_private_key(ec.SECP256R1(), default_backend())
+    name = x509.Name([
+        x509.NameAttribute(NameOID.COMMON_NAME, common_name),
+        x509.NameAttribute(NameOID.ORGANIZATION_NAME, organization)])
+    now = datetime.utcnow().replace(microsecond=0)
+    certificate = x509.CertificateBuilder().subject_name(name).issuer_name(name) \
+        .public_key(key.public_key()).serial_number(x509.random_serial_number()) \
+        .not_valid_before(now - timedelta(days=1)).not_valid_after(now + timedelta(days=days)) \
+        .sign(key, hashes.SHA256(), default_backend())
+    return (certificate.public_bytes(serialization.Encoding.PEM),
+            key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                              serialization.NoEncryption()),
+            certificate)
+
+
+@pytest.fixture
+def tls_server(tmp_path):
+    """TLS listener on 127.0.0.1 serving a certificate per SNI name."""
+    import socket
+    import ssl
+    import threading
+
+    certificates = {}
+    contexts = {}
+
+    def add(server_name, organization="Let's Encrypt", days=90):
+        pem, key, certificate = _self_signed_certificate(server_name, organization, days)
+        (tmp_path / f'{server_name}.pem').write_bytes(pem + key)
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(str(tmp_path / f'{server_name}.pem'))
+        contexts[server_name] = context
+        certificates[server_name] = certificate
+        return certificate
+
+    default = add('default.test', 'Default', 30)
+
+    def sni_callback(ssl_socket, server_name, _):
+        if server_name in contexts:
+            ssl_socket.context = contexts[server_name]
+
+    server_context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    server_context.load_cert_chain(str(tmp_path / 'default.test.pem'))
+    server_context.sni_callback = sni_callback
+    listener = socket.socket()
+    listener.bind(('127.0.0.1', 0))
+    listener.listen(128)
+    running = threading.Event()
+    running.set()
+
+    def handle(connection):
+        try:
+            with server_context.wrap_socket(connection, server_side=True) as tls:
+                tls.recv(1)
+        except (OSError, ssl.SSLError):
+            pass
+
+    def serve():
+        listener.settimeout(0.2)
+        while running.is_set():
+            try:
+                connection, _ = listener.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                return
+            threading.Thread(target=handle, args=(connection,), daemon=True).start()
+
+    thread = threading.Thread(target=serve, daemon=True)
+    thread.start()
+    server = type('TLSServer', (), {})()
+    server.port = listener.getsockname()[1]
+    server.add = add
+    server.certificates = certificates
+    server.contexts = contexts
+    server.default = default
+    yield server
+    running.clear()
+    listener.close()
+    thread.join()
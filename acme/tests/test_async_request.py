@@ -0,0 +1,76 @@
+import asyncio
+import io
+
+import pytest
+
+from acme import acme
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+class TestAsyncRequest:
+    test_cases = [('True'), ('False')]
+
+    @pytest.mark.parametrize(('validation'), test_cases)
+    def test_methods(self, httpserver, validation):
+        for method in ['GET', 'POST', 'PUT', 'DELETE']:
+            httpserver.expect_request('/resource', method=method).respond_with_json({'method': method})
+
+        async def requests():
+            async with acme.AsyncRequest(validation=validation) as client:
+                url = httpserver.url_for('/resource')
+                return await asyncio.gather(
+                    client.get(url), client.post(url, data='{}'),
+                    client.put(url, data='{}'), client.delete(url))
+
+        responses = run(requests())
+        assert [response.json()['method'] for response in responses] == ['GET', 'POST', 'PUT', 'DELETE']
+        assert all(response.status_code == 200 for response in responses)
+
+    def test_http_exception(self, httpserver):
+        httpserver.expect_request('/error').respond_with_data('Not Found', status=404)
+
+        async def request():
+            async with acme.AsyncRequest(validation='True') as client:
+                await client.get(httpserver.url_for('/error'))
+
+        with pytest.raises(SystemExit):
+            run(request())
+
+    def test_server_error_not_replayed(self, httpserver):
+        httpserver.expect_oneshot_request('/get').respond_with_data('', status=502)
+
+        async def request():
+            async with acme.AsyncRequest(validation='True', backoff_factor=0) as client:
+                return await client.get(httpserver.url_for('/get'))
+
+        with pytest.raises(SystemExit):
+            run(request())
+        assert len(httpserver.log) == 1
+
+    def test_post_files(self, httpserver):
+        httpserver.expect_request('/upload', method='POST').respond_with_data('OK')
+
+        async def request():
+            async with acme.AsyncRequest(validation='True') as client:
+                return await client.post(httpserver.url_for('/upload'),
+                                         files={'file': io.BytesIO(b'certificate')})
+
+        assert run(request()).text == 'OK'
+        assert b'certificate' in httpserver.log[0][0].data
+
+    def test_stream(self, httpserver):
+        body = b'x' * 100000
+        httpserver.expect_request('/export').respond_with_data(body)
+
+        async def request():
+            chunks = []
+            async with acme.AsyncRequest(validation='True') as client:
+                async with client.stream(httpserver.url_for('/export')) as response:
+                    async for chunk in response.content.iter_chunked(65536):
+                        chunks.append(chunk)
+            return chunks
+
+        assert b''.join(run(request())) == body
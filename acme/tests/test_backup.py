@@ -0,0 +1,70 @@
+import asyncio
+import gzip
+import os
+
+import boto3
+import pytest
+from moto import mock_s3
+
+from acme import acme
+
+
+def chunks(*blocks):
+    async def iterator():
+        for block in blocks:
+            yield block
+    return iterator()
+
+
+def backup(sink, *blocks):
+    return asyncio.run(acme.backup_stream(chunks(*blocks), 'fw.example.com', sink))
+
+
+class TestBackup:
+    def test_local_sink_skips_unchanged(self, tmp_path):
+        sink = acme.LocalSink(str(tmp_path))
+        first = backup(sink, b'<config>', b'</config>')
+        assert first.changed
+        assert first.size == 17
+        with gzip.open(first.location) as file:
+            assert file.read() == b'<config></config>'
+
+        # Chunk Boundaries Do Not Affect the Digest
+        second = backup(sink, b'<conf', b'ig></config>')
+        assert not second.changed
+        assert second.digest == first.digest
+
+        third = backup(sink, b'<config><new/></config>')
+        assert third.changed
+        assert sink.latest_digest('fw.example.com') == third.digest
+        assert len(os.listdir(tmp_path / 'fw.example.com')) == 3
+
+    @mock_s3
+    def test_s3_sink(self):
+        client = boto3.client('s3', region_name='us-east-1')
+        client.create_bucket(Bucket='backups')
+        sink = acme.S3Sink('backups', 'panos/', client=client)
+        assert sink.latest_digest('fw.example.com') is None
+
+        first = backup(sink, b'<config/>')
+        assert first.location.startswith('s3://backups/panos/fw.example.com/')
+        assert not backup(sink, b'<config/>').changed
+        keys = [item['Key'] for item in client.list_objects_v2(Bucket='backups')['Contents']]
+        assert sorted(keys) == sorted([first.location[len('s3://backups/'):], 'panos/fw.example.com/LATEST'])
+
+    def test_get_sink(self):
+        assert isinstance(acme.get_sink('s3://bucket/prefix'), acme.S3Sink)
+        assert acme.get_sink('s3://bucket/prefix').prefix == 'prefix'
+        assert acme.get_sink('file:///tmp/backups').directory == '/tmp/backups'
+
+    def test_get_sink_unset(self, monkeypatch, caplog):
+        monkeypatch.setattr('acme.acme.backup.BACKUP_URI', None)
+        sink = acme.get_sink()
+        assert isinstance(sink, acme.LocalSink)
+        assert sink.directory == '/tmp/ottr/backups'
+        assert any(record.levelname == 'WARNING' and 'OTTR_BACKUP_URI' in record.getMessage()
+                   for record in caplog.records)
+
+    def test_sink_interface(self):
+        with pytest.raises(TypeError):
+            acme.BackupSink()
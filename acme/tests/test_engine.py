@@ -0,0 +1,299 @@
+import base64
+import datetime
+import hashlib
+import json
+import re
+
+import pytest
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec, padding, rsa
+from cryptography.hazmat.primitives.asymmetric.utils import encode_dss_signature
+from cryptography.x509.oid import NameOID
+from werkzeug.wrappers import Response
+
+from acme import acme
+from acme.acme.engine import load_csr_identifiers, split_certificate_chain
+
+
+def _b64decode(data):
+    return base64.urlsafe_b64decode(data + '=' * (-len(data) % 4))
+
+
+def _b64(data):
+    return base64.urlsafe_b64encode(data).decode('ascii').rstrip('=')
+
+
+def _certificate(common_name, issuer_name, public_key, signing_key, names=None):
+    now = datetime.datetime.utcnow()
+    builder = x509.CertificateBuilder().subject_name(
+        x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, common_name)])).issuer_name(
+        x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, issuer_name)])).public_key(
+        public_key).serial_number(x509.random_serial_number()).not_valid_before(
+        now).not_valid_after(now + datetime.timedelta(days=90))
+    if names:
+        builder = builder.add_extension(x509.SubjectAlternativeName(
+            [x509.DNSName(name) for name in names]), critical=False)
+    return builder.sign(signing_key, hashes.SHA256()).public_bytes(
+        serialization.Encoding.PEM).decode()
+
+
+def _csr(common_name, names):
+    key = ec.generate_private_key(ec.SECP256R1())
+    csr = x509.CertificateSigningRequestBuilder().subject_name(
+        x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, common_name)])).add_extension(
+        x509.SubjectAlternativeName([x509.DNSName(name) for name in names]),
+        critical=False).sign(key, hashes.SHA256())
+    return csr.public_bytes(serialization.Encoding.PEM)
+
+
+class ChallengeRecordStub:
+    def __init__(self):
+        self.values = []
+        self.published = []
+        self.removed = False
+
+    def publish(self, values):
+        self.values = list(values)
+        self.published.append(list(values))
+
+    def remove(self):
+        self.removed = True
+
+
+class ACMEStandIn:
+    """Minimal RFC 8555 server validating JWS signatures and DNS-01 values."""
+
+    def __init__(self, httpserver, challenge_record, fail_identifier=None):
+        self.server = httpserver
+        self.challenge_record = challenge_record
+        self.fail_identifier = fail_identifier
+        self.nonce_counter = 0
+        self.issued_nonces = set()
+        self.bad_nonce_once = False
+        self.account_jwk = None
+        self.authorizations = {}
+        self.order = None
+        self.ca_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        self.alternate_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+
+        httpserver.expect_request('/directory').respond_with_json({
+            'newNonce': self.url('/nonce'),
+            'newAccount': self.url('/new-account'),
+            'newOrder': self.url('/new-order')
+        })
+        httpserver.expect_request('/nonce', method='HEAD').respond_with_handler(
+            lambda request: Response('', headers=self._nonce_headers()))
+        httpserver.expect_request('/new-account', method='POST').respond_with_handler(self.new_account)
+        httpserver.expect_request('/new-order', method='POST').respond_with_handler(self.new_order)
+        httpserver.expect_request(re.compile('^/authz/'), method='POST').respond_with_handler(self.authorization)
+        httpserver.expect_request(re.compile('^/chall/'), method='POST').respond_with_handler(self.challenge)
+        httpserver.expect_request('/order', method='POST').respond_with_handler(self.get_order)
+        httpserver.expect_request('/finalize', method='POST').respond_with_handler(self.finalize)
+        httpserver.expect_request('/cert', method='POST').respond_with_handler(self.certificate)
+        httpserver.expect_request('/cert/alternate', method='POST').respond_with_handler(self.alternate_certificate)
+
+    def url(self, path):
+        return self.server.url_for(path)
+
+    def _nonce_headers(self):
+        self.nonce_counter += 1
+        nonce = f'nonce-{self.nonce_counter}'
+        self.issued_nonces.add(nonce)
+        return {'Replay-Nonce': nonce}
+
+    def _verify(self, request):
+        body = json.loads(request.data)
+        protected = json.loads(_b64decode(body['protected']))
+        assert protected['url'] == self.url(request.path)
+        assert protected['nonce'] in self.issued_nonces
+        self.issued_nonces.discard(protected['nonce'])
+        jwk = protected.get('jwk', self.account_jwk)
+        if 'kid' in protected:
+            assert protected['kid'] == self.url('/acct/1')
+        signed = f"{body['protected']}.{body['payload']}".encode()
+        signature = _b64decode(body['signature'])
+        if jwk['kty'] == 'RSA':
+            public_key = rsa.RSAPublicNumbers(
+                int.from_bytes(_b64decode(jwk['e']), 'big'),
+                int.from_bytes(_b64decode(jwk['n']), 'big')).public_key()
+            public_key.verify(signature, signed, padding.PKCS1v15(), hashes.SHA256())
+        else:
+            public_key = ec.EllipticCurvePublicNumbers(
+                int.from_bytes(_b64decode(jwk['x']), 'big'),
+                int.from_bytes(_b64decode(jwk['y']), 'big'), ec.SECP256R1()).public_key()
+            public_key.verify(encode_dss_signature(
+                int.from_bytes(signature[:32], 'big'), int.from_bytes(signature[32:], 'big')),
+                signed, ec.ECDSA(hashes.SHA256()))
+        return protected, json.loads(_b64decode(body['payload'])) if body['payload'] else None
+
+    def _json(self, payload, status=200, headers=None):
+        headers = dict(headers or {})
+        headers.update(self._nonce_headers())
+        return Response(json.dumps(payload), status=status, headers=headers,
+                        content_type='application/json')
+
+    def new_account(self, request):
+        protected, _ = self._verify(request)
+        self.account_jwk = protected['jwk']
+        return self._json({'status': 'valid'}, 201, {'Location': self.url('/acct/1')})
+
+    def new_order(self, request):
+        if not self.bad_nonce_once:
+            self.bad_nonce_once = True
+            return self._json({'type': 'urn:ietf:params:acme:error:badNonce'}, 400)
+        _, payload = self._verify(request)
+        for index, identifier in enumerate(payload['identifiers']):
+            self.authorizations[str(index)] = {
+                'identifier': identifier, 'status': 'pending', 'answered': False,
+                'token': f'token-{index}'}
+        self.order = {
+            'status': 'pending',
+            'identifiers': payload['identifiers'],
+            'authorizations': [self.url(f'/authz/{index}') for index in self.authorizations],
+            'finalize': self.url('/finalize')
+        }
+        return self._json(self.order, 201, {'Location': self.url('/order')})
+
+    def authorization(self, request):
+        self._verify(request)
+        index = request.path.rsplit('/', 1)[-1]
+        authorization = self.authorizations[index]
+        if authorization['answered'] and authorization['status'] == 'pending':
+            thumbprint = _b64(hashlib.sha256(json.dumps(
+                self.account_jwk, sort_keys=True, separators=(',', ':')).encode()).digest())
+            expected = _b64(hashlib.sha256(
+                f"{authorization['token']}.{thumbprint}".encode()).digest())
+            valid = expected in self.challenge_record.values and \
+                authorization['identifier']['value'] != self.fail_identifier
+            authorization['status'] = 'valid' if valid else 'invalid'
+            if all(item['status'] == 'valid' for item in self.authorizations.values()):
+                self.order['status'] = 'ready'
+        return self._json({
+            'identifier': authorization['identifier'],
+            'status': authorization['status'],
+            'challenges': [
+                {'type': 'http-01', 'url': self.url(f'/chall/http/{index}'), 'token': 'unused'},
+                {'type': 'dns-01', 'url': self.url(f'/chall/{index}'), 'token': authorization['token']}
+            ]
+        })
+
+    def challenge(self, request):
+        _, payload = self._verify(request)
+        assert payload == {}
+        index = request.path.rsplit('/', 1)[-1]
+        self.authorizations[index]['answered'] = True
+        return self._json({'type': 'dns-01', 'status': 'processing'})
+
+    def get_order(self, request):
+        self._verify(request)
+        return self._json(self.order)
+
+    def finalize(self, request):
+        _, payload = self._verify(request)
+        self.csr = x509.load_der_x509_csr(_b64decode(payload['csr']))
+        self.order['status'] = 'valid'
+        self.order['certificate'] = self.url('/cert')
+        return self._json(self.order)
+
+    def _chain(self, root_name, root_key):
+        names = [identifier['value'] for identifier in self.order['identifiers']]
+        leaf = _certificate(names[0], root_name, self.csr.public_key(), root_key, names)
+        root = _certificate(root_name, root_name, root_key.public_key(), root_key)
+        return leaf + root
+
+    def certificate(self, request):
+        self._verify(request)
+        headers = {'Link': '<{}>;rel="alternate"'.format(self.url('/cert/alternate'))}
+        headers.update(self._nonce_headers())
+        return Response(self._chain('Fake Root X1', self.ca_key), headers=headers,
+                        content_type='application/pem-certificate-chain')
+
+    def alternate_certificate(self, request):
+        self._verify(request)
+        return Response(self._chain('ISRG Root X1', self.alternate_key),
+                        headers=self._nonce_headers(),
+                        content_type='application/pem-certificate-chain')
+
+
+KEY_TYPES = [
+    lambda: rsa.generate_private_key(public_exponent=65537, key_size=2048),
+    lambda: ec.generate_private_key(ec.SECP256R1())
+]
+
+
+def _account_key(factory):
+    return acme.AccountKey(factory().private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption()))
+
+
+class TestACMEEngine:
+    @pytest.mark.parametrize('factory', KEY_TYPES)
+    def test_issue_certificate(self, httpserver, factory):
+        challenge_record = ChallengeRecordStub()
+        stand_in = ACMEStandIn(httpserver, challenge_record)
+        client = acme.ACMEClient(stand_in.url('/directory'), _account_key(factory),
+                                 poll_interval=0.01)
+        csr = _csr('test.example.com', ['test.example.com', 'dev.example.com'])
+
+        chain = client.issue(csr, challenge_record)
+
+        certificates = split_certificate_chain(chain)
+        leaf = x509.load_pem_x509_certificate(certificates[0].encode())
+        assert len(certificates) == 2
+        assert leaf.subject.get_attributes_for_oid(NameOID.COMMON_NAME)[0].value == 'test.example.com'
+        assert client.account_url == stand_in.url('/acct/1')
+        # Single DNS Change for Every Identifier
+        assert len(challenge_record.published) == 1
+        assert len(challenge_record.published[0]) == 2
+        assert challenge_record.removed
+
+    def test_preferred_chain(self, httpserver):
+        challenge_record = ChallengeRecordStub()
+        stand_in = ACMEStandIn(httpserver, challenge_record)
+        client = acme.ACMEClient(stand_in.url('/directory'), _account_key(KEY_TYPES[0]),
+                                 poll_interval=0.01)
+        chain = client.issue(_csr('test.example.com', ['test.example.com']),
+                             challenge_record, preferred_chain='ISRG')
+        root = x509.load_pem_x509_certificate(split_certificate_chain(chain)[-1].encode())
+        assert root.subject.get_attributes_for_oid(NameOID.COMMON_NAME)[0].value == 'ISRG Root X1'
+
+    def test_failed_authorization(self, httpserver):
+        challenge_record = ChallengeRecordStub()
+        stand_in = ACMEStandIn(httpserver, challenge_record,
+                               fail_identifier='dev.example.com')
+        client = acme.ACMEClient(stand_in.url('/directory'), _account_key(KEY_TYPES[1]),
+                                 poll_interval=0.01)
+        with pytest.raises(acme.ACMEError):
+            client.issue(_csr('test.example.com', ['test.example.com', 'dev.example.com']),
+                         challenge_record)
+        assert challenge_record.removed
+
+    def test_unsupported_account_key(self):
+        key = ec.generate_private_key(ec.SECP384R1()).private_bytes(
+            serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+            serialization.NoEncryption())
+        with pytest.raises(acme.ACMEError):
+            acme.AccountKey(key)
+
+    def test_csr_identifiers(self):
+        csr = _csr('Test.Example.com', ['test.example.com', 'dev.example.com'])
+        assert load_csr_identifiers(csr) == ['test.example.com', 'dev.example.com']
+
+    def test_write_certificate_chain(self, tmpdir):
+        key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        leaf = _certificate('test.example.com', 'Root', key.public_key(), key)
+        root = _certificate('Root', 'Root', key.public_key(), key)
+        path = acme.write_certificate_chain(leaf + root, 'test.example.com', str(tmpdir))
+        assert open(path).read() == leaf + root
+        assert tmpdir.join('ca.cer').read() == root
+        assert tmpdir.join('test.example.com.cer').read() == leaf
+
+    def test_write_certificate_chain_ecdsa(self, tmpdir, monkeypatch):
+        monkeypatch.setenv('HOME', str(tmpdir))
+        key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        leaf = _certificate('test.example.com', 'Root', key.public_key(), key)
+        path = acme.write_certificate_chain(leaf, 'test.example.com', key_type='ecdsa')
+        assert path == acme.certificate_chain_path('test.example.com', 'ecdsa')
+        assert open(path).read() == leaf
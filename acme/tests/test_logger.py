@@ -1,7 +1,8 @@
+import json
 import logging
 
 from mock import patch
-from acme.acme.logger import get_logger, set_formatter, LogFormatter
+from acme.acme.logger import get_logger, set_formatter, summarize, truncate, DebugSampler, LogFormatter
 
 
 class TestLogger:
@@ -41,3 +42,44 @@ class TestLogger:
         log_mock.return_value = False
         set_formatter(logger)
         assert type(logger.handlers[0].formatter) == type(LogFormatter())
+
+
+class TestLogFormatter:
+    def _record(self, msg, *args, level=logging.INFO):
+        return logging.LogRecord('pytest', level, __file__, 1, msg, args, None)
+
+    def test_json_output(self):
+        output = json.loads(LogFormatter(output='json').format(
+            self._record('Rotate %s: %s', 'example.com', 'ok')))
+        assert output['message'] == 'Rotate example.com: ok'
+        assert output['level'] == 'INFO'
+        assert output['logger'] == 'pytest'
+
+    def test_text_output(self):
+        formatter = LogFormatter(fmt='%(levelname)s %(message)s', output='text')
+        assert formatter.format(self._record('Rotate %s', 'example.com')) == 'INFO Rotate example.com'
+
+    def test_summarize_scan_response(self):
+        response = {
+            'Items': [{'system_name': f'{index}.example.com'} for index in range(5000)],
+            'Count': 5000,
+            'ResponseMetadata': {'HTTPStatusCode': 200}
+        }
+        summary = summarize(response)
+        assert summary['Count'] == 5000
+        assert len(summary['Items']) == 11
+        assert summary['Items'][-1] == '<4990 more items>'
+        assert 'ResponseMetadata' not in summary
+        message = LogFormatter(output='text').message(self._record('Scanned Table: %s', response))
+        assert len(message) < 1000
+
+    def test_truncate(self):
+        message = LogFormatter(output='text').message(self._record('x' * 10000))
+        assert message.endswith('[5904 chars truncated]')
+        assert truncate('short') == 'short'
+
+    def test_debug_sampling(self):
+        sampler = DebugSampler(rate=0.0)
+        assert not sampler.filter(self._record('debug', level=logging.DEBUG))
+        assert sampler.filter(self._record('info'))
+        assert DebugSampler(rate=1.0).filter(self._record('debug', level=logging.DEBUG))
@@ -1,4 +1,7 @@
+import json
 import os
+import sys
+import time
 
 import boto3
 import requests
@@ -15,6 +18,12 @@ from acme import acme
 DYNAMODB_TABLE = "ottr-example"
 REGION = os.environ['AWS_REGION']
 
+
+def _all_reachable(hostnames, **kwargs):
+    return {hostname: True for hostname in hostnames}
+
+
+@patch('acme.acme.ca.check_reachability', new=_all_reachable)
 @mock_route53
 def test_subject_alternative_names_validation(init_dns, secretsmanager_client):
     init_dns()
@@ -26,6 +35,7 @@ def test_subject_alternative_names_validation(init_dns, secretsmanager_client):
         region=REGION)
 
 
+@patch('acme.acme.ca.check_reachability', new=_all_reachable)
 @mock_route53
 def test_dns_acme_challenge_invalid(init_dns, secretsmanager_client):
     init_dns()
@@ -38,6 +48,7 @@ def test_dns_acme_challenge_invalid(init_dns, secretsmanager_client):
         assert system.type == SystemExit
         assert system.value.code == 1
 
+@patch('acme.acme.ca.check_reachability', new=_all_reachable)
 @mock_route53
 @mock_secretsmanager
 def test_register_lets_encrypt_account_exception(init_dns):
@@ -150,6 +161,14 @@ class TestRequestPackage:
         response = acme_request.put(url=url)
         assert response.status_code == 200
 
+    @pytest.mark.parametrize(('validation'), test_cases)
+    def test_request_patch(self, httpserver, validation):
+        httpserver.expect_request("/patch", method="PATCH").respond_with_json({"foo": "bar"})
+        url = httpserver.url_for("/patch")
+        acme_request = acme.Request(validation=validation)
+        response = acme_request.patch(url=url, data='{"state": "VALIDATING"}')
+        assert response.status_code == 200
+
     @pytest.mark.parametrize(('validation'), test_cases)
     def test_request_delete(self, httpserver, validation):
         httpserver.expect_request("/delete").respond_with_json({"foo": "bar"})
@@ -157,3 +176,255 @@ class TestRequestPackage:
         acme_request = acme.Request(validation=validation)
         response = acme_request.delete(url=url)
         assert response.status_code == 200
+
+
+class TestReachability:
+    def test_reachable_host(self, httpserver):
+        results = acme.check_reachability(
+            [httpserver.host], ports=[httpserver.port], timeout=1)
+        assert results == {httpserver.host: True}
+
+    def test_unreachable_port(self):
+        import socket
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            port = sock.getsockname()[1]
+        results = acme.check_reachability(
+            ['127.0.0.1'], ports=[port], timeout=1)
+        assert results == {'127.0.0.1': False}
+
+    def test_duplicate_hostnames(self, httpserver):
+        results = acme.check_reachability(
+            [httpserver.host, httpserver.host], ports=[1, httpserver.port], timeout=1)
+        assert results == {httpserver.host: True}
+
+
+class TestChallengeRecords:
+    @mock_route53
+    def test_valid_challenge_record(self, init_dns):
+        init_dns()
+        records = acme.validate_acme_challenge_records(['test.example.com'])
+        assert records == {'test.example.com': True}
+
+    @mock_route53
+    def test_exact_record_name_match(self, init_dns):
+        init_dns()
+        records = acme.validate_acme_challenge_records(
+            ['test.example.com', 'example.com', 'est.example.com', 'invalid.example.com'])
+        assert records == {
+            'test.example.com': True,
+            'example.com': False,
+            'est.example.com': False,
+            'invalid.example.com': False
+        }
+
+    @mock_route53
+    def test_hosted_zone_resolved_once(self, init_dns):
+        init_dns()
+        client = boto3.client('route53')
+        with patch.object(client, 'list_hosted_zones_by_name',
+                          wraps=client.list_hosted_zones_by_name) as zones:
+            acme.validate_acme_challenge_records(
+                ['test.example.com', 'dev.example.com'], client=client)
+        assert zones.call_count == 1
+
+    @mock_route53
+    def test_missing_hosted_zone(self, init_dns):
+        init_dns()
+        records = acme.validate_acme_challenge_records(
+            ['test.missing.com', 'test.example.com'])
+        assert records == {'test.missing.com': False, 'test.example.com': True}
+
+    @mock_route53
+    def test_challenge_record_publish_remove(self, init_dns):
+        init_dns()
+        client = boto3.client('route53')
+        record = acme.ChallengeRecord('example-acme.com', 'test.example-acme.com', client=client)
+        record.publish(['value-a', 'value-b', 'value-a'])
+        records = client.list_resource_record_sets(
+            HostedZoneId=record.hosted_zone_id,
+            StartRecordName='_acme-challenge.test.example-acme.com.',
+            StartRecordType='TXT', MaxItems='1')['ResourceRecordSets']
+        assert records[0]['Name'] == '_acme-challenge.test.example-acme.com.'
+        assert records[0]['ResourceRecords'] == [{'Value': '"value-a"'}, {'Value': '"value-b"'}]
+        record.remove()
+        assert record.values == []
+
+
+class TestRequestSession:
+    def test_connection_reuse(self, httpserver):
+        httpserver.expect_request("/get").respond_with_json({"foo": "bar"})
+        acme_request = acme.Request(validation='True')
+        for _ in range(3):
+            acme_request.get(url=httpserver.url_for("/get"))
+        assert acme_request.connection_stats() == {
+            'requests': 3, 'connections': 1, 'reused': 2}
+
+    def test_get_not_replayed(self, httpserver):
+        # PAN-OS Commits and Config Changes are Sent as GET
+        httpserver.expect_oneshot_request("/get").respond_with_data("", status=503)
+        acme_request = acme.Request(validation='True', backoff_factor=0)
+        with pytest.raises(SystemExit):
+            acme_request.get(url=httpserver.url_for("/get"))
+        assert len(httpserver.log) == 1
+
+    def test_connect_error_retried(self):
+        acme_request = acme.Request(validation='True', retries=2, backoff_factor=0)
+        retry = acme_request._adapter.max_retries
+        assert (retry.connect, retry.read, retry.status) == (2, 0, 0)
+
+    def test_post_not_retried(self, httpserver):
+        httpserver.expect_oneshot_request("/post").respond_with_data("", status=503)
+        acme_request = acme.Request(validation='True', backoff_factor=0)
+        with pytest.raises(SystemExit):
+            acme_request.post(url=httpserver.url_for("/post"))
+        assert len(httpserver.log) == 1
+
+    @patch('requests.Session.get')
+    def test_timeout(self, get_mock):
+        get_mock.return_value.status_code = 200
+        with acme.Request(validation='False', timeout=(1, 2)) as acme_request:
+            acme_request.get(url='https://example.com')
+            acme_request.get(url='https://example.com', timeout=30)
+        assert get_mock.call_args_list[0].kwargs['timeout'] == (1, 2)
+        assert get_mock.call_args_list[1].kwargs['timeout'] == 30
+
+
+class TestAWSClientFactory:
+    def test_cached_client(self):
+        assert acme.get_client('route53') is acme.get_client('route53')
+        assert acme.get_client('ssm', 'us-east-1') is not acme.get_client('ssm', 'us-west-2')
+
+    def test_adaptive_retry_config(self):
+        config = acme.get_client('ssm', 'us-east-1').meta.config
+        assert config.retries['mode'] == 'adaptive'
+        from acme.acme import aws
+        assert config.max_pool_connections == aws.MAX_POOL_CONNECTIONS
+        assert config.retries['total_max_attempts'] == aws.MAX_ATTEMPTS
+
+    def test_configure_rebuilds_clients(self):
+        from acme.acme import aws
+        original = aws.MAX_ATTEMPTS
+        client = acme.get_client('ssm', 'us-east-1')
+        try:
+            aws.configure(max_attempts=3)
+            rebuilt = acme.get_client('ssm', 'us-east-1')
+            assert rebuilt is not client
+            assert rebuilt.meta.config.retries['total_max_attempts'] == 3
+        finally:
+            aws.configure(max_attempts=original)
+
+    def test_cached_resource(self):
+        assert acme.get_resource('dynamodb', REGION) is acme.get_resource('dynamodb', REGION)
+
+
+class TestDeviceContext:
+    item = {
+        'system_name': 'example.com',
+        'common_name': 'example.com',
+        'subject_alternative_name': ['dev.example.com'],
+        'host_platform': 'panos',
+        'os_version': '9.1.0',
+        'certificate_authority': 'lets_encrypt',
+        'certificate_validation': 'True',
+        'ip_address': '10.0.0.1'
+    }
+
+    def test_router_encoding(self, monkeypatch):
+        from otter.router.src.shared.client import encode_device_context
+        monkeypatch.setenv('DEVICE_CONTEXT', encode_device_context(self.item))
+        context = acme.DeviceContext.load('example.com')
+        assert context.subject_alternative_names == ['dev.example.com']
+        assert context.host_platform == 'panos'
+        assert context.certificate_authority == 'lets_encrypt'
+
+    def test_round_trip(self):
+        context = acme.DeviceContext.from_item(self.item)
+        decoded = acme.DeviceContext.decode(context.encode())
+        assert vars(decoded) == vars(context)
+
+    def test_rotation_group(self, monkeypatch):
+        from otter.router.src.shared.client import encode_device_context
+        item = dict(self.item, members=['example.com', 'standby.example.com'])
+        monkeypatch.setenv('DEVICE_CONTEXT', encode_device_context(item))
+        context = acme.DeviceContext.load('example.com')
+        assert context.group == ['example.com', 'standby.example.com']
+        assert acme.DeviceContext.from_item(self.item).group == ['example.com']
+
+    @mock_dynamodb2
+    @pytest.mark.parametrize('value', ['', 'invalid', None])
+    def test_fallback_to_dynamodb(self, init_database, monkeypatch, value):
+        init_database()
+        if value is None:
+            other = dict(self.item, system_name='other.example.com')
+            value = acme.DeviceContext.from_item(other).encode()
+        monkeypatch.setenv('DEVICE_CONTEXT', value)
+        context = acme.DeviceContext.load('example.com')
+        assert context.system_name == 'example.com'
+        assert context.subject_alternative_names == ['dev.example.com']
+
+
+class TestPhaseTimer:
+    @pytest.fixture(autouse=True)
+    def _reset(self, monkeypatch):
+        from acme.acme import decorator
+        self.default_phases = decorator.PHASES
+        monkeypatch.setattr(decorator, 'PHASE_LABELS', {})
+        monkeypatch.setattr(decorator, 'PHASES', [])
+        monkeypatch.setenv('ECS_CONTAINER_METADATA_URI_V4', 'http://169.254.170.2/v4/task-0123')
+        self.decorator = decorator
+
+    def test_context_manager(self):
+        acme.set_phase_labels(device='example.com', platform='panos-9.x')
+        with patch.object(self.decorator.METRICS_LOGGER, 'info') as info_mock:
+            with acme.phase('acme_order'):
+                pass
+        record = json.loads(info_mock.call_args.args[0])
+        assert record['phase'] == 'acme_order'
+        assert record['outcome'] == 'success'
+        assert record['device'] == 'example.com'
+        assert record['task_id'] == 'task-0123'
+        assert record['duration_ms'] >= 0
+        assert record['_aws']['CloudWatchMetrics'][0]['Dimensions'] == [['platform', 'phase']]
+
+    def test_decorator_outcomes(self):
+        @acme.phase('commit', device='fw02.example.com')
+        def commit(code):
+            sys.exit(code)
+
+        with pytest.raises(SystemExit):
+            commit(1)
+        with pytest.raises(SystemExit):
+            commit(0)
+        with pytest.raises(ValueError):
+            with acme.phase('deploy'):
+                raise ValueError
+        assert [(record['phase'], record['outcome']) for record in self.decorator.PHASES] == [
+            ('commit', 'exit'), ('commit', 'success'), ('deploy', 'error')]
+        assert self.decorator.PHASES[0]['device'] == 'fw02.example.com'
+
+    def test_nested_decorated_calls(self):
+        @acme.phase('restart_httpd')
+        def restart(depth):
+            time.sleep(0.02)
+            if depth:
+                restart(depth - 1)
+
+        restart(1)
+        inner, outer = self.decorator.PHASES
+        # Outer Call Includes Its Own Sleep Before the Inner Call Started
+        assert inner['duration_ms'] >= 20
+        assert outer['duration_ms'] >= inner['duration_ms'] + 20
+
+    def test_task_id_label(self):
+        with acme.phase('deploy', task_id='override'):
+            pass
+        assert self.decorator.PHASES[-1]['task_id'] == 'override'
+
+    def test_records_bounded(self, monkeypatch):
+        assert self.default_phases.maxlen == self.decorator.MAX_PHASES
+        monkeypatch.setattr(self.decorator, 'PHASES', self.decorator.deque(maxlen=2))
+        for name in ('keygen', 'acme_order', 'deploy'):
+            with acme.phase(name):
+                pass
+        assert [record['phase'] for record in self.decorator.PHASES] == ['acme_order', 'deploy']
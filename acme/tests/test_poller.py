@@ -0,0 +1,49 @@
+import pytest
+from mock import patch
+
+from acme import acme
+
+
+class TestParseProgress:
+    @pytest.mark.parametrize('output, progress', [
+        ('<job><status>ACT</status><progress>55</progress></job>', 55),
+        ('<job><progress> 100 </progress></job>', 100),
+        ('Commit 30% Complete', 30),
+        ('<job><status>PEND</status></job>', None),
+        (None, None)
+    ])
+    def test_parse_progress(self, output, progress):
+        assert acme.parse_progress(output) == progress
+
+
+class TestPollJob:
+    @patch('acme.acme.poller.time.sleep')
+    def test_backoff_until_done(self, sleep_mock):
+        statuses = iter([
+            acme.JobStatus(False, 'PEND'),
+            acme.JobStatus(False, 'PEND'),
+            acme.JobStatus(False, 'PEND'),
+            acme.JobStatus(True, 'FIN', 'OK', 100)
+        ])
+        status = acme.poll_job(lambda: next(statuses), initial=2, maximum=5)
+        assert status.result == 'OK'
+        assert [call.args[0] for call in sleep_mock.call_args_list] == [2, 4, 5]
+
+    @patch('acme.acme.poller.time.monotonic')
+    @patch('acme.acme.poller.time.sleep')
+    def test_progress_shortens_interval(self, sleep_mock, monotonic_mock):
+        # 80% Complete After 8 Seconds: Next Poll ~2 Seconds Instead of 30
+        monotonic_mock.side_effect = [0, 0.5, 0.5, 8, 8, 10]
+        statuses = iter([
+            acme.JobStatus(False, 'PEND'),
+            acme.JobStatus(False, 'ACT', progress=80),
+            acme.JobStatus(True, 'FIN', 'OK', 100)
+        ])
+        acme.poll_job(lambda: next(statuses), initial=1, maximum=30, factor=30)
+        assert sleep_mock.call_args.args[0] == pytest.approx(2)
+
+    @patch('acme.acme.poller.time.sleep')
+    def test_deadline(self, sleep_mock):
+        with pytest.raises(acme.JobTimeoutError):
+            acme.poll_job(lambda: acme.JobStatus(False, 'PEND'), initial=1, timeout=0)
+        sleep_mock.assert_not_called()
@@ -0,0 +1,73 @@
+import boto3
+import pytest
+from mock import MagicMock, patch
+from moto import mock_route53
+
+from acme import acme
+from acme.acme import propagation
+
+
+class TestWaitForChange:
+    @patch('acme.acme.propagation.time.sleep')
+    def test_insync_after_pending(self, sleep_mock):
+        client = MagicMock()
+        client.get_change.side_effect = [
+            {'ChangeInfo': {'Status': 'PENDING'}},
+            {'ChangeInfo': {'Status': 'PENDING'}},
+            {'ChangeInfo': {'Status': 'INSYNC'}}
+        ]
+        acme.wait_for_change(client, 'C1', initial=1, maximum=10)
+        assert client.get_change.call_count == 3
+        assert [call.args[0] for call in sleep_mock.call_args_list] == [1, 2]
+
+    @patch('acme.acme.propagation.time.sleep')
+    def test_deadline(self, sleep_mock):
+        client = MagicMock()
+        client.get_change.return_value = {'ChangeInfo': {'Status': 'PENDING'}}
+        with pytest.raises(acme.DNSPropagationError):
+            acme.wait_for_change(client, 'C1', initial=1, timeout=0)
+
+
+class TestTXTPropagation:
+    @patch('acme.acme.propagation.time.sleep')
+    def test_returns_when_all_nameservers_visible(self, sleep_mock):
+        answers = {
+            '192.0.2.1': [{'a', 'b'}],
+            '192.0.2.2': [{'a'}, {'a', 'b', 'stale'}]
+        }
+        queried = []
+
+        def query(nameserver, record_name, timeout):
+            queried.append(nameserver)
+            return answers[nameserver].pop(0)
+
+        with patch.object(propagation, 'query_txt', side_effect=query):
+            acme.wait_for_txt_propagation(
+                '_acme-challenge.test.example-acme.com.', ['a', 'b'],
+                ['192.0.2.1', '192.0.2.2'], initial=0.5)
+        # Confirmed Name Servers Are Not Polled Again
+        assert sorted(queried) == ['192.0.2.1', '192.0.2.2', '192.0.2.2']
+        assert sleep_mock.call_count == 1
+
+    @patch('acme.acme.propagation.time.sleep')
+    def test_deadline(self, sleep_mock):
+        with patch.object(propagation, 'query_txt', return_value=set()):
+            with pytest.raises(acme.DNSPropagationError):
+                acme.wait_for_txt_propagation(
+                    '_acme-challenge.test.example-acme.com.', ['a'],
+                    ['192.0.2.1'], timeout=0)
+
+    def test_no_nameservers(self):
+        acme.wait_for_txt_propagation('_acme-challenge.example.com.', ['a'], [])
+
+    def test_unreachable_nameserver(self):
+        assert propagation.query_txt('127.0.0.1', 'example.com.', timeout=0.2) == set()
+
+    @mock_route53
+    def test_private_zone_has_no_nameservers(self):
+        client = boto3.client('route53')
+        zone = client.create_hosted_zone(
+            Name='example-acme.com.', CallerReference='test',
+            HostedZoneConfig=dict(PrivateZone=True, Comment='Subdelegate Zone'))
+        assert propagation.get_authoritative_nameservers(
+            client, zone['HostedZone']['Id']) == []
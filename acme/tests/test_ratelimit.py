@@ -0,0 +1,113 @@
+import boto3
+import pytest
+from botocore.exceptions import ClientError
+from botocore.stub import Stubber
+from mock import patch
+
+from acme import acme
+
+COMMAND_ID = '12345678-1234-1234-1234-123456789012'
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class TestTokenBucket:
+    def test_rate(self):
+        clock = FakeClock()
+        with patch('acme.acme.ratelimit.time', clock):
+            bucket = acme.TokenBucket(rate=2, capacity=2)
+            waits = [bucket.acquire() for _ in range(6)]
+        # Burst of Two, Then One Token Every 0.5 Seconds
+        assert waits[:2] == [0, 0]
+        assert waits[2:] == [pytest.approx(0.5)] * 4
+        assert clock.now == pytest.approx(2)
+
+    def test_invalid_rate(self):
+        with pytest.raises(ValueError):
+            acme.TokenBucket(rate=0)
+
+
+def _throttle(operation='SendCommand'):
+    return ClientError({'Error': {'Code': 'ThrottlingException', 'Message': 'Rate exceeded'}}, operation)
+
+
+class TestBackoff:
+    @patch('acme.acme.ratelimit.time.sleep')
+    def test_retries_throttling(self, sleep_mock):
+        calls = iter([_throttle(), _throttle(), 'ok'])
+
+        def call():
+            result = next(calls)
+            if isinstance(result, Exception):
+                raise result
+            return result
+
+        assert acme.call_with_backoff(call, retries=3, initial=1, maximum=4) == 'ok'
+        delays = [mock_call.args[0] for mock_call in sleep_mock.call_args_list]
+        assert len(delays) == 2
+        assert 0 <= delays[0] <= 1 and 0 <= delays[1] <= 2
+
+    @patch('acme.acme.ratelimit.time.sleep')
+    def test_bounded_retries(self, sleep_mock):
+        def call():
+            raise _throttle()
+
+        with pytest.raises(ClientError):
+            acme.call_with_backoff(call, retries=2)
+        assert sleep_mock.call_count == 2
+
+    @patch('acme.acme.ratelimit.time.sleep')
+    def test_other_errors_not_retried(self, sleep_mock):
+        def call():
+            raise ClientError({'Error': {'Code': 'InvalidInstanceId'}}, 'SendCommand')
+
+        with pytest.raises(ClientError):
+            acme.call_with_backoff(call)
+        sleep_mock.assert_not_called()
+
+
+class TestRateLimitedClient:
+    def test_operations_limited_and_retried(self):
+        clock = FakeClock()
+        ssm = boto3.client('ssm', region_name='us-east-1')
+        with patch('acme.acme.ratelimit.time', clock):
+            bucket = acme.TokenBucket(rate=0.001, capacity=10)
+            client = acme.RateLimitedClient(ssm, bucket)
+            with Stubber(ssm) as stubber:
+                stubber.add_client_error('list_command_invocations', 'ThrottlingException')
+                stubber.add_response('list_command_invocations', {'CommandInvocations': []},
+                                     {'CommandId': COMMAND_ID})
+                response = client.list_command_invocations(CommandId=COMMAND_ID)
+        assert response['CommandInvocations'] == []
+        # One Token per Attempt, Including the Throttled One
+        assert bucket.tokens == pytest.approx(8, abs=0.01)
+        assert client.meta is ssm.meta
+
+    def test_paginator_limited(self):
+        clock = FakeClock()
+        ssm = boto3.client('ssm', region_name='us-east-1')
+        with patch('acme.acme.ratelimit.time', clock):
+            bucket = acme.TokenBucket(rate=0.001, capacity=10)
+            client = acme.RateLimitedClient(ssm, bucket)
+            with Stubber(ssm) as stubber:
+                stubber.add_response('describe_instance_information',
+                                     {'InstanceInformationList': [], 'NextToken': 'next'})
+                stubber.add_response('describe_instance_information',
+                                     {'InstanceInformationList': []})
+                pages = list(client.get_paginator('describe_instance_information').paginate())
+        assert len(pages) == 2
+        # A Token per Page Plus the Final Check for Another Page
+        assert bucket.tokens == pytest.approx(7, abs=0.01)
+
+    def test_shared_limiter(self):
+        assert acme.get_rate_limiter('example') is acme.get_rate_limiter('example')
+        assert acme.get_rate_limiter('example').rate == pytest.approx(20 / 50)
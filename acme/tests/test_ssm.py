@@ -0,0 +1,76 @@
+import boto3
+from botocore.stub import Stubber
+from mock import patch
+
+from acme import acme
+
+
+def _instance(instance_id, ping_status='Online'):
+    return {'InstanceId': instance_id, 'PingStatus': ping_status, 'PlatformName': 'Ubuntu'}
+
+
+def _tagged(arn, name):
+    return {'ResourceARN': arn, 'Tags': [{'Key': 'Name', 'Value': name}]}
+
+
+class TestInstanceIndex:
+    def setup_method(self):
+        self.ssm = boto3.client('ssm', region_name='us-east-1')
+        self.tagging = boto3.client('resourcegroupstaggingapi', region_name='us-east-1')
+
+    def _stub_sweep(self, ssm_stubber, tagging_stubber):
+        tagging_stubber.add_response('get_resources', {
+            'PaginationToken': 'page',
+            'ResourceTagMappingList': [
+                _tagged('arn:aws:ec2:us-east-1:123456789012:instance/i-0001', 'web'),
+                _tagged('arn:aws:ec2:us-east-1:123456789012:instance/i-0002', 'db')]})
+        tagging_stubber.add_response('get_resources', {
+            'PaginationToken': '',
+            'ResourceTagMappingList': [
+                _tagged('arn:aws:ssm:us-east-1:123456789012:managed-instance/mi-0003', 'db')]})
+        ssm_stubber.add_response('describe_instance_information', {
+            'InstanceInformationList': [_instance('i-0001'), _instance('i-0002')],
+            'NextToken': 'next'})
+        ssm_stubber.add_response('describe_instance_information', {
+            'InstanceInformationList': [_instance('mi-0003', 'ConnectionLost'), _instance('i-0004')]})
+
+    def test_single_lookup_filtered(self):
+        index = acme.InstanceIndex(self.ssm, self.tagging, ttl=60)
+        with Stubber(self.ssm) as ssm_stubber, Stubber(self.tagging) as tagging_stubber:
+            ssm_stubber.add_response(
+                'describe_instance_information',
+                {'InstanceInformationList': [_instance('i-0001')]},
+                {'Filters': [{'Key': 'tag:Name', 'Values': ['web']}], 'MaxResults': 50})
+            assert [item['InstanceId'] for item in index.lookup('web')] == ['i-0001']
+            ssm_stubber.assert_no_pending_responses()
+            tagging_stubber.assert_no_pending_responses()
+
+    def test_lookup_many_single_sweep(self):
+        index = acme.InstanceIndex(self.ssm, self.tagging, ttl=60)
+        with Stubber(self.ssm) as ssm_stubber, Stubber(self.tagging) as tagging_stubber:
+            self._stub_sweep(ssm_stubber, tagging_stubber)
+            # Every Name is Served From the Single Sweep
+            instances = index.lookup_many(['web', 'db', 'missing'])
+            assert [item['InstanceId'] for item in instances['web']] == ['i-0001']
+            assert [item['InstanceId'] for item in instances['db']] == ['i-0002', 'mi-0003']
+            assert instances['missing'] == []
+            assert [item['InstanceId'] for item in index.lookup('web')] == ['i-0001']
+            ssm_stubber.assert_no_pending_responses()
+            tagging_stubber.assert_no_pending_responses()
+
+    @patch('acme.acme.ssm.time.monotonic')
+    def test_ttl(self, monotonic_mock):
+        monotonic_mock.return_value = 0
+        index = acme.InstanceIndex(self.ssm, self.tagging, ttl=60)
+        with Stubber(self.ssm) as ssm_stubber, Stubber(self.tagging) as tagging_stubber, \
+                patch.object(index, 'refresh', wraps=index.refresh) as refresh_mock:
+            self._stub_sweep(ssm_stubber, tagging_stubber)
+            self._stub_sweep(ssm_stubber, tagging_stubber)
+            index.lookup_many(['web', 'db'])
+            monotonic_mock.return_value = 30
+            index.lookup_many(['web', 'db'])
+            assert refresh_mock.call_count == 1
+            monotonic_mock.return_value = 61
+            index.lookup_many(['web', 'db'])
+            assert refresh_mock.call_count == 2
+            ssm_stubber.assert_no_pending_responses()
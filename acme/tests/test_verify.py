@@ -0,0 +1,163 @@
+import asyncio
+import socket
+
+import boto3
+import pytest
+from cryptography.hazmat.primitives import hashes, serialization
+from mock import patch
+from moto import mock_dynamodb2
+
+from acme import acme
+from acme.acme import drift
+from acme.acme.verify import verify_endpoint
+
+
+def _fingerprint(certificate):
+    return certificate.fingerprint(hashes.SHA256()).hex()
+
+
+class TestCertificateVerification:
+    def test_sni_selects_certificate(self, tls_server):
+        device = tls_server.add('device.example.com', "Let's Encrypt", 90)
+        results = asyncio.run(acme.verify_endpoints(
+            [('127.0.0.1', 'device.example.com'), ('127.0.0.1', 'other.example.com')],
+            port=tls_server.port))
+        assert [result.server_name for result in results] == ['device.example.com', 'other.example.com']
+        assert results[0].fingerprint == _fingerprint(device)
+        assert results[0].issuer == "Let's Encrypt"
+        assert results[0].expiration == device.not_valid_after.isoformat()
+        assert results[1].fingerprint == _fingerprint(tls_server.default)
+        assert results[1].issuer == 'Default'
+
+    def test_device_endpoint_first(self, tls_server):
+        device = tls_server.add('device.example.com')
+        tls_server.add('localhost')
+        results = acme.verify_certificates(
+            '127.0.0.1', 'device.example.com', ['localhost'], port=tls_server.port)
+        assert results[0].server_name == 'device.example.com'
+        assert results[0].fingerprint == _fingerprint(device)
+        assert results[1].hostname == 'localhost'
+        assert all(result.valid for result in results)
+
+    def test_connection_refused(self):
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            port = sock.getsockname()[1]
+        result = acme.verify_certificates('127.0.0.1', 'device.example.com', port=port)[0]
+        assert not result.valid
+        assert result.fingerprint is None
+
+    def test_certificate_fingerprint(self, tls_server, tmp_path):
+        leaf = tls_server.add('device.example.com')
+        chain = tmp_path / 'fullchain.cer'
+        chain.write_bytes(leaf.public_bytes(serialization.Encoding.PEM) +
+                          tls_server.default.public_bytes(serialization.Encoding.PEM))
+        assert acme.certificate_fingerprint(str(chain)) == _fingerprint(leaf)
+
+    @patch('acme.acme.poller.time.sleep')
+    def test_wait_for_certificate(self, sleep_mock, tls_server):
+        issued = tls_server.add('staging.example.com')
+
+        # Web Server "Reloads" With the New Certificate After Two Polls
+        def reload(_):
+            if sleep_mock.call_count == 2:
+                tls_server.contexts['device.example.com'] = tls_server.contexts['staging.example.com']
+        sleep_mock.side_effect = reload
+
+        result = acme.wait_for_certificate('127.0.0.1', 'device.example.com', _fingerprint(issued),
+                                           port=tls_server.port, initial=0.1)
+        assert result.fingerprint == _fingerprint(issued)
+        assert sleep_mock.call_count == 2
+
+    def test_wait_for_certificate_deadline(self, tls_server):
+        with pytest.raises(acme.JobTimeoutError):
+            acme.wait_for_certificate('127.0.0.1', 'device.example.com', '00' * 32,
+                                      port=tls_server.port, initial=0.1, deadline=0.2)
+
+    def test_handshake_timeout(self):
+        # Listener Accepts TCP but Never Completes the TLS Handshake
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            sock.listen(1)
+            result = acme.verify_certificates(
+                '127.0.0.1', 'device.example.com', port=sock.getsockname()[1], timeout=0.5)[0]
+        assert result.error == 'Timeout'
+
+
+class TestDriftScanner:
+    def _item(self, system_name, common_name, expiration='None', certificate_authority='lets_encrypt'):
+        return {
+            'system_name': system_name,
+            'common_name': common_name,
+            'certificate_authority': certificate_authority,
+            'certificate_expiration': expiration,
+            'subject_alternative_name': []
+        }
+
+    def test_scan_endpoints(self, tls_server):
+        current = tls_server.add('current.example.com')
+        tls_server.add('stale.example.com')
+        items = [
+            self._item('127.0.0.1', 'current.example.com', current.not_valid_after.isoformat()),
+            self._item('127.0.0.1', 'stale.example.com', '2021-01-01T00:00:00'),
+            self._item('127.0.0.1', 'unknown.example.com', certificate_authority='digicert')
+        ]
+        records = asyncio.run(drift.scan_endpoints(items, port=tls_server.port, concurrency=2))
+        assert [record.drift for record in records] == [
+            [], ['certificate_expiration'], ['certificate_expiration', 'certificate_authority']]
+        assert all(record.latency > 0 for record in records)
+
+    def test_unreachable_not_drifted(self):
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            port = sock.getsockname()[1]
+        report = acme.reconcile([self._item('127.0.0.1', 'device.example.com')], port=port)
+        assert len(report.errors) == 1
+        assert not report.drifted
+        assert report.summary()['endpoints'] == 1
+
+    def test_percentile(self):
+        values = [float(value) for value in range(1, 101)]
+        assert drift.percentile(values, 50) == 50
+        assert drift.percentile(values, 99) == 99
+        assert drift.percentile([], 90) == 0.0
+
+    @mock_dynamodb2
+    def test_reconcile_updates_table(self, init_database, tls_server):
+        init_database()
+        served = tls_server.add('example.com')
+        table = boto3.resource('dynamodb', region_name='us-east-1').Table('ottr-example')
+        items = drift.scan_inventory(table)
+        device = next(item for item in items if item['system_name'] == 'example.com')
+
+        async def scan(items, port, timeout, concurrency):
+            endpoint = await verify_endpoint('127.0.0.1', 'example.com', tls_server.port, timeout)
+            return [drift.DriftRecord(device, endpoint, 0.01, drift.find_drift(device, endpoint))]
+
+        with patch('acme.acme.drift.scan_endpoints', scan):
+            report = acme.reconcile([device], dry_run=False, table=table)
+        assert len(report.drifted) == 1
+        updated = table.get_item(Key={'system_name': 'example.com'})['Item']
+        assert updated['certificate_expiration'] == served.not_valid_after.isoformat()
+        assert updated['subject_alternative_name'] == device['subject_alternative_name']
+
+    @mock_dynamodb2
+    def test_reconcile_keeps_concurrent_rotation(self, init_database, tls_server):
+        init_database()
+        tls_server.add('example.com')
+        table = boto3.resource('dynamodb', region_name='us-east-1').Table('ottr-example')
+        device = next(item for item in drift.scan_inventory(table) if item['system_name'] == 'example.com')
+
+        async def scan(items, port, timeout, concurrency):
+            endpoint = await verify_endpoint('127.0.0.1', 'example.com', tls_server.port, timeout)
+            # Rotation Records a New Expiration After the Scan
+            table.update_item(Key={'system_name': 'example.com'},
+                              UpdateExpression='SET certificate_expiration = :value',
+                              ExpressionAttributeValues={':value': '2099-01-01T00:00:00'})
+            return [drift.DriftRecord(device, endpoint, 0.01, drift.find_drift(device, endpoint))]
+
+        with patch('acme.acme.drift.scan_endpoints', scan):
+            report = acme.reconcile([device], dry_run=False, table=table)
+        assert len(report.drifted) == 1
+        updated = table.get_item(Key={'system_name': 'example.com'})['Item']
+        assert updated['certificate_expiration'] == '2099-01-01T00:00:00'
@@ -66,7 +66,7 @@ class UsersLogin(Resource):
                 return {'token': f'Bearer {token}'}
 
             else:
-                LOGGER.info(f'{username} Authentication Failure')
+                LOGGER.info('%s Authentication Failure', username)
                 return {'message': 'Authentication Failure'}, 401
 
         except Exception as error:
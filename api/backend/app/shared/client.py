@@ -14,10 +14,12 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 
+import base64
 import json
 import os
 import time
 import re
+import zlib
 from typing import Union
 
 import boto3
@@ -96,6 +98,51 @@ def _get_hosted_zone_id(device: dict) -> str:
         return metadata['hosted_zones'].get(domain)
 
 
+def get_panorama(device: dict) -> Union[dict, None]:
+    """Panorama hostname, template and device group when the route pushes through Panorama."""
+    with open(CONF_ROUTE_FILE, 'r') as file:
+        routes = json.load(file)
+    try:
+        route = routes['platform'][device.get('host_platform')]['os'][device.get('os_version')]
+        return route.get('panorama')
+    except (KeyError, TypeError, AttributeError):
+        return None
+
+
+def get_key_type(device: dict) -> str:
+    """Private key algorithm (rsa or ecdsa) for the device route, default rsa."""
+    with open(CONF_ROUTE_FILE, 'r') as file:
+        routes = json.load(file)
+    try:
+        route = routes['platform'][device.get('host_platform')]['os'][device.get('os_version')]
+        return route.get('key_type', 'rsa')
+    except (KeyError, TypeError, AttributeError):
+        return 'rsa'
+
+
+# Compact Keys Shared With acme.DeviceContext
+DEVICE_CONTEXT_FIELDS = {
+    'system_name': 's',
+    'common_name': 'c',
+    'subject_alternative_name': 'n',
+    'host_platform': 'p',
+    'os_version': 'o',
+    'device_model': 'm',
+    'certificate_authority': 'a',
+    'certificate_validation': 'v',
+    'key_type': 'k',
+    'members': 'g',
+    'panorama': 'x'
+}
+
+
+def encode_device_context(device: dict) -> str:
+    context = {key: device[field] for field, key in DEVICE_CONTEXT_FIELDS.items()
+               if device.get(field) is not None}
+    data = json.dumps(context, separators=(',', ':'), default=str).encode('utf-8')
+    return base64.urlsafe_b64encode(zlib.compress(data, 9)).decode('ascii')
+
+
 def start_execution(device):
     task_definition = _validate_route(device)
     hosted_zone_id = _get_hosted_zone_id(device)
@@ -113,7 +160,10 @@ def start_execution(device):
                 "common_name": common_name,
                 "certificate_validation": certificate_validation,
                 "task_definition": task_definition,
-                "dns": hosted_zone_id
+                "dns": hosted_zone_id,
+                "context": encode_device_context(
+                    dict(device, key_type=get_key_type(device),
+                         panorama=get_panorama(device)))
             }
         ],
         "region": region,
@@ -207,9 +257,9 @@ class DynamoDBClient:
         }
         response = self._table.put_item(Item=payload)
         if response['ResponseMetadata']['HTTPStatusCode'] == 200:
-            LOGGER.info(f'New Item Created in DynamoDB: {payload}')
+            LOGGER.info('New Item Created in DynamoDB: %s', payload['system_name'])
         else:
-            LOGGER.error(f'Error ({device.system_name}): {response}')
+            LOGGER.error('Error (%s): %s', device.system_name, response)
         return response
 
     def update_item(self, device: Device) -> Union[dict, None]:
@@ -235,7 +285,7 @@ class DynamoDBClient:
             ReturnValues="ALL_NEW"
         )
         if response['ResponseMetadata']['HTTPStatusCode'] != 200:
-            LOGGER.error(f'Error ({device.system_name}): {response}')
+            LOGGER.error('Error (%s): %s', device.system_name, response)
         return response
 
     def set_certificate_validation(self, system_name: str, status: str) -> Union[dict, None]:
@@ -250,7 +300,7 @@ class DynamoDBClient:
             ReturnValues="ALL_NEW"
         )
         if response['ResponseMetadata']['HTTPStatusCode'] != 200:
-            LOGGER.error(f'Error ({system_name}): {response}')
+            LOGGER.error('Error (%s): %s', system_name, response)
         return response
 
     def scan_table(self) -> dict:
@@ -261,7 +311,8 @@ class DynamoDBClient:
             [dict]: AWS DynamoDB scan() Response
         """
         response = self._table.scan()
-        LOGGER.info(f'Scanned Table: {response}')
+        LOGGER.info('Scanned Table: %s Items', response.get('Count'))
+        LOGGER.debug('Scanned Table: %s', response)
         return response
 
     def delete_item(self, system_name: str) -> dict:
@@ -282,5 +333,5 @@ class DynamoDBClient:
             },
             ConditionExpression="attribute_exists (system_name)",
         )
-        LOGGER.info(f'Deleted {system_name} from DynamoDB: {response}')
+        LOGGER.info('Deleted %s from DynamoDB', system_name)
         return response
@@ -89,6 +89,14 @@ data "aws_iam_policy_document" "otter_appliance_ecs_fargate_policy_document" {
     ]
   }
 
+  statement {
+    effect    = "Allow"
+    resources = ["arn:aws:route53:::change/*"]
+    actions = [
+      "route53:GetChange"
+    ]
+  }
+
   statement {
     effect = "Allow"
     resources = [
@@ -98,6 +106,26 @@ data "aws_iam_policy_document" "otter_appliance_ecs_fargate_policy_document" {
       "secretsmanager:GetSecretValue"
     ]
   }
+
+  # Configuration Backups (acme.S3Sink); HeadObject is Authorized by
+  # s3:GetObject, and s3:ListBucket Makes a Missing LATEST Return 404
+  statement {
+    effect    = "Allow"
+    resources = ["arn:aws:s3:::${var.backup_bucket}/otter/*"]
+    actions = [
+      "s3:PutObject",
+      "s3:GetObject",
+      "s3:AbortMultipartUpload"
+    ]
+  }
+
+  statement {
+    effect    = "Allow"
+    resources = ["arn:aws:s3:::${var.backup_bucket}"]
+    actions = [
+      "s3:ListBucket"
+    ]
+  }
 }
 
 data "aws_iam_policy_document" "otter_server_ecs_fargate_policy_document" {
@@ -150,6 +178,14 @@ data "aws_iam_policy_document" "otter_server_ecs_fargate_policy_document" {
     ]
   }
 
+  statement {
+    effect    = "Allow"
+    resources = ["arn:aws:route53:::change/*"]
+    actions = [
+      "route53:GetChange"
+    ]
+  }
+
   statement {
     effect = "Allow"
     resources = [
@@ -165,7 +201,9 @@ data "aws_iam_policy_document" "otter_server_ecs_fargate_policy_document" {
     resources = ["*"]
     actions = [
       "ssm:DescribeInstanceInformation",
-      "ssm:GetCommandInvocation"
+      "ssm:GetCommandInvocation",
+      "ssm:ListCommandInvocations",
+      "tag:GetResources"
     ]
   }
 
@@ -10,8 +10,24 @@ resource "aws_sfn_state_machine" "otter" {
 		"Map": {
 			"Type": "Map",
 			"Iterator": {
-				"StartAt": "PlatformTaskExecution",
+				"StartAt": "DeviceContext",
 				"States": {
+					"DeviceContext": {
+						"Type": "Choice",
+						"Choices": [{
+							"Variable": "$.asset.context",
+							"IsPresent": false,
+							"Next": "DefaultDeviceContext"
+						}],
+						"Default": "PlatformTaskExecution"
+					},
+					"DefaultDeviceContext": {
+						"Comment": "Empty DEVICE_CONTEXT: Container Queries DynamoDB for Device Context",
+						"Type": "Pass",
+						"Result": "",
+						"ResultPath": "$.asset.context",
+						"Next": "PlatformTaskExecution"
+					},
 					"PlatformTaskExecution": {
 						"Type": "Task",
 						"TimeoutSeconds": 600,
@@ -40,6 +56,10 @@ resource "aws_sfn_state_machine" "otter" {
 											"Name": "HOSTED_ZONE_ID",
 											"Value.$": "$.asset.dns"
 										},
+										{
+											"Name": "DEVICE_CONTEXT",
+											"Value.$": "$.asset.context"
+										},
 										{
 											"Name": "AWS_REGION",
 											"Value.$": "$.region"
@@ -60,6 +80,10 @@ resource "aws_sfn_state_machine" "otter" {
 											"Name": "PREFIX",
 											"Value": "${var.prefix}"
 										},
+										{
+											"Name": "OTTR_BACKUP_URI",
+											"Value": "s3://${var.backup_bucket}/otter"
+										},
 										{
 											"Name": "country",
 											"Value": "${var.country}"
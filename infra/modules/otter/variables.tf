@@ -44,6 +44,16 @@ variable "cloudwatch_schedule" {
 }
 
 
+variable "backup_bucket" {
+  description = "S3 bucket for PAN-OS configuration backups (OTTR_BACKUP_URI=s3://[backup_bucket]/otter). Fargate task storage is ephemeral, so a bucket is required."
+  type        = string
+
+  validation {
+    condition     = length(var.backup_bucket) > 0
+    error_message = "The backup_bucket value must be the name of an S3 bucket."
+  }
+}
+
 variable "prefix" {
   type    = string
   default = "prod"
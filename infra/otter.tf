@@ -10,6 +10,7 @@ module "otter" {
   region                = "us-east-21"
   cloudwatch_schedule   = "rate(12 hours)"
   prefix                = "development"
+  backup_bucket         = "example-ottr-backups"
 
   # Certificate Signing Request Parameters
   country           = "US"
@@ -0,0 +1,27 @@
+"""
+Reconcile certificate_expiration in the asset inventory with the certificate
+each device actually serves. Requires ottr-airbnb and the AWS_REGION and
+DYNAMODB_TABLE environment variables.
+
+    python drift.py --concurrency 1000 --timeout 5 [--apply]
+"""
+
+import argparse
+import json
+
+import acme
+
+LOGGER = acme.get_logger(__name__)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Ottr Certificate Drift Scanner')
+    parser.add_argument('--concurrency', type=int, default=500)
+    parser.add_argument('--timeout', type=float, default=5)
+    parser.add_argument('--port', type=int, default=443)
+    parser.add_argument('--apply', action='store_true',
+                        help='Write Served Expiration for Drifted Records')
+    args = parser.parse_args()
+
+    report = acme.reconcile(port=args.port, timeout=args.timeout,
+                            concurrency=args.concurrency, dry_run=not args.apply)
+    LOGGER.info('Drift Scan Summary: %s', json.dumps(report.summary()))
@@ -17,14 +17,16 @@ payload = {
             "common_name": "panos01.example.com",
             "certificate_validation": "True",
             "task_definition": "otter-panos-9x-lets-encrypt",
-            "dns": "xxx (Route53 Hosted Zone ID)"
+            "dns": "xxx (Route53 Hosted Zone ID)",
+            "context": ""  # Empty: Container Queries DynamoDB for Device Context
         },
         {
             "hostname": "f501.example.com",
             "common_name": "f501.example.com",
             "certificate_validation": "False",
             "task_definition": "otter-f5-14x-lets-encrypt",
-            "dns": "xxx (Route53 Hosted Zone ID)"
+            "dns": "xxx (Route53 Hosted Zone ID)",
+            "context": ""  # Empty: Container Queries DynamoDB for Device Context
         }
     ],
     "region": REGION,
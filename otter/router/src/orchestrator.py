@@ -16,7 +16,7 @@ import json
 
 from shared.device import Device
 from shared.logger import get_logger
-from shared.client import start_execution, lookup_attributes, get_acme_challenge_records, get_valid_devices, DynamoDBClient
+from shared.client import start_execution, lookup_attributes, get_acme_challenge_records, get_valid_devices, group_rotation_assets, encode_rotation_group, DynamoDBClient
 
 LOGGER = get_logger(__name__)
 CONF_ROUTE_FILE = os.path.join(
@@ -48,7 +48,8 @@ renewal depending on if platform is supported.
     # Scan DDB for Hosts Set / Check Certificate Expiration
     assets = dynamodb_client.scan_table()
     rotate_assets = get_valid_devices(assets, available_records)
-    LOGGER.info('Rotate Certificates: %s', str(rotate_assets))
+    LOGGER.info('Rotate Certificates: %s',
+                [device.get('system_name') for device in rotate_assets])
 
     payload = {
         "assets": [],
@@ -56,17 +57,20 @@ renewal depending on if platform is supported.
         "table": os.environ['dynamodb_table']
     }
 
-    for device in rotate_assets:
-        task_definition, hosted_zone_id = lookup_attributes(device)
-        if task_definition is not None:
-            asset = {
-                "hostname": device.get('system_name'),
-                "common_name": device.get('common_name'),
-                "certificate_validation": device.get('certificate_validation'),
-                "task_definition": task_definition,
-                "dns": hosted_zone_id
-            }
-            payload['assets'].append(asset)
+    # One Certificate Order per Rotation Group (i.e. HA Pairs, Panorama Templates)
+    for group in group_rotation_assets(rotate_assets):
+        for device, context in encode_rotation_group(group):
+            task_definition, hosted_zone_id = lookup_attributes(device)
+            if task_definition is not None:
+                asset = {
+                    "hostname": device.get('system_name'),
+                    "common_name": device.get('common_name'),
+                    "certificate_validation": device.get('certificate_validation'),
+                    "task_definition": task_definition,
+                    "dns": hosted_zone_id,
+                    "context": context
+                }
+                payload['assets'].append(asset)
 
     if payload['assets']:
         data = json.dumps(payload)
@@ -17,8 +17,10 @@ limitations under the License.
 import os
 import json
 import time
+import zlib
+import base64
 import dateutil
-from typing import List, Set, Union
+from typing import List, Set, Tuple, Union
 from datetime import datetime, timedelta
 
 import boto3
@@ -78,9 +80,9 @@ class DynamoDBClient:
         }
         response = self._table.put_item(Item=payload)
         if response['ResponseMetadata']['HTTPStatusCode'] == 200:
-            LOGGER.info(f'New Item Created in DynamoDB: {payload}')
+            LOGGER.info('New Item Created in DynamoDB: %s', payload['system_name'])
         else:
-            LOGGER.error(f'Error ({device.system_name}): {response}')
+            LOGGER.error('Error (%s): %s', device.system_name, response)
         return response
 
     def update_item(self, device: Device) -> Union[dict, None]:
@@ -105,7 +107,7 @@ class DynamoDBClient:
             ReturnValues="ALL_NEW"
         )
         if response['ResponseMetadata']['HTTPStatusCode'] != 200:
-            LOGGER.error(f'Error ({device.system_name}): {response}')
+            LOGGER.error('Error (%s): %s', device.system_name, response)
         return response
 
     def scan_table(self) -> dict:
@@ -116,7 +118,8 @@ class DynamoDBClient:
             [dict]: AWS DynamoDB scan() Response
         """
         response = self._table.scan()
-        LOGGER.info(f'Scanned Table: {response}')
+        LOGGER.info('Scanned Table: %s Items', response.get('Count'))
+        LOGGER.debug('Scanned Table: %s', response)
         return response
 
     def delete_item(self, system_name: str) -> dict:
@@ -137,7 +140,7 @@ class DynamoDBClient:
             },
             ConditionExpression="attribute_exists (system_name)",
         )
-        LOGGER.info(f'Deleted {system_name} from DynamoDB: {response}')
+        LOGGER.info('Deleted %s from DynamoDB', system_name)
         return response
 
 def _validate_route(host: dict) -> Union[str, None]:
@@ -177,6 +180,80 @@ def _get_hosted_zone_id(device: dict) -> str:
         return metadata['hosted_zones'].get(domain)
 
 
+def rotation_group_key(device: dict) -> tuple:
+    """Devices with the same key can be issued one certificate from one order."""
+    return (device.get('common_name'),
+            tuple(sorted(device.get('subject_alternative_name') or [])),
+            device.get('certificate_authority'),
+            _validate_route(device))
+
+
+def group_rotation_assets(devices: List[dict]) -> List[List[dict]]:
+    """
+    Group devices sharing (common_name, sorted SANs, CA, task definition),
+    i.e. HA pairs. Only routes with a key_type generate the private key
+    off-device and can deploy the same key pair to every member; all other
+    devices form a group of one. Routes that push through Panorama group on
+    the Panorama template instead: the template carries one certificate for
+    every device it is pushed to, so concurrent groups would overwrite it.
+    """
+    with open(CONF_ROUTE_FILE, 'r') as file:
+        routes = json.load(file)
+    groups = {}
+    for device in devices:
+        try:
+            route = routes['platform'][device.get('host_platform')]['os'][device.get('os_version')]
+            shared = 'key_type' in route
+            panorama = route.get('panorama')
+        except (KeyError, TypeError, AttributeError):
+            shared = False
+            panorama = None
+        if panorama:
+            key = ('panorama', panorama.get('hostname'), panorama.get('template'))
+        elif shared:
+            key = rotation_group_key(device)
+        else:
+            key = (device.get('system_name'),)
+        groups.setdefault(key, []).append(device)
+    return list(groups.values())
+
+
+def group_subject_alternative_names(group: List[dict]) -> List[str]:
+    """
+    SANs covering every member of a rotation group: the members' common
+    names and SANs, less the common name of the first member.
+    """
+    names = set()
+    for device in group:
+        names.add(device.get('common_name'))
+        names.update(device.get('subject_alternative_name') or [])
+    names.discard(group[0].get('common_name'))
+    names.discard(None)
+    return sorted(names)
+
+
+def get_panorama(device: dict) -> Union[dict, None]:
+    """Panorama hostname, template and device group when the route pushes through Panorama."""
+    with open(CONF_ROUTE_FILE, 'r') as file:
+        routes = json.load(file)
+    try:
+        route = routes['platform'][device.get('host_platform')]['os'][device.get('os_version')]
+        return route.get('panorama')
+    except (KeyError, TypeError, AttributeError):
+        return None
+
+
+def get_key_type(device: dict) -> str:
+    """Private key algorithm (rsa or ecdsa) for the device route, default rsa."""
+    with open(CONF_ROUTE_FILE, 'r') as file:
+        routes = json.load(file)
+    try:
+        route = routes['platform'][device.get('host_platform')]['os'][device.get('os_version')]
+        return route.get('key_type', 'rsa')
+    except (KeyError, TypeError, AttributeError):
+        return 'rsa'
+
+
 def lookup_attributes(device):
     task_definition = _validate_route(device)
     hosted_zone_id = _get_hosted_zone_id(device)
@@ -202,6 +279,67 @@ def get_valid_devices(assets: dict, hosts: List) -> List:
     return rotate_assets
 
 
+# Compact Keys Shared With acme.DeviceContext
+DEVICE_CONTEXT_FIELDS = {
+    'system_name': 's',
+    'common_name': 'c',
+    'subject_alternative_name': 'n',
+    'host_platform': 'p',
+    'os_version': 'o',
+    'device_model': 'm',
+    'certificate_authority': 'a',
+    'certificate_validation': 'v',
+    'key_type': 'k',
+    'members': 'g',
+    'panorama': 'x'
+}
+
+
+def encode_device_context(device: dict) -> str:
+    """
+    Compact, compressed encoding of the inventory item passed to the ECS task
+    as DEVICE_CONTEXT so the platform does not need to query DynamoDB again.
+    """
+    context = {key: device[field] for field, key in DEVICE_CONTEXT_FIELDS.items()
+               if device.get(field) is not None}
+    data = json.dumps(context, separators=(',', ':'), default=str).encode('utf-8')
+    return base64.urlsafe_b64encode(zlib.compress(data, 9)).decode('ascii')
+
+
+# ECS Caps a Task's Container Overrides at 8 KB; Leave Room for the Other Variables
+MAX_DEVICE_CONTEXT_LENGTH = 4096
+
+
+def encode_rotation_group(group: List[dict]) -> List[Tuple[dict, str]]:
+    """
+    Device and encoded DEVICE_CONTEXT for each task a rotation group needs:
+    one for the whole group, or one per member when the group context does
+    not fit in the container overrides.
+    """
+    device = group[0]
+    context = dict(device, key_type=get_key_type(device),
+                   panorama=get_panorama(device))
+    if len(group) > 1:
+        context['members'] = [member.get('system_name') for member in group]
+        # One Certificate Served by Every Member (i.e. a Panorama Template)
+        context['subject_alternative_name'] = group_subject_alternative_names(group)
+    encoded = encode_device_context(context)
+    if len(encoded) <= MAX_DEVICE_CONTEXT_LENGTH:
+        if len(group) > 1:
+            LOGGER.info('Rotation Group %s: %s', device.get('common_name'), context['members'])
+        return [(device, encoded)]
+
+    LOGGER.warning('Rotation Group %s Context is %s Bytes (Limit %s), Rotating %s Devices Individually',
+                   device.get('common_name'), len(encoded), MAX_DEVICE_CONTEXT_LENGTH, len(group))
+    contexts = []
+    for member in group:
+        # Direct Device Import; Concurrent Panorama Template Pushes Would Overwrite Each Other
+        encoded = encode_device_context(dict(member, key_type=get_key_type(member)))
+        # Empty Context Makes the Task Read its Inventory Item From DynamoDB
+        contexts.append((member, encoded if len(encoded) <= MAX_DEVICE_CONTEXT_LENGTH else ''))
+    return contexts
+
+
 def start_execution(data):
     sfn_client = boto3.client('stepfunctions')
     output = sfn_client.start_execution(
@@ -1,52 +1,100 @@
 #!/usr/local/bin/python
 
 import os
-from re import sub
 import sys
 import requests
 import json
-import time
-import subprocess
-import sys
 
 import acme
 
 LOGGER = acme.get_logger(__name__)
 
-
-def restart_httpd(username, password, hostname):
-    commands = ['restart /sys service httpd',
-                'tmsh restart /sys service httpd']
-    for command in commands:
-        output = subprocess.Popen(f"sshpass -p {password} \
-                                ssh {username}@{hostname} {command}",
-                                  shell=True, stdout=subprocess.PIPE,
-                                  stderr=subprocess.PIPE).communicate()
-        if output[0]:
-            return output
-    sys.exit(1)
-
-
-def upload_certificate_sshpass(username, hostname, password, local_file, remote_file):
-    p = subprocess.Popen([
-        "sshpass",
-        "-p",
-        f"{password}",
-        "scp",
-        "-oStrictHostKeyChecking=no",
-        local_file,
-        f"{username}@{hostname}:{remote_file}"
-    ])
-
-    # Wait for Each Process to Finish
-    while p.poll() == None:
-        time.sleep(1)
-        p.poll()
-    (results, errors) = p.communicate()
-    if errors == "" or errors == None:
-        return results
-    else:
-        sys.exit(1)
+# iControl REST Accepts at Most 1 MB per File Transfer Request
+UPLOAD_CHUNK_SIZE = 512 * 1024
+UPLOAD_DIRECTORY = '/var/config/rest/downloads'
+
+# Device Certificate and Key Served by httpd
+SERVER_CERTIFICATE = '/config/httpd/conf/ssl.crt/server.crt'
+SERVER_KEY = '/config/httpd/conf/ssl.key/server.key'
+
+
+class Transaction:
+    """
+    iControl REST transaction. Requests sent through stage() carry the
+    coordination ID, are only validated when sent, and are applied together
+    by commit(). Leaving the block without committing discards them.
+    """
+
+    def __init__(self, hostname, headers):
+        self.url = f'https://{hostname}/mgmt/tm/transaction'
+        self.headers = headers
+        self.transaction_id = None
+        self.staged = 0
+
+    def __enter__(self):
+        response = acme_request.post(self.url, headers=self.headers, data=json.dumps({}))
+        self.transaction_id = response.json()['transId']
+        LOGGER.info('Transaction %s Started', self.transaction_id)
+        return self
+
+    def __exit__(self, *args):
+        if self.transaction_id is not None:
+            acme_request.delete(f'{self.url}/{self.transaction_id}', headers=self.headers)
+            LOGGER.info('Transaction %s Discarded', self.transaction_id)
+
+    def stage(self, method, url, payload=None):
+        headers = dict(self.headers, **{'X-F5-REST-Coordination-Id': str(self.transaction_id)})
+        data = json.dumps(payload) if payload is not None else None
+        if method == 'DELETE':
+            acme_request.delete(url, headers=headers)
+        elif method == 'PATCH':
+            acme_request.patch(url, headers=headers, data=data)
+        else:
+            acme_request.post(url, headers=headers, data=data)
+        self.staged += 1
+
+    def commit(self):
+        response = acme_request.patch(f'{self.url}/{self.transaction_id}', headers=self.headers,
+                                      data=json.dumps({'state': 'VALIDATING'})).json()
+        if response.get('state') != 'COMPLETED':
+            raise acme.OtterExceptionError(
+                f'Transaction {self.transaction_id} Not Applied: {response}')
+        LOGGER.info('Transaction %s Committed (%s Operations)', self.transaction_id, self.staged)
+        self.transaction_id = None
+
+
+@acme.phase('restart_httpd')
+def restart_httpd(headers, hostname):
+    url = f'https://{hostname}/mgmt/tm/sys/service'
+    payload = {
+        "command": "restart",
+        "name": "httpd"
+    }
+    try:
+        response = acme_request.post(url, headers=headers, data=json.dumps(payload))
+    except requests.exceptions.ConnectionError:
+        # httpd Fronts iControl REST, so the Restart Can Close the Connection
+        LOGGER.info('Connection Closed by httpd Restart on %s', hostname)
+        return None
+    return response.text
+
+
+def upload_file(headers, hostname, local_file, remote_name):
+    """
+    Upload local_file to UPLOAD_DIRECTORY/remote_name over the pooled
+    iControl REST session in Content-Range chunks.
+    """
+    url = f'https://{hostname}/mgmt/shared/file-transfer/uploads/{remote_name}'
+    size = os.path.getsize(local_file)
+    with open(local_file, 'rb') as file:
+        for start in range(0, size, UPLOAD_CHUNK_SIZE):
+            chunk = file.read(UPLOAD_CHUNK_SIZE)
+            upload_headers = dict(headers, **{
+                'Content-Type': 'application/octet-stream',
+                'Content-Range': f'{start}-{start + len(chunk) - 1}/{size}'
+            })
+            acme_request.post(url, headers=upload_headers, data=chunk)
+    return f'{UPLOAD_DIRECTORY}/{remote_name}'
 
 
 def get_token(url, username, password):
@@ -63,10 +111,105 @@ def _execute_bash(command, headers, hostname):
         "command": "run",
         "utilCmdArgs": f"-c '{command}'"
     }
-    response = acme_request.post(url, headers=headers, data=json.dumps(payload)).text
+    response = acme_request.post(url, headers=headers, data=json.dumps(payload)).json()
     LOGGER.info(response)
+    return response.get('commandResult', '')
+
+
+def get_crypto_objects(url_base, headers, collection):
+    url = f'{url_base}/tm/sys/crypto/{collection}?$select=name'
+    response = acme_request.get(url, headers=headers).json()
+    return {item['name'] for item in response.get('items', [])}
+
+
+def deploy_certificate(hostname, username, password, certificate_name, certificate_path, key_path):
+    LOGGER.info('Host: [%s]', hostname)
 
+    # Authenticate
+    url_base = f'https://{hostname}/mgmt'
+    url_auth = f'{url_base}/shared/authn/login'
+
+    token = get_token(url_auth, username, password)
+    headers = {
+        'Content-Type': 'application/json',
+        'X-F5-Auth-Token': token
+    }
 
+    remote_certificate = upload_file(headers, hostname, certificate_path,
+                                     f'{certificate_name}.crt')
+    remote_key = upload_file(headers, hostname, key_path,
+                             f'{certificate_name}.key')
+    LOGGER.info("Certificate and Private Key Pushed")
+
+    # Backup Before Any Step That Can Trigger the Revert Below
+    steps = [
+        f'cp {SERVER_CERTIFICATE} {SERVER_CERTIFICATE}.backup',
+        f'cp {SERVER_KEY} {SERVER_KEY}.backup',
+        'echo saved'
+    ]
+    result = _execute_bash(' && '.join(steps), headers, hostname)
+    if 'saved' not in result:
+        _execute_bash(f'rm -f {remote_key}', headers, hostname)
+        LOGGER.error('Certificate Backup Failed on `%s`: %s', hostname, result)
+        sys.exit(1)
+
+    try:
+        # Install Files in One bash Invocation, Stopping at the First Failure
+        steps = [
+            f'cp {remote_key} {SERVER_KEY}',
+            f'cp {remote_certificate} {SERVER_CERTIFICATE}',
+            f'rm -f {remote_key}',
+            'echo installed'
+        ]
+        result = _execute_bash(' && '.join(steps), headers, hostname)
+        if 'installed' not in result:
+            raise acme.OtterExceptionError(f'Certificate Install Failed: {result}')
+
+        output = restart_httpd(headers, hostname)
+        LOGGER.info(output)
+    # Revert Logic (HTTP Errors Exit Through acme.Request)
+    except (Exception, SystemExit) as error:
+        steps = [
+            f'cp {SERVER_CERTIFICATE}.backup {SERVER_CERTIFICATE}',
+            f'cp {SERVER_KEY}.backup {SERVER_KEY}',
+            f'rm -f {remote_key}'
+        ]
+        _execute_bash('; '.join(steps), headers, hostname)
+
+        output = restart_httpd(headers, hostname)
+        LOGGER.info(output)
+
+        message = 'Error Restarting httpd on `{hostname}`. Reverted Previous State.'.format(
+            hostname=hostname)
+        LOGGER.error(message, error)
+        sys.exit(1)
+
+    # Outside the Revert Path: a Failed Cleanup Leaves the New Certificate in Service
+    try:
+        remove_crypto_objects(url_base, headers, hostname, certificate_name)
+    except (Exception, SystemExit) as error:
+        LOGGER.warning('Crypto Object Cleanup Failed on `%s`: %s', hostname, error)
+
+
+def remove_crypto_objects(url_base, headers, hostname, certificate_name):
+    """
+    Delete key and CSR objects left by on-device generation (before keys
+    were generated off-device) in one transaction. httpd reads its
+    certificate and key from files, not tmsh objects, so the install itself
+    cannot be part of the transaction.
+    """
+    stale = [(collection, name) for collection, name in
+             (('csr', f'{certificate_name}.csr'), ('key', f'{certificate_name}.key'))
+             if name in get_crypto_objects(url_base, headers, collection)]
+    if not stale:
+        return
+    with Transaction(hostname, headers) as transaction:
+        for collection, name in stale:
+            transaction.stage('DELETE', f'{url_base}/tm/sys/crypto/{collection}/~Common~{name}')
+        transaction.commit()
+
+
+@acme.phase('rotation')
 def main():
     # Disable Warnings Requests Package
     requests.packages.urllib3.disable_warnings()
@@ -84,10 +227,12 @@ def main():
     password = acme.get_secret(
         f'{prefix}/otter/f5', 'password', region_name)
 
+    acme.set_phase_labels(device=hostname, platform='f5-14.x')
     acme_request = acme.Request(validation=validation)
 
-    subject_alternative_names = acme.query_subject_alternative_names(
-        hostname)
+    # Device Context Passed From Router (Falls Back to DynamoDB)
+    context = acme.DeviceContext.load(hostname)
+    subject_alternative_names = context.subject_alternative_names
 
     le_client = acme.LetsEncrypt(
         hostname=hostname,
@@ -96,120 +241,42 @@ def main():
         subject_alternative_names=subject_alternative_names,
         region=region_name)
 
-    # Authenticate
-    url_base = f'https://{hostname}/mgmt'
-    url_auth = f'{url_base}/shared/authn/login'
-
-    token = get_token(url_auth, username, password)
-    headers = {
-        'Content-Type': 'application/json',
-        'X-F5-Auth-Token': token
-    }
-
     certificate_name = 'otter'
 
-    # Remove Previous Configuration
-    removals = [
-        f"tmsh delete sys crypto csr {certificate_name}.csr",
-        f"tmsh delete sys crypto key {certificate_name}.key"
-    ]
-    for command in removals:
-        _execute_bash(command, headers, hostname)
-
-    # Generate Public/Private Key Pair and CSR
-    url = f"https://{hostname}/mgmt/tm/sys/crypto/key"
-    payload = {
-        "name": f"{certificate_name}.key"
-    }
-    response = acme_request.post(url, headers=headers, data=json.dumps(payload))
-    LOGGER.info(response.text)
-
-    url = f"https://{hostname}/mgmt/tm/sys/crypto/csr"
-    payload = {
-        "name": f"{certificate_name}.csr",
-        "key": f"{certificate_name}.key",
-        "common-name": f"{common_name}",
-        "organization": os.environ['organization'],
-        "ou": os.environ['organization_unit'],
-        "state": os.environ['state'],
-        "city": os.environ['locality'],
-        # "subject-alternative-name": "",
-    }
-    response = acme_request.post(url, headers=headers, data=json.dumps(payload))
-    LOGGER.info(response.text)
-
-    # Pull CSR to Filesystem (Container or Local)
-    url = f'https://{hostname}/mgmt/tm/util/bash'
-    payload = {
-        "command": "run",
-        "utilCmdArgs": f"-c 'tmsh list sys crypto csr {certificate_name}.csr'"
-    }
-    response = acme_request.post(url, headers=headers, data=json.dumps(payload))
-    csr_output = json.loads(
-        response.text).get('commandResult')
-    begin_request = '-----BEGIN CERTIFICATE REQUEST-----'
-    end_request = '-----END CERTIFICATE REQUEST-----'
-    begin = csr_output.rindex(begin_request) + len(begin_request)
-    end = csr_output.rindex(end_request, begin)
-    certificate_signing_request = begin_request + \
-        csr_output[begin:end] + end_request
-
-    with open(f"{certificate_name}.csr", "wt") as file:
-        file.write(certificate_signing_request)
+    # Private Key and CSR Generated Off-Device (RSA or ECDSA per Route)
+    with acme.phase('keygen'):
+        key_path, csr_path = acme.generate_key_and_csr(
+            common_name, subject_alternative_names, context.key_type,
+            name=certificate_name)
 
     # Sign CSR Using Let's Encrypt as Certificate Authority
-    le_client.acme_production(csr=f'{certificate_name}.csr')
-
-    # Private Key Location
-    url = f'https://{hostname}/mgmt/tm/adc/fileobject/ssl-key'
-    response = json.loads(acme_request.get(url, headers=headers).text)
+    with acme.phase('acme_order'):
+        le_client.acme_production(csr=csr_path)
 
-    for item in response['items']:
-        name = item.get('name')
-        if name == f'{certificate_name}.key':
-            private_key_path = item.get('cachePath')
-            break
-
-    home = os.environ['HOME']
+    certificate_path = acme.certificate_chain_path(common_name, context.key_type)
     os.system(
-        f'openssl x509 -inform PEM -in {home}/.acme.sh/{hostname}/fullchain.cer -out ./{certificate_name}.crt')
-
-    upload_certificate_sshpass(username, hostname, password,
-                               f'{certificate_name}.crt', f'/var/tmp/{certificate_name}.crt')
-    LOGGER.info("Certificate Pushed")
+        f'openssl x509 -inform PEM -in {certificate_path} -out ./{certificate_name}.crt')
 
+    # Issued Once, Deployed to Every Rotation Group Member (i.e. HA Pairs)
+    fingerprint = acme.certificate_fingerprint(f'{certificate_name}.crt')
     try:
-        steps = [
-            'cp /config/httpd/conf/ssl.crt/server.crt /config/httpd/conf/ssl.crt/server.crt.backup',
-            'cp /config/httpd/conf/ssl.key/server.key /config/httpd/conf/ssl.key/server.key.backup',
-            f'cp {private_key_path} /config/httpd/conf/ssl.key/server.key',
-            f'cp /var/tmp/{certificate_name}.crt /config/httpd/conf/ssl.crt/server.crt',
-        ]
-        for command in steps:
-            _execute_bash(command, headers, hostname)
-
-        output = restart_httpd(username, password, hostname)
-        LOGGER.info(output)
-
-        # Update DynamoDB Table
-        expiration = acme.query_certificate_expiration(hostname, common_name)
-        acme.update_certificate_expiration(hostname, expiration)
-    # Revert Logic
-    except Exception as error:
-        steps = [
-            'cp /config/httpd/conf/ssl.crt/server.crt.backup /config/httpd/conf/ssl.crt/server.crt',
-            'cp /config/httpd/conf/ssl.key/server.key.backup /config/httpd/conf/ssl.key/server.key',
-        ]
-        for command in steps:
-            _execute_bash(command, headers, hostname)
-
-        output = restart_httpd(username, password, hostname)
-        LOGGER.info(output)
-
-        message = 'Error Restarting httpd on `{hostname}`. Reverted Previous State.'.format(
-            hostname=hostname)
-        LOGGER.error(message, error)
-        sys.exit(1)
+        for member in context.group:
+            with acme.phase('deploy', device=member):
+                deploy_certificate(member, username, password, certificate_name,
+                                   f'{certificate_name}.crt', key_path)
+            # Poll Until the New Certificate is Served Instead of a Fixed Settle Time
+            try:
+                acme.wait_for_certificate(member, common_name, fingerprint)
+            except acme.JobTimeoutError as error:
+                LOGGER.warning('New Certificate Not Served Yet: %s', error)
+
+            # Update DynamoDB Table
+            with acme.phase('verify', device=member):
+                expiration = acme.query_certificate_expiration(member, common_name, context)
+            acme.update_certificate_expiration(member, expiration)
+    finally:
+        os.remove(key_path)
+    LOGGER.info('Device Connections: %s', acme_request.connection_stats())
 
     # F5 Device Certificate Locations
     # /config/ssl/ssl.key/server.key
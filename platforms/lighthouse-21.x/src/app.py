@@ -4,7 +4,6 @@ import os
 import sys
 import requests
 import json
-import time
 
 import acme
 
@@ -54,10 +53,7 @@ def generate_csr(hostname, common_name, session):
     LOGGER.info('Successfully Generated New CSR')
 
 
-def import_certificate(hostname, common_name, session):
-    path = os.environ['HOME']
-    certificate_path = "{path}/.acme.sh/{hostname}/fullchain.cer".format(
-        path=path, hostname=hostname)
+def import_certificate(hostname, common_name, session, certificate_path):
     file = open(certificate_path, 'r')
     url = 'https://{hostname}/api/v3.7/services/https'.format(
         hostname=hostname)
@@ -86,6 +82,7 @@ def import_certificate(hostname, common_name, session):
     LOGGER.info("Lighthouse Successfully Imported the New Certificate")
 
 
+@acme.phase('rotation')
 def main():
     requests.packages.urllib3.disable_warnings()
     global acme_request
@@ -102,10 +99,12 @@ def main():
     password = acme.get_secret(
         f'{prefix}/otter/lighthouse', 'password')
 
+    acme.set_phase_labels(device=hostname, platform='lighthouse-21.x')
     acme_request = acme.Request(validation=validation)
 
-    subject_alternative_names = acme.query_subject_alternative_names(
-        hostname)
+    # Device Context Passed From Router (Falls Back to DynamoDB)
+    context = acme.DeviceContext.load(hostname)
+    subject_alternative_names = context.subject_alternative_names
 
     le_client = acme.LetsEncrypt(
         hostname=hostname,
@@ -115,17 +114,29 @@ def main():
         region=region_name)
 
     session = generate_api_token(hostname, username, password)
-    generate_csr(hostname, common_name, session)
+    with acme.phase('keygen'):
+        generate_csr(hostname, common_name, session)
 
     path = os.environ['HOME']
-    le_client.acme_production(csr=f'{path}/output.csr')
-
-
-    import_certificate(hostname, common_name, session)
-    time.sleep(60)
-
-    expiration = acme.query_certificate_expiration(hostname, common_name)
+    with acme.phase('acme_order'):
+        le_client.acme_production(csr=f'{path}/output.csr')
+
+    # acme.sh Writes the Chain Under the CSR Common Name (Device CSRs are RSA)
+    certificate_path = acme.certificate_chain_path(common_name)
+
+    fingerprint = acme.certificate_fingerprint(certificate_path)
+    with acme.phase('deploy'):
+        import_certificate(hostname, common_name, session, certificate_path)
+        # Poll Until the New Certificate is Served Instead of a Fixed Settle Time
+        try:
+            acme.wait_for_certificate(hostname, common_name, fingerprint)
+        except acme.JobTimeoutError as error:
+            LOGGER.warning('New Certificate Not Served Yet: %s', error)
+
+    with acme.phase('verify'):
+        expiration = acme.query_certificate_expiration(hostname, common_name, context)
     acme.update_certificate_expiration(hostname, expiration)
+    LOGGER.info('Device Connections: %s', acme_request.connection_stats())
 
 
 if __name__ == '__main__':
@@ -1,17 +1,28 @@
 #!/usr/local/bin/python
 
+import functools
 import os
+import re
 import sys
-import boto3
-import time
 import acme
 
-from botocore.exceptions import ClientError, WaiterError
+from botocore.exceptions import ClientError
 
 LOGGER = acme.get_logger(__name__)
 
-# AWS SSM Client
-SSM_CLIENT = boto3.client('ssm')
+# AWS SSM Client Sharing the Account Request Rate (OTTR_SSM_RATE) With
+# Concurrent Rotations; Throttling Retried With Jittered Backoff
+SSM_CLIENT = acme.rate_limited(acme.get_client('ssm'), 'ssm')
+
+# Name Tag Index: One Paginated Sweep Resolves Every Hostname and SAN
+INSTANCE_INDEX = acme.get_instance_index(SSM_CLIENT)
+
+# Combine Pre Hooks With Key Generation in a Single Invocation
+PIPELINE_COMMANDS = os.environ.get('SSM_PIPELINE', 'True') != 'False'
+COMMAND_TIMEOUT = 240
+TERMINAL_STATUSES = ('Success', 'Cancelled', 'TimedOut', 'Failed')
+CSR_PATTERN = re.compile(
+    r'-----BEGIN CERTIFICATE REQUEST-----.*?-----END CERTIFICATE REQUEST-----', re.DOTALL)
 
 
 def generate_csr(common_name, instance_id, platform, subject_alternative_names, path):
@@ -20,6 +31,20 @@ def generate_csr(common_name, instance_id, platform, subject_alternative_names,
     on the system and output the CSR value to generate a new
     certificate.
     """
+    parameters = {}
+    parameters["commands"] = csr_commands(
+        common_name, platform, subject_alternative_names, path)
+
+    # Send the run command to the target system and
+    # grab the CSR from the output
+    invocations = _send_run_command([instance_id], parameters)
+    write_csr(invocations[instance_id]['StandardOutputContent'])
+
+
+def csr_commands(common_name, platform, subject_alternative_names, path):
+    """
+    Commands that generate the private key on the system and print the CSR.
+    """
     cert_root_path = path
     cert_parent_dir = "certs"
 
@@ -59,18 +84,28 @@ def generate_csr(common_name, instance_id, platform, subject_alternative_names,
         commandList.append('openssl req -nodes -newkey rsa:2048 -keyout {private_key_path} -subj "/C={country}/ST={state}/L={locality}/O={organization}/OU={org_unit}/CN={common_name}/emailAddress={email}"'.format(private_key_path=os.path.join(cert_root_path, cert_parent_dir, "{}.key".format(
             common_name)), country=os.environ['country'], state=os.environ['state'], locality=os.environ['locality'], organization=os.environ['organization'], org_unit=os.environ['organization_unit'], common_name=common_name, email=os.environ['email']))
 
-    # Generate SSM run command parameters
-    parameters = {}
-    parameters["commands"] = commandList
+    return commandList
 
-    # Send the run command to the target system and
-    # grab the CSR from the output
-    invocation = _send_run_command(instance_id, parameters)
+
+def write_csr(output):
+    """
+    Write the CSR printed by the run command (hook output in a pipelined
+    invocation is ignored).
+    """
     local_path = os.environ['HOME']
     csr_path = "{path}/csr".format(path=local_path)
+    match = CSR_PATTERN.search(output)
+
+    # SSM Truncates StandardOutputContent, so Verbose Pre Hooks Can
+    # Push the CSR out of the Returned Output
+    if match is None:
+        LOGGER.error('No CSR found in the run command output ({} characters); if pre hooks are verbose, set SSM_PIPELINE=False'.format(
+            len(output)))
+        sys.exit(1)
 
     # Write the CSR to a file
-    open(csr_path, 'wb').write(invocation['StandardOutputContent'].encode())
+    with open(csr_path, 'wb') as file:
+        file.write((match.group(0) + '\n').encode())
 
     LOGGER.info('Successfully generated new CSR')
 
@@ -80,14 +115,26 @@ def import_certificate(common_name, instance_id, path):
     Use AWS SSM Run Commands to import the certificates
     to the system.
     """
+    parameters = {}
+    parameters["commands"] = import_commands(common_name, path)
+
+    # Send the run command to the target system to
+    # copy the cert contents to a file
+    _send_run_command([instance_id], parameters)
+
+    LOGGER.info("Successfully imported the new certificates")
+
+
+def import_commands(common_name, path):
+    """
+    Commands that write the issued certificate chain to the system.
+    """
     local_path = os.environ['HOME']
 
     cert_root_path = path
     cert_parent_dir = "certs"
 
-    # Generate SSM run command parameters
     commandList = []
-    parameters = {}
 
     # Read the certificate contents from the path
     certificate_paths = [
@@ -107,52 +154,39 @@ def import_certificate(common_name, instance_id, path):
         commandList.append('echo \"{cert}\" > {cert_path}'.format(
             cert=cert_contents, cert_path=os.path.join(cert_root_path, cert_parent_dir, os.path.basename(path))))
 
-    # Add command list to commands parameter
-    parameters["commands"] = commandList
-
-    # Send the run command to the target system to
-    # copy the cert contents to a file
-    _send_run_command(instance_id, parameters)
-
-    LOGGER.info("Successfully imported the new certificates")
+    return commandList
 
 
 def get_system_metadata(hostnames):
     """
-    Get system metadata from AWS SSM managed system inventory
+    Get system metadata from the AWS SSM managed system index
     """
+    # One Paginated Sweep Resolves the System Name and Every SAN
+    matches = INSTANCE_INDEX.lookup_many(
+        [hostname.split(".")[0] for hostname in hostnames])
     for hostname in hostnames:
         system_name = hostname.split(".")[0]
         try:
-            response = SSM_CLIENT.describe_instance_information(
-                Filters=[
-                    {
-                        'Key': 'tag:Name',
-                        'Values': [
-                            system_name,
-                        ]
-                    },
-                ]
-            )
+            instances = matches[system_name]
 
             # Check to see if multiple systems match the given filter
             # criteria and return an error if so
-            if len(response['InstanceInformationList']) == 1:
+            if len(instances) == 1:
                 message = 'System found with a matching name of: `{system_name}`'.format(
                     system_name=hostname)
                 LOGGER.info(message)
 
-                if response['InstanceInformationList'][0]['PingStatus'] != "Online":
+                if instances[0]['PingStatus'] != "Online":
                     message = 'The system is not online or the AWS SSM Agent is not functioning properly.'
                     LOGGER.error(message)
                     sys.exit(1)
-            elif len(response['InstanceInformationList']) > 1:
+            elif len(instances) > 1:
                 message = 'There are multiple systems with a matching name of: `{system_name}`'.format(
                     system_name=hostname)
                 LOGGER.error(message)
                 sys.exit(1)
 
-            return response['InstanceInformationList'][0]
+            return instances[0]
         except IndexError as error:
             message = 'There are no systems with a matching name of: `{system_name}`'.format(
                 system_name=hostname)
@@ -165,115 +199,128 @@ def get_system_metadata(hostnames):
     sys.exit(1)
 
 
-def run_hooks(instance_id, path):
+def run_hooks(instance_ids, path):
     """
     Run all scripts in path in alphabetical order
     """
     LOGGER.info("Running scripts in {}...".format(path))
 
-    # Generate SSM run command parameters
-    commandList = []
-    commandList.append('mkdir -p {path}'.format(path=path))
-    commandList.append('touch {path}/template.sh'.format(path=path))
-    commandList.append(
-        'for each in {path}/*.sh ; do bash $each || exit ; done'.format(path=path))
-
     parameters = {}
-    parameters["commands"] = commandList
+    parameters["commands"] = hook_commands(path)
 
-    # Send the run command to the target system to
+    # Send the run command to the target systems to
     # run all scripts in alphabetical order in the provided
     # path
-    _send_run_command(instance_id, parameters)
+    _send_run_command(instance_ids, parameters)
 
     LOGGER.info("Successfully ran all scripts in {}".format(path))
 
 
-def _wait_for_success(command_id, instance_id):
+def hook_commands(path):
+    """
+    Commands that run every script in path, stopping at the first failure.
+    """
+    commandList = []
+    commandList.append('mkdir -p {path}'.format(path=path))
+    commandList.append('touch {path}/template.sh'.format(path=path))
+    commandList.append(
+        'for each in {path}/*.sh ; do bash $each || exit ; done'.format(path=path))
+    return commandList
+
+
+def _wait_for_success(command_id, instance_ids):
     """
-    Wait for AWS SSM Run Command to be executed on system
+    Wait for AWS SSM Run Command to be executed on every system
     """
     LOGGER.debug(
         'Waiting for run command {} to complete...'.format(command_id))
+    check = functools.partial(_get_command_status, command_id, instance_ids)
     try:
-        waiter = SSM_CLIENT.get_waiter('command_executed')
+        status = acme.poll_job(check, name=f'Run Command {command_id}', initial=1,
+                               maximum=15, timeout=COMMAND_TIMEOUT + 60)
+    except acme.JobTimeoutError as error:
+        LOGGER.error('Run Command %s Exceeded Bound Time: %s', command_id, error)
+        sys.exit(1)
 
-        waiter.wait(
-            CommandId=command_id,
-            InstanceId=instance_id
-        )
+    invocations = {}
+    for instance_id in instance_ids:
+        try:
+            invocations[instance_id] = SSM_CLIENT.get_command_invocation(
+                CommandId=command_id,
+                InstanceId=instance_id
+            )
+        except ClientError as err:
+            LOGGER.error(
+                'Get SSM Command Status function failed!\n{}'.format(str(err)))
+            sys.exit(1)
 
-        return _get_command_status(command_id, instance_id)
-    except WaiterError as error:
-        invocation = _get_command_status(command_id, instance_id)
-        message = 'Run Command {command_id} failed with error: {error}'.format(
-            command_id=command_id, error=invocation['StandardErrorContent'])
-        LOGGER.error(message)
-        sys.exit(1)
-    except Exception as error:
-        message = 'Run Command {command_id} failed'.format(
-            command_id=command_id)
-        LOGGER.error(message, error)
+    if status.result != 'Success':
+        for instance_id, invocation in invocations.items():
+            if invocation['Status'] != 'Success':
+                message = 'Run Command {command_id} failed on {instance_id} with error: {error}'.format(
+                    command_id=command_id, instance_id=instance_id,
+                    error=invocation['StandardErrorContent'])
+                LOGGER.error(message)
         sys.exit(1)
+    return invocations
 
 
-def _send_run_command(instance_id, parameters):
+def _send_run_command(instance_ids, parameters):
     """
     Send run command to target systems
     """
-    LOGGER.debug('Sending run command to {} system...'.format(instance_id))
+    LOGGER.debug('Sending run command to {} systems...'.format(instance_ids))
     try:
         response = SSM_CLIENT.send_command(
-            InstanceIds=[instance_id],
+            InstanceIds=list(instance_ids),
             DocumentName='AWS-RunShellScript',
             DocumentVersion='$DEFAULT',
-            TimeoutSeconds=240,
+            TimeoutSeconds=COMMAND_TIMEOUT,
             Parameters=parameters,
             CloudWatchOutputConfig={
                 'CloudWatchLogGroupName': "/aws/ssm/AWS-RunShellScript",
                 'CloudWatchOutputEnabled': True
             }
         )
-        LOGGER.debug('Send Command Response: {}'.format(response))
+        LOGGER.debug('Send Command Response: %s', response)
 
     except ClientError as err:
-        if 'ThrottlingException' in str(err):
-            LOGGER.warning('RunCommand throttled, automatically retrying...')
-            return _send_run_command(instance_id, parameters)
-        else:
-            LOGGER.error(
-                'Send Run Command function failed!\n{}'.format(str(err)))
-            sys.exit(1)
+        LOGGER.error(
+            'Send Run Command function failed!\n{}'.format(str(err)))
+        sys.exit(1)
 
-    return _wait_for_success(response['Command']['CommandId'], instance_id)
+    return _wait_for_success(response['Command']['CommandId'], instance_ids)
 
 
-def _get_command_status(command_id, instance_id):
+def _get_command_status(command_id, instance_ids):
     """
-    Get SSM run command status
+    Get SSM run command status for every target system in one call
     """
     LOGGER.debug('Checking SSM Run Command {0} status for {1}'.format(
-        command_id, instance_id))
+        command_id, instance_ids))
 
     try:
-        time.sleep(5)
-
-        invocation = SSM_CLIENT.get_command_invocation(
-            CommandId=command_id,
-            InstanceId=instance_id
-        )
-
-        return invocation
+        response = SSM_CLIENT.list_command_invocations(CommandId=command_id)
     except ClientError as err:
-        if 'ThrottlingException' in str(err):
-            LOGGER.warning('RunCommand throttled, automatically retrying...')
-            return _get_command_status(command_id, instance_id)
-        else:
-            LOGGER.error(
-                'Get SSM Command Status function failed!\n{}'.format(str(err)))
-            sys.exit(1)
-
+        LOGGER.error(
+            'Get SSM Command Status function failed!\n{}'.format(str(err)))
+        sys.exit(1)
 
+    statuses = {invocation['InstanceId']: invocation['Status']
+                for invocation in response['CommandInvocations']}
+    # Invocations Appear Shortly After send_command Returns
+    done = set(instance_ids) <= set(statuses) and all(
+        statuses[instance_id] in TERMINAL_STATUSES for instance_id in instance_ids)
+    succeeded = sum(status == 'Success' for status in statuses.values())
+    return acme.JobStatus(
+        done=done,
+        status=','.join(sorted(set(statuses.values()))) or 'Pending',
+        result='Success' if succeeded == len(instance_ids) else 'Failed',
+        progress=int(100 * sum(status in TERMINAL_STATUSES for status in statuses.values()) / len(instance_ids)),
+        details=statuses)
+
+
+@acme.phase('rotation')
 def main():
     region_name = os.environ['AWS_REGION']
     system_name = os.environ['SYSTEM_NAME']
@@ -282,16 +329,20 @@ def main():
     local_path = os.environ['HOME']
     remote_path = "/opt/otter"
     hooks_path = os.path.join(remote_path, "hooks")
+    acme.set_phase_labels(device=system_name, platform='linux-aws-ssm')
 
-    subject_alternative_names = acme.query_subject_alternative_names(
-        system_name)
+    # Device Context Passed From Router (Falls Back to DynamoDB)
+    context = acme.DeviceContext.load(system_name)
+    subject_alternative_names = context.subject_alternative_names
 
+    # Reachability Verified Through SSM Agent PingStatus (No Inbound Ports)
     le_client = acme.LetsEncrypt(
         hostname=system_name,
         common_name=common_name,
         subdelegate=dns,
         subject_alternative_names=subject_alternative_names,
-        region=region_name)
+        region=region_name,
+        management_ports=())
 
     hostnames = subject_alternative_names
     hostnames.insert(0, system_name)
@@ -300,22 +351,51 @@ def main():
     instance_id = system_metadata['InstanceId']
     platform = system_metadata['PlatformName']
 
+    if PIPELINE_COMMANDS:
+        # Pre Hooks and Key Generation in One Invocation
+        with acme.phase('keygen'):
+            invocations = _send_run_command([instance_id], {"commands": hook_commands(
+                os.path.join(hooks_path, "pre")) + csr_commands(
+                common_name, platform, subject_alternative_names, remote_path)})
+            write_csr(invocations[instance_id]['StandardOutputContent'])
+
+        with acme.phase('acme_order'):
+            le_client.acme_production(csr=f'{local_path}/csr')
+
+        with acme.phase('deploy'):
+            import_certificate(common_name, instance_id, remote_path)
+
+        with acme.phase('verify'):
+            expiration = acme.query_certificate_expiration(system_name, common_name, context)
+        acme.update_certificate_expiration(system_name, expiration)
+
+        # Post Hooks Run After the Expiration is Recorded, as in Step-by-Step Mode
+        with acme.phase('post_hooks'):
+            run_hooks([instance_id], os.path.join(hooks_path, "post"))
+        return
+
     # Run scripts before new certificates are created
-    run_hooks(instance_id, os.path.join(hooks_path, "pre"))
+    with acme.phase('pre_hooks'):
+        run_hooks([instance_id], os.path.join(hooks_path, "pre"))
 
-    generate_csr(common_name, instance_id, platform,
-                 subject_alternative_names, remote_path)
+    with acme.phase('keygen'):
+        generate_csr(common_name, instance_id, platform,
+                     subject_alternative_names, remote_path)
 
-    le_client.acme_production(csr=f'{local_path}/csr')
+    with acme.phase('acme_order'):
+        le_client.acme_production(csr=f'{local_path}/csr')
 
-    import_certificate(common_name, instance_id, remote_path)
+    with acme.phase('deploy'):
+        import_certificate(common_name, instance_id, remote_path)
 
-    expiration = acme.query_certificate_expiration(system_name, common_name)
+    with acme.phase('verify'):
+        expiration = acme.query_certificate_expiration(system_name, common_name, context)
     acme.update_certificate_expiration(system_name, expiration)
 
     # Run scripts after new certificate is created and uploaded
     # to the system
-    run_hooks(instance_id, os.path.join(hooks_path, "post"))
+    with acme.phase('post_hooks'):
+        run_hooks([instance_id], os.path.join(hooks_path, "post"))
 
 
 if __name__ == '__main__':
@@ -1,16 +1,28 @@
 #!/usr/local/bin/python
 
+import asyncio
+import functools
+import secrets
 import sys
 import os
 from datetime import datetime
-from time import sleep
 
 import requests
+import xml.etree.ElementTree as ElementTree
 import defusedxml.ElementTree as etree
 import acme
 
 LOGGER = acme.get_logger(__name__)
 
+# Certificates Created by Ottr (otter_panos_YYYY_MM_DD)
+CERTIFICATE_PREFIX = 'otter'
+# Previous Certificates Kept for Rollback and Entries Removed per Request
+RETAIN_CERTIFICATES = int(os.environ.get('RETAIN_CERTIFICATES', '1'))
+DELETE_BATCH_SIZE = 25
+
+# Panorama Template Configuration Root (Mirrors /config on the Firewall)
+TEMPLATE_CONFIG = "/config/devices/entry[@name='localhost.localdomain']/template/entry[@name='{template}']/config"
+
 
 def paloalto_keygen(hostname, username, password):
     cmd = "/api/?type=keygen&"
@@ -18,67 +30,32 @@ def paloalto_keygen(hostname, username, password):
         host=hostname, command=cmd, username=username, password=password)
     response = acme_request.get(url=url)
     LOGGER.info('Palo Alto Keygen HTTP Response %s', response.status_code)
-    content = (response.content).decode('utf-8')
-    output = etree.fromstring(content)
-    api_key = output[0][0].text
+    api_key = find_text(response.content, 'key')
     return api_key
 
 
-def generate_certificate_signing_request(hostname, common_name, api_token, certificate_name, subject_alternative_names):
-    pan_subject_alternative_names = ''
-    for hostname in subject_alternative_names:
-        pan_subject_alternative_names = pan_subject_alternative_names + \
-            '<member>{hostname}</member>'.format(hostname=hostname)
-    country = os.environ['country']
-    state = os.environ['state']
-    locality = os.environ['locality']
-    organization = os.environ['organization']
-    organization_unit = os.environ['organization_unit']
-    cmd = f"<request><certificate><generate><certificate-name>{certificate_name}</certificate-name><name>{common_name}</name><algorithm><RSA><rsa-nbits>2048</rsa-nbits></RSA></algorithm><digest>sha256</digest><country-code>{country}</country-code><state>{state}</state><locality>{locality}</locality><organization>{organization}</organization><organization-unit><member>{organization_unit}</member></organization-unit><ca>no</ca><hostname>{pan_subject_alternative_names}</hostname><signed-by>external</signed-by></generate></certificate></request>"
-    url = "https://{host}/api/?type=op&Key={key}&cmd={cmd}".format(
-        key=api_token, host=hostname, cmd=cmd)
-    response = acme_request.get(url=url)
-    output = (response.content).decode("utf-8")
-    LOGGER.info('Generate CSR Response: %s', output)
-    return response
-
-
-def get_certificate_signing_request_data(hostname, api_token, certificate_name):
-    cmd = "type=export&category=certificate&certificate-name={certificate_name}&format={format}&include-key=no".format(
-        certificate_name=certificate_name, format='pkcs10')
-    url = "https://{host}/api/?key={api_key}&{cmd}".format(
-        api_key=api_token, host=hostname, cmd=cmd)
-
-    response = acme_request.get(url=url)
-    LOGGER.info('Get CSR Data HTTP Response %s', response.status_code)
-
-    # CSR Validation
-    output = (response.content).decode("utf-8")
-    LOGGER.info('CSR Output:\n%s', output)
-
-    csr_output = open(f"{certificate_name}.csr", "wt")
-    csr_output.write(output)
-    csr_output.close()
-
-
-def import_certificate(hostname, api_token, certificate_name):
-    path = os.environ['HOME']
-    certificate_path = "{path}/.acme.sh/{hostname}/fullchain.cer".format(
-        path=path, hostname=hostname)
-    files = {'file': open(certificate_path, 'rb')}
+def import_keypair(hostname, api_token, certificate_name, certificate_path, key_path, passphrase, template=None):
+    # PAN-OS Key Pair Import Expects Certificate and Encrypted Key in One PEM
+    with open(certificate_path, 'rb') as certificate, open(key_path, 'rb') as key:
+        bundle = certificate.read() + key.read()
+    files = {'file': (f'{certificate_name}.pem', bundle)}
     base_url = 'https://{hostname}/api/?type={cmd}&Key={key}'
-    url = base_url.format(hostname=hostname, key=api_token, cmd='import&category=certificate&certificate-name={0}&format=pem'.format(
-        certificate_name))
-    response = acme_request.post(url=url, files=files)
+    cmd = 'import&category=keypair&certificate-name={0}&format=pem'.format(
+        certificate_name)
+    if template:
+        cmd += '&target-tpl={0}'.format(template)
+    url = base_url.format(hostname=hostname, key=api_token, cmd=cmd)
+    response = acme_request.post(url=url, files=files,
+                             data={'passphrase': passphrase})
 
     output = (response.content).decode("utf-8")
     LOGGER.info(output)
     return response
 
 
-def set_tls_service_profile(hostname, api_token, certificate_name):
-    cmd = "type=config&action=set&xpath=/config/shared/ssl-tls-service-profile/entry[@name='otter']&element=<protocol-settings><min-version>tls1-2</min-version><max-version>max</max-version></protocol-settings><certificate>{certificate_name}</certificate>".format(
-        certificate_name=certificate_name)
+def set_tls_service_profile(hostname, api_token, certificate_name, config='/config'):
+    cmd = "type=config&action=set&xpath={config}/shared/ssl-tls-service-profile/entry[@name='otter']&element=<protocol-settings><min-version>tls1-2</min-version><max-version>max</max-version></protocol-settings><certificate>{certificate_name}</certificate>".format(
+        config=config, certificate_name=certificate_name)
     url = "https://{host}/api/?key={api_key}&{cmd}".format(
         api_key=api_token, host=hostname, cmd=cmd)
     response = acme_request.get(url=url)
@@ -87,8 +64,9 @@ def set_tls_service_profile(hostname, api_token, certificate_name):
     return response
 
 
-def set_management_plane(hostname, api_token):
-    cmd = "type=config&action=set&xpath=/config/devices/entry[@name='localhost.localdomain']/deviceconfig/system&element=<ssl-tls-service-profile>otter</ssl-tls-service-profile>"
+def set_management_plane(hostname, api_token, config='/config'):
+    cmd = "type=config&action=set&xpath={config}/devices/entry[@name='localhost.localdomain']/deviceconfig/system&element=<ssl-tls-service-profile>otter</ssl-tls-service-profile>".format(
+        config=config)
     url = "https://{host}/api/?key={api_key}&{cmd}".format(
         api_key=api_token, host=hostname, cmd=cmd)
     response = acme_request.get(url=url)
@@ -96,6 +74,7 @@ def set_management_plane(hostname, api_token):
     return response
 
 
+@acme.phase('commit')
 def commit_changes(username, hostname, api_token):
     cmd = "type=commit&action=partial&cmd=<commit><partial><admin><member>{username}</member></admin></partial></commit>".format(
         username=username)
@@ -104,84 +83,265 @@ def commit_changes(username, hostname, api_token):
     response = acme_request.get(url=url)
     LOGGER.info('Commit Changes HTTP Response %s', response.status_code)
 
-    output = (response.content).decode("utf-8")
-    job_id = xml_parser(output, '<job>', '</job>')
-
-    # Queue PAN Commit Status
-    pending = True
-    count = 0
-    while pending is True:
-        if count >= 600:
-            LOGGER.error('PanOS Commit Exceeded Bound Time')
-            sys.exit(1)
-        cmd = "type=op&cmd=<show><jobs><id>{job_id}</id></jobs></show>".format(
-            job_id=job_id)
-        url = "https://{host}/api/?key={api_key}&{cmd}".format(
-            api_key=api_token, host=hostname, cmd=cmd)
-        response = acme_request.get(url=url)
-        output = (response.content).decode("utf-8")
-        status = xml_parser(output, '<status>', '</status>')
-        if status == 'FIN':
-            pending = False
-        count += 1
-        sleep(60)
-        LOGGER.info(status)
-
-
-def xml_parser(output, begin, end):
-    start = output.index(begin) + len(begin)
-    end = output.index(end, start)
-    job_id = (output[start:end])
-    return job_id
-
-
-def save_running_config(hostname, api_token):
-    cmd = "type=export&category=configuration"
+    job_id = find_text(response.content, 'job')
+    if job_id is None:
+        LOGGER.info('No Pending Changes to Commit: %s', response.content.decode('utf-8'))
+        return
+    check = functools.partial(get_job_status, hostname, api_token, job_id)
+
+    # Poll PAN Commit Status (Short Initial Interval, Backoff to 30 Seconds)
+    try:
+        status = acme.poll_job(check, name=f'Commit Job {job_id}',
+                               initial=2, maximum=30, timeout=1800)
+    except acme.JobTimeoutError as error:
+        LOGGER.error('PanOS Commit Exceeded Bound Time: %s', error)
+        sys.exit(1)
+    if status.result != 'OK':
+        LOGGER.error('PanOS Commit Failed: %s', status.result)
+        sys.exit(1)
+
+
+def get_job_status(hostname, api_token, job_id):
+    cmd = "type=op&cmd=<show><jobs><id>{job_id}</id></jobs></show>".format(
+        job_id=job_id)
+    url = "https://{host}/api/?key={api_key}&{cmd}".format(
+        api_key=api_token, host=hostname, cmd=cmd)
+    response = acme_request.get(url=url)
+    for job in iter_elements(response.content, 'job'):
+        status = job.findtext('status')
+        return acme.JobStatus(
+            done=status == 'FIN',
+            status=status,
+            result=job.findtext('result'),
+            progress=job_progress(job))
+    return acme.JobStatus(done=False)
+
+
+@acme.phase('push')
+def push_to_devices(hostname, api_token, template, device_group=None):
+    # Single Commit-and-Push From Panorama to Every Device Using the Template
+    if device_group:
+        cmd = "type=commit&action=all&cmd=<commit-all><shared-policy><device-group><entry name='{device_group}'/></device-group><include-template>yes</include-template></shared-policy></commit-all>".format(
+            device_group=device_group)
+    else:
+        cmd = "type=commit&action=all&cmd=<commit-all><template><name>{template}</name></template></commit-all>".format(
+            template=template)
+    url = "https://{host}/api/?key={api_key}&{cmd}".format(
+        api_key=api_token, host=hostname, cmd=cmd)
+    response = acme_request.get(url=url)
+    LOGGER.info('Panorama Push HTTP Response %s', response.status_code)
+
+    job_id = find_text(response.content, 'job')
+    if job_id is None:
+        LOGGER.error('Panorama Push Not Scheduled: %s', response.content.decode('utf-8'))
+        sys.exit(1)
+    check = functools.partial(get_push_status, hostname, api_token, job_id)
+
+    # One Poller Tracks the Push Job for Every Device
+    try:
+        status = acme.poll_job(check, name=f'Push Job {job_id}',
+                               initial=5, maximum=30, timeout=3600)
+    except acme.JobTimeoutError as error:
+        LOGGER.error('Panorama Push Exceeded Bound Time: %s', error)
+        sys.exit(1)
+    failed = {device: result for device, result in (status.details or {}).items()
+              if result != 'OK'}
+    LOGGER.info('Panorama Push Results: %s', status.details)
+    if status.result != 'OK' or failed:
+        LOGGER.error('Panorama Push Failed: %s %s', status.result, failed)
+        sys.exit(1)
+    return status.details
+
+
+def get_push_status(hostname, api_token, job_id):
+    cmd = "type=op&cmd=<show><jobs><id>{job_id}</id></jobs></show>".format(
+        job_id=job_id)
     url = "https://{host}/api/?key={api_key}&{cmd}".format(
         api_key=api_token, host=hostname, cmd=cmd)
     response = acme_request.get(url=url)
-    LOGGER.info('Export Running Config HTTP Response %s', response.status_code)
+    for job in iter_elements(response.content, 'job'):
+        details = {}
+        for device in job.iterfind('./devices/entry'):
+            name = device.findtext('devicename') or device.findtext('serial-no')
+            details[name] = device.findtext('result')
+        status = job.findtext('status')
+        return acme.JobStatus(
+            done=status == 'FIN',
+            status=status,
+            result=job.findtext('result'),
+            progress=job_progress(job),
+            details=details)
+    return acme.JobStatus(done=False)
+
+
+class ElementStream:
+    """
+    Defused pull parser fed one chunk at a time, yielding each tag element
+    once it is complete. Everything outside a match is dropped from the tree
+    as soon as it ends, so memory is bounded by the largest match rather
+    than the whole response.
+    """
+
+    def __init__(self, tag):
+        self.tag = tag
+        self.depth = 0
+        self.root = None
+        self.parser = ElementTree.XMLPullParser(
+            events=('start', 'end'),
+            _parser=etree.DefusedXMLParser(target=ElementTree.TreeBuilder()))
+
+    def feed(self, chunk):
+        self.parser.feed(chunk)
+        return self._matches()
+
+    def close(self):
+        self.parser.close()
+        return self._matches()
+
+    def _matches(self):
+        for event, element in self.parser.read_events():
+            if self.root is None:
+                self.root = element
+            if element.tag == self.tag:
+                if event == 'start':
+                    self.depth += 1
+                    continue
+                self.depth -= 1
+                if self.depth == 0:
+                    yield element
+                    self.root.clear()
+            elif event == 'end' and self.depth == 0:
+                self.root.clear()
+
+
+def iter_elements(chunks, tag):
+    # Small Responses are Parsed From the Buffered Body (bytes)
+    if isinstance(chunks, bytes):
+        chunks = [chunks]
+    stream = ElementStream(tag)
+    for chunk in chunks:
+        yield from stream.feed(chunk)
+    yield from stream.close()
+
+
+async def aiter_elements(chunks, tag):
+    stream = ElementStream(tag)
+    async for chunk in chunks:
+        for element in stream.feed(chunk):
+            yield element
+    for element in stream.close():
+        yield element
+
+
+def find_text(content, tag):
+    for element in iter_elements(content, tag):
+        return element.text
+    return None
+
+
+def job_progress(job):
+    progress = job.findtext('progress')
+    return int(progress) if progress and progress.strip().isdigit() else None
+
+
+async def save_running_config(hostname, api_token):
+    cmd = "type=export&category=configuration"
+    url = "https://{host}/api/?key={api_key}&{cmd}".format(
+        api_key=api_token, host=hostname, cmd=cmd)
+    async with async_request.stream(url=url) as response:
+        LOGGER.info('Export Running Config HTTP Response %s', response.status)
 
-    with open('/tmp/config.xml', 'wb') as handle:
-        for block in response.iter_content(1024):
-            handle.write(block)
+        # Compressed, Hashed and Skipped When Unchanged Since the Last Backup
+        return await acme.backup_stream(
+            response.content.iter_chunked(acme.CHUNK_SIZE), hostname)
 
 
-def get_palo_alto_certificates(hostname, api_token):
-    cmd = 'type=config&action=get&xpath=/config/shared/certificate'
+async def get_palo_alto_certificates(hostname, api_token, config='/config'):
+    # Only Entries Named otter* are Returned by the Device
+    cmd = "type=config&action=get&xpath={config}/shared/certificate/entry[starts-with(@name,'{prefix}')]".format(
+        config=config, prefix=CERTIFICATE_PREFIX)
     url = "https://{host}/api/?key={api_token}&{cmd}".format(
         api_token=api_token, host=hostname, cmd=cmd)
-    response = acme_request.get(url=url)
-    content = (response.content).decode('utf-8')
-    LOGGER.info('Get Palo Alto Certificates HTTP Response %s',
-                response.status_code)
-    root = etree.fromstring(content)
-    certificates = []
-    if root.find('.//certificate') is None:
-        pass
-    else:
-        for node in root.find('.//certificate'):
-            if 'otter' in node.attrib['name']:
-                certificates.append(node.attrib['name'])
+    async with async_request.stream(url=url) as response:
+        LOGGER.info('Get Palo Alto Certificates HTTP Response %s',
+                    response.status)
+        # Entries Parsed as the Body Arrives
+        certificates = []
+        async for entry in aiter_elements(response.content.iter_chunked(acme.CHUNK_SIZE), 'entry'):
+            name = entry.get('name', '')
+            if name.startswith(CERTIFICATE_PREFIX):
+                certificates.append(name)
     return certificates
 
 
-def delete_certificates(hostname, api_token, certificates):
+async def snapshot_device(hostname, api_token, config='/config'):
+    # Independent Read-Only Calls Run Concurrently
+    try:
+        _, certificates = await asyncio.gather(
+            save_running_config(hostname, api_token),
+            get_palo_alto_certificates(hostname, api_token, config))
+    finally:
+        await async_request.close()
+    return certificates
+
+
+def stale_certificates(certificates, certificate_name, retain=RETAIN_CERTIFICATES):
+    # Date Suffixed Names Sort Chronologically; Newest Previous Kept for Rollback
+    previous = sorted((certificate for certificate in certificates
+                       if certificate != certificate_name), reverse=True)
+    return previous[retain:]
+
+
+def delete_certificates(hostname, api_token, certificates, config='/config'):
     if not certificates:
         return
-    for certificate in certificates:
-        cmd = 'type=config&action=delete&xpath=/config/shared/certificate/entry[@name=\'{certificate}\']'.format(
-            certificate=certificate)
+    # One Multi-Entry Delete per Batch Instead of One Request per Certificate
+    for start in range(0, len(certificates), DELETE_BATCH_SIZE):
+        batch = certificates[start:start + DELETE_BATCH_SIZE]
+        names = ' or '.join("@name='{}'".format(certificate) for certificate in batch)
+        cmd = 'type=config&action=delete&xpath={config}/shared/certificate/entry[{names}]'.format(
+            config=config, names=names)
         url = "https://{host}/api/?key={api_token}&{cmd}".format(
             api_token=api_token, host=hostname, cmd=cmd)
         response = acme_request.get(url)
         content = (response.content).decode('utf-8')
-        LOGGER.info('Certificate: %s %s', certificate, content)
+        LOGGER.info('Deleted Certificates %s: %s', ', '.join(batch), content)
 
 
+def deploy_certificate(hostname, username, password, certificate_name, certificate_path, key_path, passphrase):
+    LOGGER.info('Host: [%s]', hostname)
+    api_token = paloalto_keygen(hostname, username, password)
+    certificates = asyncio.run(snapshot_device(hostname, api_token))
+    import_keypair(hostname, api_token, certificate_name,
+                   certificate_path, key_path, passphrase)
+    set_tls_service_profile(hostname, api_token, certificate_name)
+    set_management_plane(hostname, api_token)
+    delete_certificates(hostname, api_token,
+                        stale_certificates(certificates, certificate_name))
+    commit_changes(username, hostname, api_token)
+
+
+def deploy_panorama_certificate(panorama, username, password, certificate_name, certificate_path, key_path, passphrase):
+    template = panorama['template']
+    config = TEMPLATE_CONFIG.format(template=template)
+    LOGGER.info('Panorama: [%s] Template: [%s]', panorama['hostname'], template)
+    api_token = paloalto_keygen(panorama['hostname'], username, password)
+    certificates = asyncio.run(snapshot_device(panorama['hostname'], api_token, config))
+    import_keypair(panorama['hostname'], api_token, certificate_name,
+                   certificate_path, key_path, passphrase, template)
+    set_tls_service_profile(panorama['hostname'], api_token, certificate_name, config)
+    set_management_plane(panorama['hostname'], api_token, config)
+    delete_certificates(panorama['hostname'], api_token,
+                        stale_certificates(certificates, certificate_name), config)
+    commit_changes(username, panorama['hostname'], api_token)
+    push_to_devices(panorama['hostname'], api_token, template,
+                    panorama.get('device_group'))
+
+
+@acme.phase('rotation')
 def main():
     requests.packages.urllib3.disable_warnings()
-    global acme_request
+    global acme_request, async_request
 
     hostname = os.environ['SYSTEM_NAME']
     common_name = os.environ['COMMON_NAME']
@@ -195,13 +355,16 @@ def main():
     password = acme.get_secret(
         f'{prefix}/otter/panos', 'password', region_name)
 
+    acme.set_phase_labels(device=hostname, platform='panos-8.x')
     header = 'Host: [{}]'.format(hostname)
     LOGGER.info(header)
 
     acme_request = acme.Request(validation=validation)
+    async_request = acme.AsyncRequest(validation=validation)
 
-    subject_alternative_names = acme.query_subject_alternative_names(
-        hostname)
+    # Device Context Passed From Router (Falls Back to DynamoDB)
+    context = acme.DeviceContext.load(hostname)
+    subject_alternative_names = context.subject_alternative_names
 
     le_client = acme.LetsEncrypt(
         hostname=hostname,
@@ -210,28 +373,45 @@ def main():
         subject_alternative_names=subject_alternative_names,
         region=region_name)
 
-    api_token = paloalto_keygen(hostname, username, password)
-
     date_time = "{:%Y_%m_%d}".format(datetime.now())
     certificate_name = 'otter_panos_{}'.format(date_time)
 
-    save_running_config(hostname, api_token)
-    certificates = get_palo_alto_certificates(hostname, api_token)
-    generate_certificate_signing_request(
-        hostname, common_name, api_token, certificate_name, subject_alternative_names)
-    get_certificate_signing_request_data(
-        hostname, api_token, certificate_name)
-
-    le_client.acme_production(csr=f'{certificate_name}.csr')
-
-    import_certificate(hostname, api_token, certificate_name)
-    set_tls_service_profile(hostname, api_token, certificate_name)
-    set_management_plane(hostname, api_token)
-    delete_certificates(hostname, api_token, certificates)
-    commit_changes(username, hostname, api_token)
-
-    expiration = acme.query_certificate_expiration(hostname, common_name)
-    acme.update_certificate_expiration(hostname, expiration)
+    # Private Key and CSR Generated Off-Device (RSA or ECDSA per Route)
+    passphrase = secrets.token_urlsafe(32)
+    with acme.phase('keygen'):
+        key_path, csr_path = acme.generate_key_and_csr(
+            common_name, subject_alternative_names, context.key_type,
+            name=certificate_name, passphrase=passphrase)
+
+    with acme.phase('acme_order'):
+        le_client.acme_production(csr=csr_path)
+    # acme.sh Writes the Chain Under the CSR Common Name (_ecc for EC Keys)
+    certificate_path = acme.certificate_chain_path(common_name, context.key_type)
+
+    # Issued Once, Deployed to Every Rotation Group Member (i.e. HA Pairs)
+    fingerprint = acme.certificate_fingerprint(certificate_path)
+    try:
+        if context.panorama:
+            # Template Import and One Push Reaches the Whole Group
+            with acme.phase('deploy', device=context.panorama['hostname']):
+                deploy_panorama_certificate(context.panorama, username, password, certificate_name,
+                                            certificate_path, key_path, passphrase)
+        for member in context.group:
+            if not context.panorama:
+                with acme.phase('deploy', device=member):
+                    deploy_certificate(member, username, password, certificate_name,
+                                       certificate_path, key_path, passphrase)
+            # Poll Until the New Certificate is Served Instead of a Fixed Settle Time
+            try:
+                acme.wait_for_certificate(member, common_name, fingerprint)
+            except acme.JobTimeoutError as error:
+                LOGGER.warning('New Certificate Not Served Yet: %s', error)
+            with acme.phase('verify', device=member):
+                expiration = acme.query_certificate_expiration(member, common_name, context)
+            acme.update_certificate_expiration(member, expiration)
+    finally:
+        os.remove(key_path)
+    LOGGER.info('Device Connections: %s', acme_request.connection_stats())
 
 
 if __name__ == '__main__':
@@ -32,6 +32,9 @@ export PREFIX=""
 # Is There A Valid Certificate (Non-Self Signed) on the Target Host [True/False]
 export VALIDATE_CERTIFICATE=""
 
+# Configuration Backup Destination: Local Directory or s3://bucket/prefix (Default: /tmp/ottr/backups)
+export OTTR_BACKUP_URI=""
+
 # Certificate Signing Request Metadata
 export organization=""
 export organization_unit=""
@@ -12,6 +12,7 @@ LOGGER = acme.get_logger(__name__)
 # . ./environment.sh
 
 
+@acme.phase('rotation')
 def main():
     requests.packages.urllib3.disable_warnings()
 
@@ -26,6 +27,10 @@ def main():
     # Example: acme_request.get(url=url, headers=headers, query_params=query_params)
     acme_request = acme.Request(validation=validation)
 
+    # Per-Phase Durations Emitted as JSON/Embedded Metrics [Replace PLATFORM]
+    # Example: with acme.phase('acme_order'): le_client.acme_production(csr=path)
+    acme.set_phase_labels(device=hostname, platform='PLATFORM')
+
     # Pull Secrets from Secrets Manager
 
     # [1] Update Secrets Path (Create from Terraform Module in secrets.tf)
@@ -35,8 +40,9 @@ def main():
         f'{prefix}/otter/[PATH]', 'password', region_name)
 
     # [2] system_name Must be in Otter DynamoDB Table
-    subject_alternative_names = acme.query_subject_alternative_names(
-        hostname)
+    # Device Context Passed From Router (Falls Back to DynamoDB)
+    context = acme.DeviceContext.load(hostname)
+    subject_alternative_names = context.subject_alternative_names
 
     # Let's Encrypt Client/Initialization
     # [3] Host Must Have DNS Mapping to Subdelegate Zone [Example: dns/platform.tf]
@@ -48,6 +54,9 @@ def main():
         region=region_name)
 
     # [4] Generate Public/Private Key Pair and CSR
+    # Devices That Accept Private Key Import Should Generate Off-Device:
+    # key_path, csr_path = acme.generate_key_and_csr(
+    #     common_name, subject_alternative_names, context.key_type)
 
     # [5] Pull CSR to Filesystem (Container or Local)
 
@@ -67,14 +76,21 @@ def main():
     # ECS Production:
     # le_client.acme_production(csr=path)
 
+    # In-Process ACME Engine (No acme.sh Subprocess):
+    # le_client.acme_native(csr=path)
+    # le_client.acme_native(csr=path, directory=acme.LETS_ENCRYPT_STAGING)
+
     # Certificate Path Output:
-    # $HOME/.acme.sh/{hostname}/fullchain.cer
+    # $HOME/.acme.sh/{common_name}/fullchain.cer ({common_name}_ecc for EC Keys)
+    # certificate_path = acme.certificate_chain_path(common_name, context.key_type)
 
 
-    # [7] Apply Changes to Management Console (Set Wait Period for Certificate to Propagate)
+    # [7] Apply Changes to Management Console (Poll Until the New Certificate is Served)
+    # fingerprint = acme.certificate_fingerprint(certificate_path)
+    # acme.wait_for_certificate(hostname, common_name, fingerprint)
 
     # [8] Pull Certificate and Update DynamoDB Table
-    expiration = acme.query_certificate_expiration(hostname, common_name)
+    expiration = acme.query_certificate_expiration(hostname, common_name, context)
     acme.update_certificate_expiration(hostname, expiration)
 
 
@@ -0,0 +1,43 @@
+import importlib.util
+import os
+import sys
+
+import boto3
+from botocore.stub import Stubber
+from mock import patch
+
+from acme import acme
+
+APP_PATH = os.path.join(os.path.dirname(__file__), '..', '..', 'platforms', 'linux-aws-ssm', 'src', 'app.py')
+
+
+def _load_app():
+    # Platforms Import the Installed Package as `import acme`
+    spec = importlib.util.spec_from_file_location('linux_aws_ssm_app', APP_PATH)
+    module = importlib.util.module_from_spec(spec)
+    with patch.dict(sys.modules, {'acme': acme}):
+        spec.loader.exec_module(module)
+    return module
+
+
+def test_get_system_metadata_single_sweep():
+    app = _load_app()
+    ssm = boto3.client('ssm', region_name='us-east-1')
+    tagging = boto3.client('resourcegroupstaggingapi', region_name='us-east-1')
+    index = acme.InstanceIndex(ssm, tagging, ttl=60)
+    with Stubber(ssm) as ssm_stubber, Stubber(tagging) as tagging_stubber, \
+            patch.object(app, 'INSTANCE_INDEX', index):
+        tagging_stubber.add_response('get_resources', {'ResourceTagMappingList': [
+            {'ResourceARN': 'arn:aws:ec2:us-east-1:123456789012:instance/i-0002',
+             'Tags': [{'Key': 'Name', 'Value': 'alias'}]}]})
+        ssm_stubber.add_response('describe_instance_information', {
+            'InstanceInformationList': [{'InstanceId': 'i-0001', 'PingStatus': 'Online'}],
+            'NextToken': 'next'})
+        ssm_stubber.add_response('describe_instance_information', {
+            'InstanceInformationList': [{'InstanceId': 'i-0002', 'PingStatus': 'Online'}]})
+        # System Name Unmatched, Second SAN Matched; No Filtered Call per Name
+        metadata = app.get_system_metadata(
+            ['web.example.com', 'missing.example.com', 'alias.example.com'])
+        ssm_stubber.assert_no_pending_responses()
+        tagging_stubber.assert_no_pending_responses()
+    assert metadata['InstanceId'] == 'i-0002'
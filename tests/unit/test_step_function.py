@@ -1,10 +1,14 @@
 from string import Template
+from unittest.mock import patch
+import ast
 import json
+import os
 
 import boto3
 from moto import mock_sts, mock_stepfunctions
 
-from otter.router.src.shared.client import start_execution, lookup_attributes
+from acme import acme
+from otter.router.src.shared.client import start_execution, lookup_attributes, get_key_type, get_panorama, group_rotation_assets, group_subject_alternative_names, encode_rotation_group, DEVICE_CONTEXT_FIELDS
 
 region = "us-east-1"
 account_id = None
@@ -252,3 +256,123 @@ def _get_account_id():
 
 def _get_default_role():
     return "arn:aws:iam::" + _get_account_id() + ":role/unknown_sf_role"
+
+
+def test_get_key_type():
+    device = {
+        "system_name": "test.example.com",
+        "host_platform": "panos",
+        "os_version": "9.1.0"
+    }
+    assert get_key_type(device) == "ecdsa"
+    assert get_key_type(dict(device, os_version="8.1.0")) == "rsa"
+    assert get_key_type(dict(device, host_platform="Windows")) == "rsa"
+    assert get_key_type(dict(device, os_version="0.0.1")) == "rsa"
+
+
+def test_get_panorama():
+    device = {
+        "system_name": "test.example.com",
+        "host_platform": "panos",
+        "os_version": "9.1.0"
+    }
+    assert get_panorama(device) is None
+    assert get_panorama(dict(device, host_platform="Windows")) is None
+    assert get_panorama(dict(device, os_version=None)) is None
+
+
+def test_group_rotation_assets():
+    def device(system_name, subject_alternative_name, host_platform="panos", os_version="9.1.0"):
+        return {
+            "system_name": system_name,
+            "common_name": "vpn.example.com",
+            "certificate_authority": "lets_encrypt",
+            "device_model": "PA-XXXX",
+            "host_platform": host_platform,
+            "os_version": os_version,
+            "subject_alternative_name": subject_alternative_name
+        }
+    devices = [
+        device("fw01.example.com", ["a.example.com", "b.example.com"]),
+        device("fw02.example.com", ["b.example.com", "a.example.com"]),
+        device("fw03.example.com", ["a.example.com"]),
+        device("ubuntu01.example.com", [], "Ubuntu", "20.04"),
+        device("ubuntu02.example.com", [], "Ubuntu", "20.04")
+    ]
+    groups = [[member["system_name"] for member in group]
+              for group in group_rotation_assets(devices)]
+    assert groups == [
+        ["fw01.example.com", "fw02.example.com"],
+        ["fw03.example.com"],
+        ["ubuntu01.example.com"],
+        ["ubuntu02.example.com"]
+    ]
+
+
+def test_group_rotation_assets_panorama(tmp_path):
+    routes = {"platform": {"panos": {"os": {"9.1.0": {
+        "certificate_authority": {"lets_encrypt": "otter-panos-9x-lets-encrypt"},
+        "key_type": "ecdsa",
+        "panorama": {"hostname": "panorama.example.com", "template": "TEMPLATE"}
+    }}}}}
+    route_file = tmp_path / "route.json"
+    route_file.write_text(json.dumps(routes))
+
+    def device(system_name, common_name, subject_alternative_name):
+        return {
+            "system_name": system_name,
+            "common_name": common_name,
+            "certificate_authority": "lets_encrypt",
+            "host_platform": "panos",
+            "os_version": "9.1.0",
+            "subject_alternative_name": subject_alternative_name
+        }
+    devices = [
+        device("fw01.example.com", "vpn.example.com", ["a.example.com"]),
+        device("fw02.example.com", "vpn.example.com", ["a.example.com"]),
+        device("fw03.example.com", "fw03.example.com", [])
+    ]
+    with patch("otter.router.src.shared.client.CONF_ROUTE_FILE", str(route_file)):
+        groups = group_rotation_assets(devices)
+    # Template Shared by Every Device Regardless of Common Name
+    assert [[member["system_name"] for member in group] for group in groups] == [
+        ["fw01.example.com", "fw02.example.com", "fw03.example.com"]
+    ]
+    assert group_subject_alternative_names(groups[0]) == ["a.example.com", "fw03.example.com"]
+
+
+def test_encode_rotation_group():
+    def device(system_name):
+        return {
+            "system_name": system_name,
+            "common_name": "vpn.example.com",
+            "certificate_authority": "lets_encrypt",
+            "host_platform": "panos",
+            "os_version": "9.1.0",
+            "subject_alternative_name": [system_name]
+        }
+    group = [device("fw01.example.com"), device("fw02.example.com")]
+    [(first, encoded)] = encode_rotation_group(group)
+    context = acme.DeviceContext.decode(encoded)
+    assert first["system_name"] == "fw01.example.com"
+    assert context.members == ["fw01.example.com", "fw02.example.com"]
+
+    # Oversized Group Context Would Not Fit in the ECS Container Overrides
+    with patch("otter.router.src.shared.client.MAX_DEVICE_CONTEXT_LENGTH", len(encoded) - 1):
+        tasks = encode_rotation_group(group)
+    assert [member["system_name"] for member, _ in tasks] == ["fw01.example.com", "fw02.example.com"]
+    for member, encoded in tasks:
+        context = acme.DeviceContext.decode(encoded)
+        assert context.system_name == member["system_name"]
+        assert context.members is None and context.panorama is None
+
+
+def test_device_context_fields_match():
+    # Router, API and acme are Deployed Separately but Share the Encoding
+    path = os.path.join(os.path.dirname(__file__), "../../api/backend/app/shared/client.py")
+    with open(path, "r") as file:
+        tree = ast.parse(file.read())
+    [api_fields] = [ast.literal_eval(node.value) for node in tree.body
+                    if isinstance(node, ast.Assign)
+                    and [target.id for target in node.targets] == ["DEVICE_CONTEXT_FIELDS"]]
+    assert DEVICE_CONTEXT_FIELDS == api_fields == acme.context.FIELDS